@@ -1,13 +1,19 @@
 import streamlit as st
 import os
+import time
+from concurrent.futures import ThreadPoolExecutor
 from dotenv import load_dotenv
 from loguru import logger
 from core.graph import app_graph, State
 from core.ui import render_sources, privacy_note
 from core.llm.registry import build_llm
 from core.faiss_store import get_index_and_db
-from core.rerank import maybe_rerank
+from core.rerank import maybe_rerank, warm_up as warm_up_reranker
 from core.mcp.adapters import MCPTools
+from core.answer_cache import AnswerCache
+from core.embed import embed_one_openai
+from core.constants import ANSWER_CACHE
+from core import trace
 
 st.set_page_config(page_title="OpenScout — RAG with MCP tool layer", layout="wide")
 
@@ -61,7 +67,7 @@ with st.sidebar:
     provider = st.selectbox("LLM", [
         "OpenAI / gpt-4o-mini","OpenAI / gpt-4o",
         "Anthropic / Claude 3.5","Gemini / 1.5 Pro",
-        "Groq / groq-1.0"])
+        "Groq / Llama 3.1 8B"])
     if provider.startswith("OpenAI"): key("OpenAI API Key","OPENAI_API_KEY","sk-...")
     elif provider.startswith("Anthropic"): key("Anthropic API Key","ANTHROPIC_API_KEY","sk-ant-...")
     elif provider.startswith("Gemini"): key("Google API Key","GOOGLE_API_KEY","AIza...")
@@ -137,7 +143,7 @@ with st.sidebar:
             _run_llm_test("Anthropic / Claude 3.5", "ANTHROPIC_API_KEY", "Anthropic")
     with col_b:
         if st.button("Test Groq key"):
-            _run_llm_test("Groq / groq-1.0", "GROQ_API_KEY", "Groq")
+            _run_llm_test("Groq / Llama 3.1 8B", "GROQ_API_KEY", "Groq")
         if st.button("Test Google/Gemini key"):
             _run_llm_test("Gemini / 1.5 Pro", "GOOGLE_API_KEY", "Google/Gemini")
 cols = st.columns([1, 2, 1])
@@ -151,6 +157,21 @@ with cols[1]:
 
 k = 6
 use_reranker = True
+
+@st.cache_resource
+def _warm_reranker():
+    # once per server process, in the background, so the first question doesn't pay for the model load
+    warm_up_reranker()
+    return True
+
+if use_reranker: _warm_reranker()
+
+use_answer_cache = ANSWER_CACHE
+
+@st.cache_resource
+def get_answer_cache():
+    # one per server process, shared by every session; entries are shared across processes through SQLite
+    return AnswerCache()
 use_mcp = bool(st.session_state["keys"].get("USE_MCP", False) or mcp_checkbox)
 answer_mode = "concise"
 temperature = 0.2
@@ -188,80 +209,120 @@ if query:
     if not st.session_state["messages"] or st.session_state["messages"][-1].get("content") != query or st.session_state["messages"][-1].get("role") != "user":
         st.session_state["messages"].append({"role": "user", "content": query})
 
+    sources_box = st.empty()  # retrieved sources appear here before the answer starts streaming
     with st.spinner("Searching, fetching, indexing, and answering…"):
-        try:
-            llm = build_llm(provider, st.session_state["keys"])
-            index, conn = get_index_and_db()
-            tools = MCPTools(st.session_state["keys"])  # MCP adapters (SDK fallback)
+        with trace.request("query", llm=provider, entry="ui") as query_trace:
+            try:
+                index, conn = get_index_and_db()
+                tools = MCPTools(st.session_state["keys"])  # MCP adapters (SDK fallback)
 
-            # Run graph → returns hits (retrieved chunks) and raw pages indexed
-            result = app_graph.invoke(State(
-                query=query, k=k,
-                use_mcp=use_mcp,
-                tavily_api_key=st.session_state["keys"].get("TAVILY_API_KEY") or os.getenv("TAVILY_API_KEY", ""),
-                openai_api_key=st.session_state["keys"].get("OPENAI_API_KEY") or os.getenv("OPENAI_API_KEY", ""),
-                tools=tools
-            ))
+                openai_key = st.session_state["keys"].get("OPENAI_API_KEY") or os.getenv("OPENAI_API_KEY", "")
+                cache = get_answer_cache() if use_answer_cache else None
+                # Run graph → returns hits (retrieved chunks) and raw pages indexed. It starts right away; the
+                # answer-cache lookup runs alongside it (sharing the query embedding) instead of delaying it.
+                graph_run = ThreadPoolExecutor(max_workers=1)
+                graph_future = graph_run.submit(trace.wrap(app_graph.invoke), State(
+                    query=query, k=k,
+                    use_mcp=use_mcp,
+                    tavily_api_key=st.session_state["keys"].get("TAVILY_API_KEY") or os.getenv("TAVILY_API_KEY", ""),
+                    openai_api_key=openai_key,
+                    tools=tools
+                ))
+                graph_run.shutdown(wait=False)
+                cached = qvec = None
+                if cache is not None:
+                    try:
+                        qvec = embed_one_openai(query, api_key=openai_key)
+                        cached = cache.lookup(qvec, provider, answer_mode, conn)
+                    except Exception:
+                        logger.exception("Answer cache lookup failed")
 
-            if isinstance(result, dict):
-                hits = result.get("hits", []) or []
-                synthesizer_fn = result.get("synthesizer") or State.synthesizer
-            else:
-                hits = getattr(result, "hits", []) or []
-                synthesizer_fn = getattr(result, "synthesizer", State.synthesizer)
+                if cached:
+                    # the graph can't be stopped mid-run, so it finishes in the background: its pages still get
+                    # indexed for later questions, its hits are unused, and spans it records after this request's
+                    # trace is written are dropped from the trace log (the /metrics totals still count them)
+                    hits, answer, citations = cached["hits"], cached["answer"], cached["citations"]
+                    with st.chat_message("assistant"):
+                        st.markdown("**OpenScope bot**")
+                        st.write(answer)
+                        st.caption(f"Answered from cache (similar question: “{cached['query']}”)")
+                else:
+                    llm = build_llm(provider, st.session_state["keys"])
+                    result = graph_future.result()
 
-            if use_reranker:
-                hits = maybe_rerank(query, hits, top_k=k)
+                    if isinstance(result, dict):
+                        hits = result.get("hits", []) or []
+                        synthesizer_fn = result.get("synthesizer") or State.synthesizer
+                    else:
+                        hits = getattr(result, "hits", []) or []
+                        synthesizer_fn = getattr(result, "synthesizer", State.synthesizer)
 
-            # Try streaming the assistant reply if the adapter supports it.
-            from core.synthesize import _messages
-            messages_for_llm = _messages(query, hits, answer_mode)
-            answer = ""
-            try:
-                maybe_stream = llm.chat(messages_for_llm, stream=True, temperature=temperature, max_tokens=max_tokens)
-                # If the response is an iterator/generator, stream token-by-token
-                if hasattr(maybe_stream, "__iter__") and not isinstance(maybe_stream, str):
-                    acc = ""
-                    # Render a live assistant message labeled OpenScope bot
+                    llm.warm()  # connect to the provider while reranking and prompt packing run
+                    with sources_box.container():
+                        st.markdown("### Sources")
+                        render_sources(hits, [])
+                        if use_reranker: st.caption("Reranking…")
+                    if use_reranker:
+                        hits = maybe_rerank(query, hits, top_k=k)
+                        with sources_box.container():
+                            st.markdown("### Sources")
+                            render_sources(hits, [])
+
+                    # Try streaming the assistant reply if the adapter supports it.
+                    from core.synthesize import build_messages
+                    messages_for_llm = build_messages(query, hits, answer_mode, llm, max_tokens)
+                    answer = ""
                     try:
-                        with st.chat_message("assistant"):
-                            st.markdown("**OpenScope bot**")
-                            placeholder = st.empty()
-                            for chunk in maybe_stream:
-                                # some adapters yield dicts or objects; coerce to str
-                                text = chunk if isinstance(chunk, str) else str(chunk)
-                                acc += text
-                                placeholder.write(acc)
-                    except Exception:
-                        # Fallback if chat_message isn't available in this stream context
-                        acc = "".join([str(c) for c in maybe_stream])
-                    answer = acc
-                else:
-                    # Not a stream — get full reply
-                    resp = maybe_stream
-                    answer = ''.join(resp) if hasattr(resp, '__iter__') and not isinstance(resp, str) else str(resp)
-            except Exception as e:
-                # Streaming failed (adapter may not support stream or error); fall back to non-stream synthesizer
-                try:
-                    answer, _ = synthesizer_fn(llm, query, hits, mode=answer_mode, temperature=temperature, max_tokens=max_tokens)
-                except Exception as e2:
-                    raise
+                        t_llm = time.perf_counter()
+                        maybe_stream = llm.chat(messages_for_llm, stream=True, temperature=temperature, max_tokens=max_tokens)
+                        # If the response is an iterator/generator, stream token-by-token
+                        if hasattr(maybe_stream, "__iter__") and not isinstance(maybe_stream, str):
+                            acc = ""
+                            # Render a live assistant message labeled OpenScope bot
+                            try:
+                                with st.chat_message("assistant"):
+                                    st.markdown("**OpenScope bot**")
+                                    placeholder = st.empty()
+                                    for chunk in trace.timed_stream(maybe_stream, t0=t_llm):
+                                        # some adapters yield dicts or objects; coerce to str
+                                        text = chunk if isinstance(chunk, str) else str(chunk)
+                                        acc += text
+                                        placeholder.write(acc)
+                            except Exception:
+                                # Fallback if chat_message isn't available in this stream context
+                                acc = "".join([str(c) for c in maybe_stream])
+                            answer = acc
+                        else:
+                            # Not a stream — get full reply
+                            resp = maybe_stream
+                            answer = ''.join(resp) if hasattr(resp, '__iter__') and not isinstance(resp, str) else str(resp)
+                            trace.observe("llm.total", time.perf_counter() - t_llm, t_llm)
+                    except Exception as e:
+                        # Streaming failed (adapter may not support stream or error); fall back to non-stream synthesizer
+                        try:
+                            answer, _ = synthesizer_fn(llm, query, hits, mode=answer_mode, temperature=temperature, max_tokens=max_tokens)
+                        except Exception as e2:
+                            raise
 
-            # compute citations similar to synthesize_with_llm
-            citations = [{"id": i} for i, _ in enumerate(hits, start=1) if f"[#{i}]" in answer]
+                    # compute citations similar to synthesize_with_llm
+                    citations = [{"id": i} for i, _ in enumerate(hits, start=1) if f"[#{i}]" in answer]
 
-            # Append assistant reply to chat history so it appears in the UI
-            st.session_state["messages"].append({"role": "assistant", "content": answer})
-        except Exception as e:
-            # Show a friendly error message with optional dev details in an expander
-            st.error("An error occurred while searching or fetching sources.")
-            with st.expander("Details (click to expand)"):
-                st.write(str(e))
-            # Log the exception for debugging
-            logger.exception("Error running graph pipeline")
-            # Stop further processing
-            st.stop()
+                    if cache is not None and qvec is not None:
+                        cache.put(qvec, provider, answer_mode, query, hits, answer, citations)
+
+                # Append assistant reply to chat history so it appears in the UI
+                st.session_state["messages"].append({"role": "assistant", "content": answer})
+            except Exception as e:
+                # Show a friendly error message with optional dev details in an expander
+                st.error("An error occurred while searching or fetching sources.")
+                with st.expander("Details (click to expand)"):
+                    st.write(str(e))
+                # Log the exception for debugging
+                logger.exception("Error running graph pipeline")
+                # Stop further processing
+                st.stop()
 
+    sources_box.empty()
     # Layout: answer on left (main), compact sources on right
     left, right = st.columns([3, 1])
     with left:
@@ -281,3 +342,7 @@ if query:
     with right:
         st.markdown("### Sources")
         render_sources(hits, citations)
+    if query_trace is not None:
+        with st.expander("Timings"):
+            # per-stage wall time (start offset, seconds) and counters for this question
+            st.json(query_trace.to_dict())
@@ -0,0 +1 @@
+# offline benchmarks; run modules with python -m benchmarks.<name>
@@ -0,0 +1,105 @@
+"""Chunker throughput on large documents, plus a randomized check that no chunk exceeds its token budget.
+
+    python -m benchmarks.bench_chunk --mb 1 5 --check 300
+
+"legacy" is the previous chunker (whitespace word counts, list rebuilding for the overlap). "tokens" is
+`core.chunk.iter_chunks`, consumed as a generator; peak memory is traced with tracemalloc. The check draws
+random documents (headings, paragraphs, very long sentences and words, non-ASCII) with random budgets and
+fails with exit status 1 if any chunk encodes to more tokens than its budget.
+"""
+import argparse, json, random, re, sys, time, tracemalloc
+from core.chunk import iter_chunks, _encoding
+
+WORDS = ("the of and to in is that for it as index vector query page fetch cache latency passage "
+         "Xylophone naïve 東京 don't 1,234 e.g. (see above) state-of-the-art").split()
+
+
+def legacy_chunk_text(text, target_tokens=1000, overlap=150):
+    sents = re.split(r'(?<=[.!?])\s+', text.strip())
+    chunks, cur, count = [], [], 0
+    for s in sents:
+        tok = max(1, len(s.split()))
+        if count + tok > target_tokens and cur:
+            chunks.append(" ".join(cur))
+            back, bt = [], 0
+            for t in reversed(cur):
+                tt = max(1, len(t.split()))
+                if bt + tt > overlap: break
+                bt += tt; back.insert(0, t)
+            cur, count = back[:], sum(len(x.split()) for x in back)
+        cur.append(s); count += tok
+    if cur: chunks.append(" ".join(cur))
+    return chunks
+
+
+def random_document(rng: random.Random, paragraphs: int) -> str:
+    out = []
+    for _ in range(paragraphs):
+        r = rng.random()
+        if r < 0.1: out.append(" ".join(rng.choices(WORDS, k=rng.randint(1, 6))).title())
+        elif r < 0.12: out.append("z" * rng.randint(100, 20000) + " " + " ".join(rng.choices(WORDS, k=rng.randint(500, 3000))))
+        else: out.append(" ".join(" ".join(rng.choices(WORDS, k=rng.randint(3, 40))) + rng.choice(".!?")
+                                  for _ in range(rng.randint(1, 12))))
+    return "\n".join(out)
+
+
+def document_of_size(mb: float, seed: int = 0) -> str:
+    rng, parts, size = random.Random(seed), [], 0
+    while size < mb * 2**20:
+        parts.append(random_document(rng, 50)); size += len(parts[-1])
+    return "\n".join(parts)
+
+
+def bench(text: str, name: str, fn) -> dict:
+    tracemalloc.start()
+    t0 = time.perf_counter()
+    n = sum(1 for _ in fn(text))
+    dt = time.perf_counter() - t0
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    return dict(chunker=name, mb=round(len(text) / 2**20, 2), chunks=n, seconds=round(dt, 3),
+                mb_per_s=round(len(text) / 2**20 / dt, 2), peak_mb=round(peak / 2**20, 1))
+
+
+def check_budget(trials: int, seed: int = 0) -> dict:
+    enc, rng = _encoding(), random.Random(seed)
+    worst, chunks, failures = 0.0, 0, []
+    for _ in range(trials):
+        target, overlap = rng.choice([16, 50, 200, 1000]), rng.choice([0, 10, 50, 150])
+        blocks = rng.random() < 0.5
+        for c in iter_chunks(random_document(rng, rng.randint(1, 40)), target, overlap, blocks):
+            n = len(enc.encode_ordinary(c)); chunks += 1
+            worst = max(worst, n / target)
+            if n > target: failures.append(dict(target=target, tokens=n, blocks=blocks, head=c[:60]))
+    return dict(trials=trials, chunks=chunks, max_fill=round(worst, 3), failures=failures[:5], ok=not failures)
+
+
+def main(argv=None):
+    p = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    p.add_argument("--mb", type=float, nargs="+", default=[1, 5])
+    p.add_argument("--check", type=int, default=300, help="random documents for the budget check (0 skips)")
+    p.add_argument("--json", action="store_true")
+    args = p.parse_args(argv)
+    _encoding()  # load the tokenizer outside the timings
+    rows = []
+    for mb in args.mb:
+        text = document_of_size(mb)
+        rows.append(bench(text, "legacy", legacy_chunk_text))
+        rows.append(bench(text, "tokens", iter_chunks))
+        rows.append(bench(text, "tokens+blocks=0", lambda t: iter_chunks(t, respect_blocks=False)))
+    check = check_budget(args.check) if args.check else None
+    if args.json:
+        print(json.dumps(dict(rows=rows, check=check), indent=2))
+    else:
+        print(f"{'chunker':<17}{'MB':>6}{'chunks':>8}{'seconds':>9}{'MB/s':>8}{'peak MB':>9}")
+        for r in rows:
+            print(f"{r['chunker']:<17}{r['mb']:>6}{r['chunks']:>8}{r['seconds']:>9.2f}{r['mb_per_s']:>8.2f}{r['peak_mb']:>9.1f}")
+        if check:
+            print(f"budget check: {check['chunks']} chunks from {check['trials']} documents, "
+                  f"fullest chunk at {check['max_fill']:.0%} of budget: {'ok' if check['ok'] else 'FAILED'}")
+            for f in check["failures"]: print("  over budget:", f)
+    if check and not check["ok"]: sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,73 @@
+"""HTML extraction throughput (pages/second) by process-pool size.
+
+    python -m benchmarks.bench_extract --corpus saved_pages/ --workers 0 1 2 4
+
+`--corpus` is a directory of saved .html files; without it a synthetic corpus is generated. Worker count 0
+is the old in-loop path (extract_metadata + extract, two parses per page, one core); the other rows run the
+single-parse `core.fetch._extract` through a spawned ProcessPoolExecutor, as the fetcher does.
+"""
+import argparse, glob, json, multiprocessing as mp, os, random, time
+from concurrent.futures import ProcessPoolExecutor
+import trafilatura
+from core.fetch import _extract
+
+
+def _legacy(url, html):
+    meta = trafilatura.extract_metadata(html)
+    text = trafilatura.extract(html, include_comments=False, include_tables=False) or ""
+    return {"url": url, "title": (meta.title if meta else None) or url, "text": text}
+
+
+def synthetic_corpus(n: int, seed: int = 0):
+    rng = random.Random(seed)
+    words = "index vector query page fetch cache latency model passage source answer token".split()
+    pages = []
+    for i in range(n):
+        paras = "".join(f"<p>{' '.join(rng.choices(words, k=rng.randint(20, 80)))}.</p>" for _ in range(rng.randint(20, 60)))
+        nav = "".join(f"<li><a href='/l{j}'>link {j}</a></li>" for j in range(40))
+        pages.append((f"https://example.com/p{i}", f"<html><head><title>Page {i}</title></head><body><nav><ul>{nav}</ul></nav>"
+                      f"<article><h1>Page {i}</h1>{paras}</article><footer>footer</footer></body></html>"))
+    return pages
+
+
+def load_corpus(path: str):
+    out = []
+    for f in sorted(glob.glob(os.path.join(path, "**", "*.htm*"), recursive=True)):
+        with open(f, encoding="utf-8", errors="replace") as fh:
+            out.append((f"file://{os.path.abspath(f)}", fh.read()))
+    return out
+
+
+def run(pages, workers: int) -> dict:
+    urls, htmls = zip(*pages)
+    if workers == 0:
+        t0 = time.perf_counter()
+        for u, h in pages: _legacy(u, h)
+        dt = time.perf_counter() - t0
+    else:
+        with ProcessPoolExecutor(max_workers=workers, mp_context=mp.get_context("spawn")) as pool:
+            list(pool.map(_extract, urls[:workers], htmls[:workers]))  # start the workers outside the timing
+            t0 = time.perf_counter()
+            list(pool.map(_extract, urls, htmls, chunksize=max(1, len(pages) // (workers * 8))))
+            dt = time.perf_counter() - t0
+    return dict(workers=workers, mode="in-loop x2 parse" if workers == 0 else "pool x1 parse",
+                pages=len(pages), seconds=round(dt, 3), pages_per_s=round(len(pages) / dt, 1))
+
+
+def main(argv=None):
+    p = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    p.add_argument("--corpus", help="directory of saved .html pages")
+    p.add_argument("--pages", type=int, default=200, help="synthetic pages when --corpus is not given")
+    p.add_argument("--workers", type=int, nargs="+", default=[0, 1, 2, 4])
+    p.add_argument("--json", action="store_true")
+    args = p.parse_args(argv)
+    pages = load_corpus(args.corpus) if args.corpus else synthetic_corpus(args.pages)
+    rows = [run(pages, w) for w in args.workers]
+    if args.json: print(json.dumps(dict(cpus=os.cpu_count(), rows=rows), indent=2)); return
+    print(f"{len(pages)} pages, {os.cpu_count()} CPUs")
+    print(f"{'workers':>8}{'mode':>20}{'seconds':>10}{'pages/s':>10}")
+    for r in rows: print(f"{r['workers']:>8}{r['mode']:>20}{r['seconds']:>10.2f}{r['pages_per_s']:>10.1f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,75 @@
+"""Queries per second through the retrieval graph for N concurrent queries, threads + invoke vs one loop + ainvoke.
+
+    python -m benchmarks.bench_graph_concurrency --concurrency 1 4 16 --queries 32
+
+Everything remote is stubbed locally: a threaded HTTP server serves the pages (with --page-delay), search
+returns --pages URLs on it after --search-delay, and embeddings sleep --embed-delay per call and return
+deterministic per-text vectors (benchmarks/stubs.py). Each query is distinct, so no cache short-circuits the
+pipeline. Runs in a temp directory.
+"""
+import argparse, asyncio, json, os, statistics, tempfile, time
+from concurrent.futures import ThreadPoolExecutor
+from .stubs import start_page_server, install_stubs
+
+os.environ.setdefault("OPENSCOUT_FETCH_PER_HOST", "64")  # every stub page is on one host
+
+
+def run_threads(graph, queries, n):
+    lat = []
+    def one(q):
+        t0 = time.perf_counter()
+        r = graph.app_graph.invoke(graph.State(query=q, openai_api_key="stub"))
+        lat.append(time.perf_counter() - t0)
+        return len(r["hits"])
+    t0 = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=n) as pool: hits = list(pool.map(one, queries))
+    return time.perf_counter() - t0, lat, hits
+
+
+def run_async(graph, queries, n):
+    lat = []
+    async def main():
+        sem = asyncio.Semaphore(n)
+        async def one(q):
+            async with sem:
+                t0 = time.perf_counter()
+                r = await graph.app_graph.ainvoke(graph.State(query=q, openai_api_key="stub"))
+                lat.append(time.perf_counter() - t0)
+                return len(r["hits"])
+        return await asyncio.gather(*[one(q) for q in queries])
+    t0 = time.perf_counter()
+    hits = asyncio.run(main())
+    return time.perf_counter() - t0, lat, hits
+
+
+def main(argv=None):
+    p = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    p.add_argument("--concurrency", type=int, nargs="+", default=[1, 4, 16])
+    p.add_argument("--queries", type=int, default=32)
+    p.add_argument("--pages", type=int, default=6)
+    p.add_argument("--page-delay", type=float, default=0.2)
+    p.add_argument("--search-delay", type=float, default=0.3)
+    p.add_argument("--embed-delay", type=float, default=0.15)
+    p.add_argument("--json", action="store_true")
+    args = p.parse_args(argv)
+    from core import embed, graph
+    srv = start_page_server(args.page_delay)
+    os.chdir(tempfile.mkdtemp(prefix="openscout-bench-"))
+    install_stubs(graph, embed, srv.server_address[1], args.pages, args.search_delay, args.embed_delay)
+    graph.app_graph.invoke(graph.State(query="warm up", openai_api_key="stub"))  # index files, process pool
+    rows = []
+    for n in args.concurrency:
+        for mode, fn in (("threads+invoke", run_threads), ("asyncio+ainvoke", run_async)):
+            queries = [f"{mode} n{n} q{i}" for i in range(args.queries)]
+            dt, lat, hits = fn(graph, queries, n)
+            rows.append(dict(mode=mode, concurrency=n, queries=len(queries), seconds=round(dt, 2),
+                             qps=round(len(queries) / dt, 2), p50_s=round(statistics.median(lat), 3),
+                             max_s=round(max(lat), 3), empty=sum(1 for h in hits if not h)))
+    if args.json: print(json.dumps(rows, indent=2)); return
+    print(f"{'mode':<17}{'N':>4}{'qps':>8}{'p50 s':>8}{'max s':>8}{'empty':>7}")
+    for r in rows:
+        print(f"{r['mode']:<17}{r['concurrency']:>4}{r['qps']:>8.2f}{r['p50_s']:>8.3f}{r['max_s']:>8.3f}{r['empty']:>7}")
+
+
+if __name__ == "__main__":
+    main()
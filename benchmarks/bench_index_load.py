@@ -0,0 +1,77 @@
+"""Startup time and memory per worker when N processes open the same index, heap-loaded vs memory-mapped.
+
+    python -m benchmarks.bench_index_load --vectors 100000 --workers 1 4 8
+
+Builds a synthetic flat index in a temp directory. PSS splits shared pages between the processes mapping
+them, so it is the fair per-worker number; RSS counts shared pages in full for every worker.
+"""
+import argparse, json, multiprocessing as mp, os, tempfile, time
+import numpy as np
+
+
+def _mem_kb():
+    out = {}
+    try:
+        with open("/proc/self/smaps_rollup") as f:
+            for line in f:
+                parts = line.split()
+                if len(parts) >= 2 and parts[1].isdigit(): out[parts[0].rstrip(":")] = int(parts[1])
+    except FileNotFoundError:  # not Linux
+        pass
+    return out
+
+
+def _worker(path, mmap, ready, go, results):
+    from core.faiss_store import VectorIndex
+    t0 = time.perf_counter()
+    vi = VectorIndex.open(path, mmap=mmap)
+    vi.search(np.ones((1, vi.d), dtype=np.float32), 10)  # touch the vectors like a first query would
+    load = time.perf_counter() - t0
+    ready.wait(); go.wait()  # measure while every worker is alive, so shared pages are split between them
+    m = _mem_kb()
+    results.put(dict(load_s=load, rss_mb=m.get("Rss", 0) / 1024, pss_mb=m.get("Pss", 0) / 1024,
+                     anon_mb=m.get("Anonymous", 0) / 1024))
+    ready.wait()
+
+
+def run(path, mmap, workers):
+    ctx = mp.get_context("spawn")
+    ready, go, results = ctx.Barrier(workers + 1), ctx.Barrier(workers + 1), ctx.Queue()
+    procs = [ctx.Process(target=_worker, args=(path, mmap, ready, go, results)) for _ in range(workers)]
+    for p in procs: p.start()
+    ready.wait(); go.wait()
+    rows = [results.get() for _ in procs]
+    ready.wait()
+    for p in procs: p.join()
+    return {k: float(np.mean([r[k] for r in rows])) for k in rows[0]}
+
+
+def main(argv=None):
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--vectors", type=int, default=100_000)
+    ap.add_argument("--dim", type=int, default=1536)
+    ap.add_argument("--workers", type=int, nargs="+", default=[1, 4, 8])
+    ap.add_argument("--json", help="write results to this file")
+    args = ap.parse_args(argv)
+    from core.faiss_store import build_index, write_index_atomic
+    with tempfile.TemporaryDirectory() as d:
+        path = os.path.join(d, "faiss_index.bin")
+        rng = np.random.default_rng(0)
+        X = rng.random((args.vectors, args.dim), dtype=np.float32)
+        write_index_atomic(build_index("flat", X, np.arange(args.vectors), d=args.dim), path)
+        del X
+        size_mb = os.path.getsize(path) / 2**20
+        print(f"index: {args.vectors} x {args.dim} flat, {size_mb:.0f} MB on disk")
+        print(f"{'mode':<6}{'workers':>8}{'load s':>9}{'RSS MB':>9}{'PSS MB':>9}{'anon MB':>9}")
+        out = []
+        for mmap in (False, True):
+            for n in args.workers:
+                r = dict(mode="mmap" if mmap else "heap", workers=n, **run(path, mmap, n))
+                out.append(r)
+                print(f"{r['mode']:<6}{n:>8}{r['load_s']:>9.3f}{r['rss_mb']:>9.0f}{r['pss_mb']:>9.0f}{r['anon_mb']:>9.0f}")
+    if args.json:
+        with open(args.json, "w") as f: json.dump(dict(vectors=args.vectors, dim=args.dim, results=out), f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,102 @@
+"""Chunk store insert and lookup throughput under concurrent sessions: legacy layout vs ChunkDB.
+
+    python -m benchmarks.bench_sqlite --threads 1 4 8 --batches 50 --batch-size 40
+
+"legacy" reproduces the previous storage code: one connection shared by all threads (default rollback
+journal), MAX(id) per insert batch, a Python loop of single-row INSERTs, no url/domain indexes. A lock
+around it stands in for the serialisation that shared connection needs to avoid interleaved transactions.
+"""
+import argparse, json, os, random, sqlite3, tempfile, threading, time
+from core.chunk_db import ChunkDB, text_hash
+
+
+class Legacy:
+    def __init__(self, path):
+        self.conn = sqlite3.connect(path, check_same_thread=False)
+        self.conn.execute("""CREATE TABLE IF NOT EXISTS chunks(
+            id INTEGER PRIMARY KEY, url TEXT, title TEXT, ord INT,
+            text TEXT, domain TEXT, embedding_dim INT, created_at TEXT, text_hash TEXT)""")
+        self.lock = threading.Lock()
+
+    def insert(self, rows):
+        with self.lock:
+            r = self.conn.execute("SELECT MAX(id) FROM chunks").fetchone()
+            start = r[0] + 1 if r[0] is not None else 0
+            with self.conn:
+                for i, (url, ord_, text, dom) in enumerate(rows):
+                    self.conn.execute("""INSERT INTO chunks(id,url,title,ord,text,domain,embedding_dim,created_at,text_hash)
+                                         VALUES(?,?,?,?,?,?,?,datetime('now'),?)""",
+                                      (start + i, url, url, ord_, text, dom, 1536, text_hash(text)))
+
+    def lookup(self, ids, url):
+        with self.lock:
+            q = ",".join("?" * len(ids))
+            self.conn.execute(f"SELECT id,url,title,ord,text,domain FROM chunks WHERE id IN ({q})", ids).fetchall()
+            self.conn.execute("SELECT id FROM chunks WHERE url=?", (url,)).fetchall()
+
+
+class Pooled:
+    def __init__(self, path):
+        self.db = ChunkDB(path)
+
+    def insert(self, rows):
+        ids = self.db.allocate_ids(len(rows))
+        with self.db.write_lock, self.db:  # as add_vectors does
+            self.db.executemany("""INSERT INTO chunks(id,url,title,ord,text,domain,embedding_dim,created_at,text_hash)
+                                   VALUES(?,?,?,?,?,?,?,datetime('now'),?) ON CONFLICT(url, ord, text_hash) DO NOTHING""",
+                                [(i, url, url, o, t, d, 1536, text_hash(t)) for i, (url, o, t, d) in zip(ids, rows)])
+
+    def lookup(self, ids, url):
+        q = ",".join("?" * len(ids))
+        self.db.execute(f"SELECT id,url,title,ord,text,domain FROM chunks WHERE id IN ({q})", ids).fetchall()
+        self.db.execute("SELECT id FROM chunks WHERE url=?", (url,)).fetchall()
+
+
+def _rows(rng, tid, b, n):
+    url = f"https://site{rng.randrange(50)}.example/{tid}/{b}"
+    text = " ".join(rng.choice(("alpha", "beta", "gamma", "delta", "epsilon")) for _ in range(700))
+    return [(url, o, f"{tid}-{b}-{o} {text}", url.split("/")[2]) for o in range(n)]
+
+
+def run(store_cls, threads, batches, batch_size, lookups):
+    with tempfile.TemporaryDirectory() as d:
+        store = store_cls(os.path.join(d, "chunks.sqlite"))
+        corpus = [[_rows(random.Random(t * 1000 + b), t, b, batch_size) for b in range(batches)] for t in range(threads)]
+        def insert_worker(t):
+            for rows in corpus[t]: store.insert(rows)
+        def lookup_worker(t):
+            rng = random.Random(t)
+            total = threads * batches * batch_size
+            for _ in range(lookups):
+                store.lookup(rng.sample(range(total), 24), f"https://site{rng.randrange(50)}.example/{t}/0")
+        out = {}
+        for name, fn, ops in (("insert", insert_worker, batches * batch_size), ("lookup", lookup_worker, lookups)):
+            ts = [threading.Thread(target=fn, args=(t,)) for t in range(threads)]
+            t0 = time.perf_counter()
+            for t in ts: t.start()
+            for t in ts: t.join()
+            out[f"{name}_per_s"] = threads * ops / (time.perf_counter() - t0)
+        return out
+
+
+def main(argv=None):
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--threads", type=int, nargs="+", default=[1, 4, 8])
+    ap.add_argument("--batches", type=int, default=50)
+    ap.add_argument("--batch-size", type=int, default=40)
+    ap.add_argument("--lookups", type=int, default=500)
+    ap.add_argument("--json", help="write results to this file")
+    args = ap.parse_args(argv)
+    print(f"{'store':<8}{'threads':>8}{'rows/s':>12}{'lookups/s':>12}")
+    results = []
+    for name, cls in (("legacy", Legacy), ("chunkdb", Pooled)):
+        for n in args.threads:
+            r = dict(store=name, threads=n, **run(cls, n, args.batches, args.batch_size, args.lookups))
+            results.append(r)
+            print(f"{name:<8}{n:>8}{r['insert_per_s']:>12.0f}{r['lookup_per_s']:>12.0f}")
+    if args.json:
+        with open(args.json, "w") as f: json.dump(results, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,85 @@
+"""Time to first token and to visible sources for the UI's answer path, before vs after connection warm-up,
+progressive sources and prompt caching.
+
+    python -m benchmarks.bench_ttft --queries 8 --handshake 0.15 --rerank-delay 0.3
+
+The LLM is a local fake OpenAI endpoint (benchmarks/stubs.py) with a simulated handshake per new connection
+and a prefill cost per uncached prompt token; retrieval and reranking are sleeps of the given length. Between
+questions the pooled connection is dropped, as it is after a pause longer than httpx's keep-alive expiry.
+The shared prefix (system prompt + settings) is well under OpenAI's 1024-token caching minimum, so expect no
+cached tokens at the default --min-cache-tokens; lower it to exercise the cached path.
+
+    before  sources render with the answer; no warm-up; no prompt_cache_key
+    after   sources render when retrieval returns; llm.warm() runs during rerank; prompt caching on
+"""
+import argparse, json, os, statistics, time
+from .stubs import PAGE, start_llm_server
+
+
+def cold_pool(clients):
+    """Forget the pooled OpenAI client and its connections."""
+    c = clients._http.pop("openai", None)
+    if c is not None: c.close()
+    for key in [k for k in clients._sdk if k[0] == "openai"]: del clients._sdk[key]
+
+
+def hits_for(q: str, n: int = 8):
+    text = PAGE.replace("{n}", q).split("<article>")[1].replace("</p><p>", " ").replace("<p>", "").split("</p>")[0]
+    return [{"title": f"{q} source {i}", "url": f"https://example.com/{i}", "text": text[i * 600:(i + 3) * 600],
+             "score": 1.0 - i / n} for i in range(n)]
+
+
+def one(args, srv, q, after):
+    from core import clients
+    from core.llm import openai_llm
+    from core.synthesize import build_messages
+    openai_llm.PROMPT_CACHE = after
+    cold_pool(clients)
+    cached0 = srv.stats["cached_tokens"]
+    t0 = time.perf_counter()
+    llm = openai_llm.OpenAILLM("stub", args.model)
+    time.sleep(args.retrieval_delay)
+    hits = hits_for(q)
+    sources = time.perf_counter() - t0
+    if after: llm.warm()
+    time.sleep(args.rerank_delay)
+    first = None
+    for _ in llm.chat(build_messages(q, hits, "concise", llm, 512), stream=True, max_tokens=512):
+        if first is None: first = time.perf_counter() - t0
+    total = time.perf_counter() - t0
+    return dict(sources_s=sources if after else total, ttft_s=first, total_s=total,
+                cached_tokens=srv.stats["cached_tokens"] - cached0)
+
+
+def main(argv=None):
+    p = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    p.add_argument("--queries", type=int, default=8)
+    p.add_argument("--model", default="gpt-4o-mini")
+    p.add_argument("--handshake", type=float, default=0.15, help="seconds per new connection (TCP + TLS)")
+    p.add_argument("--prefill-ms", type=float, default=150.0, help="ms per 1k uncached prompt tokens")
+    p.add_argument("--first-token", type=float, default=0.2)
+    p.add_argument("--retrieval-delay", type=float, default=1.0)
+    p.add_argument("--rerank-delay", type=float, default=0.3)
+    p.add_argument("--min-cache-tokens", type=int, default=1024, help="provider minimum for a cacheable prefix")
+    p.add_argument("--json", action="store_true")
+    args = p.parse_args(argv)
+    srv = start_llm_server(args.handshake, args.prefill_ms, args.first_token,
+                           min_cache_tokens=args.min_cache_tokens)
+    os.environ["OPENAI_BASE_URL"] = f"http://127.0.0.1:{srv.server_address[1]}/v1"
+    rows = []
+    for mode in ("before", "after"):
+        runs = [one(args, srv, f"question {i}", mode == "after") for i in range(args.queries)]
+        rows.append(dict(mode=mode, queries=len(runs),
+                         **{f"p50_{m}": round(statistics.median(r[m] for r in runs), 3)
+                            for m in ("sources_s", "ttft_s", "total_s")},
+                         cached_tokens=sum(r["cached_tokens"] for r in runs)))
+    rows.append(dict(mode="server", **srv.stats))
+    if args.json: print(json.dumps(rows, indent=2)); return
+    print(f"{'mode':<8}{'sources s':>11}{'ttft s':>9}{'total s':>9}{'cached tok':>12}")
+    for r in rows[:2]:
+        print(f"{r['mode']:<8}{r['p50_sources_s']:>11.3f}{r['p50_ttft_s']:>9.3f}{r['p50_total_s']:>9.3f}{r['cached_tokens']:>12}")
+    print("server:", rows[2])
+
+
+if __name__ == "__main__":
+    main()
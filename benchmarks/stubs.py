@@ -0,0 +1,134 @@
+"""Offline stand-ins shared by the benchmarks: deterministic embeddings, a local page server, stub search and a
+fake OpenAI-compatible chat server.
+
+Vectors are seeded from each text's hash, so the same text always gets the same vector across runs and
+processes, and different texts get (almost) orthogonal ones, like real embeddings of unrelated passages.
+"""
+import hashlib, http.server, json, os, socketserver, threading, time
+import numpy as np
+
+FIXTURES = os.path.join(os.path.dirname(os.path.abspath(__file__)), "fixtures")
+
+PAGE = ("<html><head><title>Page {n}</title></head><body><article>"
+        + "".join(f"<p>Passage {{n}} sentence {i} about retrieval latency and caching. Fact {i} follows here.</p>"
+                  for i in range(120)) + "</article></body></html>")
+
+
+def stub_vector(text: str, dim: int = 1536) -> np.ndarray:
+    seed = int.from_bytes(hashlib.sha256(text.encode("utf-8")).digest()[:8], "little")
+    v = np.random.default_rng(seed).standard_normal(dim).astype(np.float32)
+    return v / np.linalg.norm(v)
+
+
+def stub_embedder(delay: float = 0.0, dim: int = 1536):
+    """A drop-in for core.embed._embed_remote that sleeps `delay` per call (one API round trip)."""
+    def remote(texts, api_key=None, model=None):
+        if delay: time.sleep(delay)
+        return np.vstack([stub_vector(t, dim) for t in texts]) if texts else np.zeros((0, dim), dtype=np.float32)
+    return remote
+
+
+def fixture_pages():
+    """(url, html) for every saved page in benchmarks/fixtures."""
+    out = []
+    for name in sorted(os.listdir(FIXTURES)):
+        if name.endswith(".html"):
+            with open(os.path.join(FIXTURES, name), encoding="utf-8") as f:
+                out.append((f"https://fixtures.example/{name}", f.read()))
+    return out
+
+
+def start_page_server(delay: float = 0.0, pages: dict | None = None):
+    """Threaded HTTP server on a free local port. Serves `pages[path]` when given, else PAGE for any path."""
+    class H(http.server.BaseHTTPRequestHandler):
+        protocol_version = "HTTP/1.1"
+        def do_GET(self):
+            time.sleep(delay)
+            path = self.path.strip("/")
+            b = (pages[path] if pages and path in pages else PAGE.replace("{n}", path)).encode()
+            self.send_response(200)
+            self.send_header("Content-Type", "text/html; charset=utf-8")
+            self.send_header("Content-Length", str(len(b)))
+            self.end_headers()
+            self.wfile.write(b)
+        def log_message(self, *a): pass
+    class S(socketserver.ThreadingMixIn, http.server.HTTPServer): daemon_threads = True
+    srv = S(("127.0.0.1", 0), H)
+    threading.Thread(target=srv.serve_forever, daemon=True).start()
+    return srv
+
+
+def start_llm_server(handshake: float = 0.0, prefill_ms_per_1k: float = 0.0, first_token: float = 0.05,
+                     tokens: int = 40, token_delay: float = 0.01, min_cache_tokens: int = 1024):
+    """Fake OpenAI chat completions on a free local port, streamed as SSE.
+
+    Each new connection sleeps `handshake` (the TCP + TLS round trips of a real endpoint). Each request sleeps
+    `first_token` plus `prefill_ms_per_1k` per thousand uncached prompt tokens (~4 characters each). Caching
+    works like OpenAI's: the longest prefix shared with an earlier prompt under the same prompt_cache_key counts
+    as cached, in 128-token steps, once it reaches `min_cache_tokens`. `srv.stats` counts connections and
+    requests."""
+    seen: dict = {}
+    stats = {"connections": 0, "requests": 0, "cached_tokens": 0}
+    lock = threading.Lock()
+
+    def cached_tokens(key, prompt):
+        with lock:
+            best = max((len(os.path.commonprefix([p, prompt])) for p in seen.get(key, [])), default=0)
+            seen.setdefault(key, []).append(prompt); del seen[key][:-64]
+        best = best // 4 // 128 * 128
+        return best if best >= min_cache_tokens else 0
+
+    class H(http.server.BaseHTTPRequestHandler):
+        protocol_version = "HTTP/1.1"
+        def setup(self):
+            super().setup()
+            with lock: stats["connections"] += 1
+            time.sleep(handshake)
+        def do_HEAD(self):
+            self.send_response(200); self.send_header("Content-Length", "0"); self.end_headers()
+        def _chunk(self, obj):
+            b = f"data: {json.dumps(obj) if not isinstance(obj, str) else obj}\n\n".encode()
+            self.wfile.write(f"{len(b):x}\r\n".encode() + b + b"\r\n"); self.wfile.flush()
+        def do_POST(self):
+            body = json.loads(self.rfile.read(int(self.headers.get("Content-Length", 0))) or b"{}")
+            prompt = "".join(m.get("content") or "" for m in body.get("messages", []))
+            n_prompt = len(prompt) // 4
+            cached = cached_tokens(body.get("prompt_cache_key"), prompt)
+            with lock: stats["requests"] += 1; stats["cached_tokens"] += cached
+            time.sleep(first_token + prefill_ms_per_1k / 1000 * (n_prompt - cached) / 1000)
+            usage = {"prompt_tokens": n_prompt, "completion_tokens": tokens, "total_tokens": n_prompt + tokens,
+                     "prompt_tokens_details": {"cached_tokens": cached}}
+            base = {"id": "fake", "created": 0, "model": body.get("model", "fake")}
+            words = [f"word{i} " for i in range(tokens - 1)] + ["[#1]"]
+            if not body.get("stream"):
+                b = json.dumps({**base, "object": "chat.completion", "usage": usage, "choices": [
+                    {"index": 0, "finish_reason": "stop", "message": {"role": "assistant", "content": "".join(words)}}]}).encode()
+                self.send_response(200); self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(b))); self.end_headers(); self.wfile.write(b)
+                return
+            self.send_response(200)
+            self.send_header("Content-Type", "text/event-stream"); self.send_header("Transfer-Encoding", "chunked")
+            self.end_headers()
+            for i, w in enumerate(words):
+                if i: time.sleep(token_delay)
+                self._chunk({**base, "object": "chat.completion.chunk",
+                             "choices": [{"index": 0, "delta": {"content": w}, "finish_reason": None}]})
+            if (body.get("stream_options") or {}).get("include_usage"):
+                self._chunk({**base, "object": "chat.completion.chunk", "choices": [], "usage": usage})
+            self._chunk("[DONE]")
+            self.wfile.write(b"0\r\n\r\n"); self.wfile.flush()
+        def log_message(self, *a): pass
+    class S(socketserver.ThreadingMixIn, http.server.HTTPServer): daemon_threads = True
+    srv = S(("127.0.0.1", 0), H)
+    srv.stats = stats
+    threading.Thread(target=srv.serve_forever, daemon=True).start()
+    return srv
+
+
+def install_stubs(graph, embed, port: int, pages: int, search_delay: float = 0.0, embed_delay: float = 0.0):
+    """Point the graph's search at `pages` URLs per query on the local server and embeddings at the stub."""
+    def search(q, key, k=8):
+        if search_delay: time.sleep(search_delay)
+        return [{"url": f"http://127.0.0.1:{port}/{q.replace(' ', '_')}-{i}", "title": q} for i in range(pages)]
+    graph.tavily_search = search
+    embed._embed_remote = stub_embedder(embed_delay)
@@ -0,0 +1,259 @@
+"""Offline benchmark suite for the retrieval pipeline, with JSON results and regression checks.
+
+    python -m benchmarks.suite --out bench.json
+    python -m benchmarks.suite --sizes 10000 100000 1000000 --index flat hnsw --out new.json --compare bench.json
+
+Sections (pick with --only):
+    chunk    core.chunk.iter_chunks throughput (MB/s) on a synthetic document
+    extract  core.fetch._extract pages/s over the saved pages in benchmarks/fixtures
+    store    per corpus size and index type: VectorIndex.open time, add_vectors inserts/s, search p50/p99 and
+             fetch_by_ids p50/p99 over a synthetic clustered corpus of `--dim`-dimensional vectors
+    rerank   maybe_rerank p50/p99 for 24 passages (needs the cross-encoder in the local model cache)
+    graph    app_graph.invoke p50/p99 against a local page server, stub search and stub embeddings
+
+Nothing touches the network: embeddings come from benchmarks/stubs.py (deterministic per text) and the store
+section writes rows and vectors directly. A store corpus needs about size × dim × 4 bytes of memory, so use
+--dim 256 for the 10M-vector runs. Tokenizing needs tiktoken's cl100k_base file in its local cache.
+
+--compare loads an earlier result file and flags every metric that got worse by more than --tolerance (a
+fraction); the exit status is 1 if anything regressed. A section that fails records its error and the rest
+still run.
+"""
+import argparse, json, os, platform, random, statistics, subprocess, sys, tempfile, time
+import numpy as np
+
+SECTIONS = ("chunk", "extract", "store", "rerank", "graph")
+# metric name suffix -> True when bigger is better
+_DIRECTION = {"_per_s": True, "_ms": False, "_s": False}
+
+
+def pct(values, q):
+    return float(np.percentile(values, q)) if len(values) else 0.0
+
+
+def timed(fn, n: int):
+    """Call fn(i) n times; latencies in ms."""
+    out = []
+    for i in range(n):
+        t0 = time.perf_counter(); fn(i); out.append((time.perf_counter() - t0) * 1000)
+    return out
+
+
+def bench_chunk(args):
+    from core.chunk import iter_chunks
+    from .bench_chunk import document_of_size, bench
+    text = document_of_size(args.chunk_mb)
+    list(iter_chunks(text[:100_000]))  # load the encoder outside the timing
+    r = bench(text, "tokens", iter_chunks)
+    return [dict(mb=r["mb"], chunks=r["chunks"], mb_per_s=r["mb_per_s"], peak_mb=r["peak_mb"])]
+
+
+def bench_extract(args):
+    from core.fetch import _extract
+    from .stubs import fixture_pages
+    pages = fixture_pages()
+    for u, h in pages: _extract(u, h)  # imports and lazy setup
+    n = max(args.extract_pages, len(pages))
+    t0 = time.perf_counter()
+    chars = sum(len(_extract(*pages[i % len(pages)])["text"]) for i in range(n))
+    dt = time.perf_counter() - t0
+    return [dict(fixtures=len(pages), pages=n, pages_per_s=round(n / dt, 1), text_chars=chars // n)]
+
+
+def _corpus_blocks(n: int, dim: int, seed: int, block: int = 100_000):
+    """Clustered unit vectors, like embeddings of passages about a few hundred topics."""
+    rng = np.random.default_rng(seed)
+    centers = rng.standard_normal((256, dim)).astype(np.float32)
+    for start in range(0, n, block):
+        b = min(block, n - start)
+        X = centers[rng.integers(0, len(centers), b)] + 0.6 * rng.standard_normal((b, dim)).astype(np.float32)
+        yield start, X / np.linalg.norm(X, axis=1, keepdims=True)
+
+
+def _row(i: int, words=("index", "vector", "query", "page", "cache", "latency", "passage", "source")):
+    text = f"Synthetic passage {i}. " + " ".join(words[(i * 7 + j) % len(words)] for j in range(60))
+    return f"https://site{i % 5000}.example/p{i // 8}", f"Page {i // 8}", i % 8, text, f"site{i % 5000}.example"
+
+
+def build_store(path: str, n: int, dim: int, kind: str, seed: int = 0):
+    """chunks.sqlite + faiss_index.bin with n synthetic passages, written directly (no embedding calls)."""
+    from core.chunk_db import ChunkDB, text_hash
+    from core.faiss_store import build_index, write_index_atomic
+    conn = ChunkDB(os.path.join(path, "chunks.sqlite"))
+    index = None
+    for start, X in _corpus_blocks(n, dim, seed):
+        ids = np.array(conn.allocate_ids(len(X)), dtype=np.int64)
+        rows = [(i, *r, dim, text_hash(r[3])) for i, r in ((int(i), _row(int(i))) for i in ids)]
+        with conn:
+            conn.executemany("""INSERT INTO chunks(id,url,title,ord,text,domain,embedding_dim,created_at,text_hash)
+                                VALUES(?,?,?,?,?,?,?,datetime('now'),?)""", rows)
+        if index is None:
+            index = build_index(kind, X, ids, d=dim)  # IVF-PQ trains on the first block
+        else:
+            index.add_with_ids(X, ids)
+    write_index_atomic(index, os.path.join(path, "faiss_index.bin"))
+    conn.close()
+
+
+def bench_store(args):
+    from core.chunk_db import ChunkDB
+    from core.faiss_store import VectorIndex, add_vectors, search, fetch_by_ids, min_train_size
+    rows = []
+    for n in args.sizes:
+        for kind in args.index:
+            if n < min_train_size(kind):
+                rows.append(dict(size=n, index=kind, skipped=f"{kind} needs at least {min_train_size(kind)} vectors"))
+                continue
+            with tempfile.TemporaryDirectory(prefix="openscout-store-") as d:
+                t0 = time.perf_counter()
+                build_store(d, n, args.dim, kind, args.seed)
+                build_s = time.perf_counter() - t0
+                t0 = time.perf_counter()
+                index = VectorIndex.open(os.path.join(d, "faiss_index.bin"), target_kind=kind)
+                open_s = time.perf_counter() - t0
+                conn = ChunkDB(os.path.join(d, "chunks.sqlite"))
+                rng = np.random.default_rng(args.seed + 1)
+                # queries from the corpus' own topic clusters, so they land near real passages
+                base = next(_corpus_blocks(min(n, 1000), args.dim, args.seed))[1]
+                Q = base[rng.integers(0, len(base), args.queries)] + rng.normal(0, 0.05, (args.queries, args.dim))
+                Q = Q.astype(np.float32)
+                search(index, conn, Q[0], k=6)
+                s_lat = timed(lambda i: search(index, conn, Q[i], k=6), args.queries)
+                id_sets = [rng.integers(0, n, 24).tolist() for _ in range(args.queries)]
+                f_lat = timed(lambda i: fetch_by_ids(conn, id_sets[i]), args.queries)
+                # inserts on top of the corpus, through the same path as indexing a fetched page
+                X = next(_corpus_blocks(args.add, args.dim, args.seed + 2))[1]
+                metas = [dict(zip(("url", "title", "ord", "text", "domain"), _row(n + 10_000_000 + i)))
+                         for i in range(args.add)]
+                t0 = time.perf_counter()
+                for b in range(0, args.add, args.add_batch):
+                    add_vectors(index, conn, X[b:b + args.add_batch], metas[b:b + args.add_batch])
+                add_s = time.perf_counter() - t0
+                conn.close()
+            rows.append(dict(size=n, index=kind, dim=args.dim, build_s=round(build_s, 2), open_s=round(open_s, 3),
+                             add_per_s=round(args.add / add_s, 1),
+                             search_p50_ms=round(pct(s_lat, 50), 3), search_p99_ms=round(pct(s_lat, 99), 3),
+                             fetch_by_ids_p50_ms=round(pct(f_lat, 50), 3), fetch_by_ids_p99_ms=round(pct(f_lat, 99), 3)))
+    return rows
+
+
+def bench_rerank(args):
+    os.environ.setdefault("HF_HUB_OFFLINE", "1")  # use the local model cache, never download
+    from core.rerank import maybe_rerank, _get
+    _get()
+    rng = random.Random(args.seed)
+    words = "index vector query page fetch cache latency model passage source answer token".split()
+    queries = [" ".join(rng.choices(words, k=6)) for _ in range(args.queries)]
+    hits = [dict(id=i, url=f"https://x.example/{i}", text=" ".join(rng.choices(words, k=180)), score=1 - i / 100)
+            for i in range(24)]
+    maybe_rerank("warm up", hits)
+    lat = timed(lambda i: maybe_rerank(queries[i] + f" {i}", hits), args.queries)  # distinct: no score cache hits
+    return [dict(passages=len(hits), p50_ms=round(pct(lat, 50), 2), p99_ms=round(pct(lat, 99), 2))]
+
+
+def bench_graph(args):
+    from core import embed, graph
+    from .stubs import start_page_server, install_stubs
+    srv = start_page_server(args.page_delay)
+    cwd = os.getcwd()
+    with tempfile.TemporaryDirectory(prefix="openscout-graph-") as d:
+        os.chdir(d)
+        try:
+            install_stubs(graph, embed, srv.server_address[1], pages=6)
+            graph.app_graph.invoke(graph.State(query="warm up", openai_api_key="stub"))
+            lat, hits = [], []
+            for i in range(args.graph_queries):
+                t0 = time.perf_counter()
+                r = graph.app_graph.invoke(graph.State(query=f"graph query {i}", openai_api_key="stub"))
+                lat.append((time.perf_counter() - t0) * 1000); hits.append(len(r["hits"]))
+        finally:
+            os.chdir(cwd)
+            srv.shutdown()
+    return [dict(queries=len(lat), page_delay=args.page_delay, p50_ms=round(pct(lat, 50), 1),
+                 p99_ms=round(pct(lat, 99), 1), mean_hits=round(statistics.mean(hits), 1))]
+
+
+def flatten(results: dict) -> dict:
+    """{"store[size=10000,index=flat].search_p50_ms": 0.41, ...} for every numeric result."""
+    out = {}
+    for section, rows in results.items():
+        for r in rows if isinstance(rows, list) else []:
+            ident = ",".join(f"{k}={r[k]}" for k in ("size", "index") if k in r)
+            for k, v in r.items():
+                if k in ("size", "index") or isinstance(v, bool) or not isinstance(v, (int, float)): continue
+                out[f"{section}[{ident}].{k}" if ident else f"{section}.{k}"] = v
+    return out
+
+
+def _higher_is_better(metric: str):
+    for suffix, better in _DIRECTION.items():
+        if metric.endswith(suffix): return better
+    return None  # counts and sizes: informational
+
+
+def compare(new: dict, old: dict, tolerance: float):
+    rows = []
+    for k, v in sorted(new.items()):
+        better, prev = _higher_is_better(k), old.get(k)
+        if better is None or not prev: continue
+        change = (v - prev) / prev
+        worse = -change if better else change
+        rows.append(dict(metric=k, old=prev, new=v, change=round(change, 3), regressed=worse > tolerance))
+    return rows
+
+
+def _meta(args):
+    try:
+        commit = subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True,
+                                cwd=os.path.dirname(os.path.abspath(__file__))).stdout.strip()
+    except OSError:
+        commit = ""
+    return dict(commit=commit, python=platform.python_version(), platform=platform.platform(),
+                cpus=os.cpu_count(), time=time.strftime("%Y-%m-%dT%H:%M:%S%z"), args=vars(args))
+
+
+def main(argv=None):
+    p = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    p.add_argument("--only", nargs="+", choices=SECTIONS, default=list(SECTIONS))
+    p.add_argument("--sizes", type=int, nargs="+", default=[10_000, 100_000])
+    p.add_argument("--index", nargs="+", choices=("flat", "ivfpq", "hnsw"), default=["flat"])
+    p.add_argument("--dim", type=int, default=1536)
+    p.add_argument("--queries", type=int, default=200)
+    p.add_argument("--add", type=int, default=2000, help="vectors inserted with add_vectors per corpus")
+    p.add_argument("--add-batch", type=int, default=50, help="chunks per add_vectors call (about one page)")
+    p.add_argument("--chunk-mb", type=float, default=2.0)
+    p.add_argument("--extract-pages", type=int, default=60)
+    p.add_argument("--graph-queries", type=int, default=10)
+    p.add_argument("--page-delay", type=float, default=0.05)
+    p.add_argument("--seed", type=int, default=0)
+    p.add_argument("--out", help="write results JSON here")
+    p.add_argument("--compare", help="earlier results JSON to check for regressions")
+    p.add_argument("--tolerance", type=float, default=0.15)
+    args = p.parse_args(argv)
+
+    results = {}
+    for name in args.only:
+        t0 = time.perf_counter()
+        try:
+            results[name] = globals()[f"bench_{name}"](args)
+        except Exception as e:  # e.g. no cached reranker model: record it and keep going
+            results[name] = {"error": f"{type(e).__name__}: {e}"}
+        print(f"{name:<8} {time.perf_counter() - t0:7.1f}s  {json.dumps(results[name])}", file=sys.stderr)
+    doc = dict(meta=_meta(args), results=results, metrics=flatten(results))
+    if args.out:
+        with open(args.out, "w") as f: json.dump(doc, f, indent=2)
+    else:
+        print(json.dumps(doc, indent=2))
+    if args.compare:
+        with open(args.compare) as f: old = json.load(f)
+        rows = compare(doc["metrics"], old.get("metrics", {}), args.tolerance)
+        bad = [r for r in rows if r["regressed"]]
+        for r in rows:
+            flag = "REGRESSED" if r["regressed"] else ""
+            print(f"{r['metric']:<55}{r['old']:>12g}{r['new']:>12g}{r['change']:>+9.1%}  {flag}", file=sys.stderr)
+        print(f"{len(bad)} of {len(rows)} metrics regressed by more than {args.tolerance:.0%}", file=sys.stderr)
+        if bad: sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
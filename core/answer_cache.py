@@ -0,0 +1,101 @@
+"""Semantic cache of synthesized answers, so repeated and paraphrased questions skip the whole pipeline.
+
+Entries live in SQLite (shared by every worker process) and each process keeps a flat inner-product FAISS
+index over their query vectors, topped up with rows it hasn't seen yet on every lookup. A cached answer is
+served when a past query is at least `threshold` cosine-similar and was answered with the same LLM label
+and answer mode within `ttl` seconds, and none of its sources went stale: a cited chunk was deleted, or its
+page has been re-indexed with new content since the answer was written.
+"""
+import json, sqlite3, threading, time
+import faiss
+import numpy as np
+from .constants import EMBED_DIM, ANSWER_CACHE_PATH, ANSWER_CACHE_TTL, ANSWER_CACHE_THRESHOLD
+from . import trace
+
+_HIT_FIELDS = ("id", "url", "title", "ord", "text", "domain", "score")
+
+
+class AnswerCache:
+    def __init__(self, path: str = ANSWER_CACHE_PATH, ttl: float = ANSWER_CACHE_TTL,
+                 threshold: float = ANSWER_CACHE_THRESHOLD, dim: int = EMBED_DIM):
+        self.ttl, self.threshold, self.dim = ttl, threshold, dim
+        self._db = sqlite3.connect(path, timeout=30, check_same_thread=False)
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.execute("""CREATE TABLE IF NOT EXISTS answers(
+            id INTEGER PRIMARY KEY, created REAL, created_at TEXT, label TEXT, mode TEXT, query TEXT,
+            qvec BLOB, hits TEXT, answer TEXT, citations TEXT)""")
+        self._lock = threading.Lock()
+        self._index = faiss.IndexIDMap(faiss.IndexFlatIP(dim))
+        self._last = 0  # highest answers.id already in the FAISS index
+
+    def _sync(self):
+        rows = self._db.execute("SELECT id, qvec FROM answers WHERE id > ? AND created > ? ORDER BY id",
+                                (self._last, time.time() - self.ttl)).fetchall()
+        if rows:
+            X = np.vstack([np.frombuffer(v, dtype=np.float32) for _, v in rows])
+            self._index.add_with_ids(X, np.array([i for i, _ in rows], dtype=np.int64))
+        top = self._db.execute("SELECT MAX(id) FROM answers").fetchone()[0]
+        self._last = max(self._last, top or 0)
+
+    def _drop(self, ids):
+        self._index.remove_ids(np.array(ids, dtype=np.int64))
+        with self._db:
+            self._db.executemany("DELETE FROM answers WHERE id=?", [(i,) for i in ids])
+
+    @staticmethod
+    def _fresh(entry: dict, conn) -> bool:
+        if conn is None: return True
+        ids = [h["id"] for h in entry["hits"] if h.get("id") is not None]
+        if ids:
+            q = ",".join("?" * len(ids))
+            if conn.execute(f"SELECT COUNT(*) FROM chunks WHERE id IN ({q})", ids).fetchone()[0] < len(set(ids)):
+                return False
+        urls = sorted({h["url"] for h in entry["hits"] if h.get("url")})
+        if urls:
+            q = ",".join("?" * len(urls))
+            newer = conn.execute(f"SELECT 1 FROM chunks WHERE url IN ({q}) AND created_at > ? LIMIT 1",
+                                 (*urls, entry["created_at"])).fetchone()
+            if newer: return False
+        return True
+
+    def lookup(self, qvec, label: str, mode: str, conn=None, candidates: int = 8):
+        """Best cached entry for `qvec` (dict with query, answer, hits, citations, similarity) or None.
+        `conn` is the chunk store used for the source-freshness check."""
+        entry = self._lookup(qvec, label, mode, conn, candidates)
+        trace.count("cache.answer.hit" if entry else "cache.answer.miss")
+        return entry
+
+    def _lookup(self, qvec, label: str, mode: str, conn, candidates: int):
+        q = np.asarray(qvec, dtype=np.float32).reshape(1, -1)
+        with self._lock:
+            self._sync()
+            if not self._index.ntotal: return None
+            D, I = self._index.search(q, min(candidates, self._index.ntotal))
+            stale = []
+            try:
+                for sim, id_ in zip(D[0].tolist(), I[0].tolist()):
+                    if id_ < 0 or sim < self.threshold: break
+                    row = self._db.execute("""SELECT created, created_at, label, mode, query, hits, answer, citations
+                                              FROM answers WHERE id=?""", (id_,)).fetchone()
+                    if row is None or row[0] < time.time() - self.ttl:
+                        stale.append(id_); continue
+                    if (row[2], row[3]) != (label, mode): continue
+                    entry = dict(created_at=row[1], query=row[4], hits=json.loads(row[5]), answer=row[6],
+                                 citations=json.loads(row[7]), similarity=sim)
+                    if not self._fresh(entry, conn):
+                        stale.append(id_); continue
+                    return entry
+                return None
+            finally:
+                if stale: self._drop(stale)
+
+    def put(self, qvec, label: str, mode: str, query: str, hits, answer: str, citations):
+        # an answer from no sources ("couldn't find anything") would pass the freshness check for the whole TTL
+        if not answer or not answer.strip() or not hits: return
+        v = np.asarray(qvec, dtype=np.float32).reshape(-1)
+        slim = [{k: h[k] for k in _HIT_FIELDS if k in h} for h in hits]
+        with self._lock, self._db:
+            self._db.execute("DELETE FROM answers WHERE created < ?", (time.time() - self.ttl,))
+            self._db.execute("""INSERT INTO answers(created, created_at, label, mode, query, qvec, hits, answer, citations)
+                                VALUES(?, datetime('now'), ?, ?, ?, ?, ?, ?, ?)""",
+                             (time.time(), label, mode, query, v.tobytes(), json.dumps(slim), answer, json.dumps(citations)))
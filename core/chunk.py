@@ -1,22 +1,128 @@
-from .constants import CHUNK_TOKENS, CHUNK_OVERLAP
-import re
+from .constants import CHUNK_TOKENS, CHUNK_OVERLAP, CHUNK_RESPECT_BLOCKS
+from collections import deque
+import os, re
+import tiktoken
 
-def _sents(text:str): return re.split(r'(?<=[.!?])\s+', text.strip())
+_SENT_END = re.compile(r'(?<=[.!?])\s+|(?<=[。！？])\s*')  # CJK full stops need no following space
+_LINE = re.compile(r'[^\n]+')
+_enc = None
+_CPUS = os.cpu_count() or 1
 
-def chunk_text(text: str, target_tokens: int = CHUNK_TOKENS, overlap: int = CHUNK_OVERLAP):
-    sents = _sents(text)
-    chunks, cur, count = [], [], 0
+def _encoding():
+    global _enc
+    if _enc is None:
+        _enc = tiktoken.get_encoding("cl100k_base")  # tokenizer of the text-embedding-3 models
+    return _enc
+
+def _iter_sents(text: str):
+    """Sentences lazily, without materialising the split of a very long document."""
+    start = 0
+    for m in _SENT_END.finditer(text):
+        if m.start() > start: yield text[start:m.start()]
+        start = m.end()
+    if start < len(text) and text[start:].strip(): yield text[start:].strip()
+
+def _iter_blocks(text: str, respect_blocks: bool):
+    """(is_heading, sentences) per paragraph; the whole text is one block when blocks are ignored."""
+    if not respect_blocks:
+        yield False, _iter_sents(text.strip())
+        return
+    for m in _LINE.finditer(text):
+        line = m.group().strip()
+        if not line: continue
+        # extracted text has no markup left: a short line without closing punctuation reads as a heading
+        heading = len(line) < 80 and line[-1] not in ".!?:;,\"')]。！？" and len(line.split()) <= 12
+        yield heading, _iter_sents(line)
+
+def _counted(enc, sents, batch: int = 512):
+    """(sentence, tokens) pairs; each sentence is encoded once, with the space that joins it. With several
+    cores, full batches go through tiktoken's threaded batch encoder; otherwise the pool only costs time."""
+    if _CPUS < 2:
+        for s in sents: yield s, len(enc.encode_ordinary(" " + s))
+        return
+    buf = []
     for s in sents:
-        tok = max(1, len(s.split()))
-        if count + tok > target_tokens and cur:
-            chunks.append(" ".join(cur))
-            # overlap tail
-            back, bt = [], 0
-            for t in reversed(cur):
-                tt = max(1, len(t.split()))
-                if bt + tt > overlap: break
-                bt += tt; back.insert(0, t)
-            cur, count = back[:], sum(len(x.split()) for x in back)
-        cur.append(s); count += tok
-    if cur: chunks.append(" ".join(cur))
-    return chunks
+        buf.append(s)
+        if len(buf) >= batch:
+            yield from zip(buf, map(len, enc.encode_ordinary_batch([" " + x for x in buf]))); buf = []
+    for x in buf: yield x, len(enc.encode_ordinary(" " + x))
+
+def _slices(enc, s: str, target: int):
+    """Pieces of about target/2 tokens cut at character boundaries: a token can end inside a multibyte
+    character, so cuts use the character offsets of the token starts rather than decoding token slices."""
+    toks = enc.encode_ordinary(s)
+    _, offs = enc.decode_with_offsets(toks)
+    step = max(1, target // 2)
+    cuts = sorted({offs[i] for i in range(0, len(toks), step)} | {0, len(s)})
+    for a, b in zip(cuts, cuts[1:]):
+        part = s[a:b]
+        n = len(enc.encode_ordinary(" " + part))
+        if (n > target or len(enc.encode_ordinary(part)) > target) and step > 1 and b - a > 1:
+            yield from _slices(enc, part, step)
+        else:
+            yield part, n
+
+def _split_long(enc, s: str, n: int, target: int):
+    """Pieces of an over-budget sentence, packed word by word (token slices for a single giant word)."""
+    if n <= target: yield s, n; return
+    piece, count = [], 0
+    for w, wn in _counted(enc, s.split()):
+        if wn > target:
+            if piece: yield " ".join(piece), count; piece, count = [], 0
+            yield from _slices(enc, w, target)
+            continue
+        if count + wn > target and piece:
+            yield " ".join(piece), count; piece, count = [], 0
+        piece.append(w); count += wn
+    if piece: yield " ".join(piece), count
+
+def iter_chunks(text: str, target_tokens: int = CHUNK_TOKENS, overlap: int = CHUNK_OVERLAP,
+                respect_blocks: bool = CHUNK_RESPECT_BLOCKS):
+    """Yield chunks of at most `target_tokens` tokens (cl100k_base), consecutive chunks sharing up to
+    `overlap` tokens of whole sentences. With `respect_blocks`, a heading starts a new chunk and a paragraph
+    that would not fit starts one once the current chunk is half full."""
+    enc = _encoding()
+    overlap = min(overlap, target_tokens // 2)
+    cur, count, fresh = deque(), 0, False  # [sentence, tokens, first-position adjustment] of the chunk being built
+
+    def size(extra: int = 0):
+        # counts include the joining space; the first sentence has none, which can change its token count
+        if cur and cur[0][2] is None: cur[0][2] = len(enc.encode_ordinary(cur[0][0])) - cur[0][1]
+        return count + extra + (cur[0][2] if cur else 0)
+
+    def flush(keep: int):
+        nonlocal count, fresh
+        out = " ".join(e[0] for e in cur)
+        while cur and count > keep: count -= cur.popleft()[1]
+        fresh = False
+        return out
+
+    prev_heading = False
+    for heading, sents in _iter_blocks(text, respect_blocks):
+        pairs = _counted(enc, sents)
+        if respect_blocks and cur:
+            pairs = list(pairs)
+            if heading and not prev_heading:
+                if fresh: yield flush(0)
+                cur.clear(); count = 0  # no overlap across a heading
+            elif (fresh and not prev_heading and count >= target_tokens // 2
+                  and size(sum(n for _, n in pairs)) > target_tokens):
+                yield flush(overlap)
+        prev_heading = heading
+        for s, n in pairs:
+            todo = deque(_split_long(enc, s, n, target_tokens))
+            while todo:
+                piece, pn = todo.popleft()
+                if cur and size(pn) > target_tokens:
+                    if fresh: yield flush(overlap)
+                    while cur and size(pn) > target_tokens: count -= cur.popleft()[1]
+                if not cur and len(piece) > 1 and len(enc.encode_ordinary(piece)) > target_tokens:
+                    # first in its chunk the piece is encoded without the joining space, which can cost more
+                    todo.extendleft(reversed(list(_slices(enc, piece, target_tokens))))
+                    continue
+                cur.append([piece, pn, None]); count += pn; fresh = True
+    if fresh: yield flush(0)
+
+def chunk_text(text: str, target_tokens: int = CHUNK_TOKENS, overlap: int = CHUNK_OVERLAP,
+               respect_blocks: bool = CHUNK_RESPECT_BLOCKS):
+    return list(iter_chunks(text, target_tokens, overlap, respect_blocks))
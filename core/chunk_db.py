@@ -0,0 +1,100 @@
+"""SQLite storage for chunk metadata and text, aligned to FAISS ids.
+
+`ChunkDB` hands every thread its own connection (WAL journal, so readers don't block the writer) and
+allocates ids in memory from blocks reserved in the database, so inserts never scan `MAX(id)` and
+several processes can share one file.
+"""
+import hashlib, sqlite3, threading
+
+ID_BLOCK = 1024  # ids reserved per round-trip to the allocator row
+
+
+def text_hash(text: str) -> str:
+    return hashlib.sha256(text.encode("utf-8")).hexdigest()
+
+
+class ChunkDB:
+    """Per-thread connection pool that reads like a `sqlite3.Connection` (`execute`, `executemany`, `with db:`)."""
+    def __init__(self, path: str = "chunks.sqlite", synchronous: str = "NORMAL", timeout: float = 30.0):
+        self.path, self.synchronous, self.timeout = path, synchronous, timeout
+        self._local = threading.local()
+        self._id_lock = threading.Lock()
+        self._next_id, self._id_limit = 0, 0
+        # serialises check-then-insert in add_vectors within this process; the unique index covers the rest
+        self.write_lock = threading.RLock()
+        self.side_store = None  # optional memory-mapped read path, see core.side_store
+        self._init_schema()
+
+    def connection(self) -> sqlite3.Connection:
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=self.timeout, check_same_thread=False)
+            conn.execute("PRAGMA journal_mode=WAL")
+            # with WAL, NORMAL only risks the last commits on power loss, never corruption
+            conn.execute(f"PRAGMA synchronous={self.synchronous}")
+            conn.execute("PRAGMA temp_store=MEMORY")
+            conn.execute("PRAGMA cache_size=-65536")  # 64 MiB page cache per connection
+            self._local.conn = conn
+        return conn
+
+    def execute(self, sql, params=()):
+        return self.connection().execute(sql, params)
+
+    def executemany(self, sql, seq):
+        return self.connection().executemany(sql, seq)
+
+    def __enter__(self):
+        return self.connection().__enter__()
+
+    def __exit__(self, *exc):
+        return self.connection().__exit__(*exc)
+
+    def close(self):
+        conn = getattr(self._local, "conn", None)
+        if conn is not None:
+            conn.close()
+            self._local.conn = None
+
+    def _init_schema(self):
+        conn = self.connection()
+        conn.execute("""CREATE TABLE IF NOT EXISTS chunks(
+            id INTEGER PRIMARY KEY, url TEXT, title TEXT, ord INT,
+            text TEXT, domain TEXT, embedding_dim INT, created_at TEXT
+        );""")
+        conn.execute("CREATE TABLE IF NOT EXISTS meta(key TEXT PRIMARY KEY, value INTEGER)")
+        # ids of rows removed below whose vectors are still in the FAISS index; faiss_store drops them on open
+        conn.execute("CREATE TABLE IF NOT EXISTS dropped_ids(id INTEGER PRIMARY KEY)")
+        with conn:
+            # older databases predate the content hash column; add it and backfill
+            if "text_hash" not in {r[1] for r in conn.execute("PRAGMA table_info(chunks)")}:
+                conn.execute("ALTER TABLE chunks ADD COLUMN text_hash TEXT")
+                rows = conn.execute("SELECT id, text FROM chunks").fetchall()
+                conn.executemany("UPDATE chunks SET text_hash=? WHERE id=?", [(text_hash(t or ""), i) for i, t in rows])
+            if not conn.execute("SELECT 1 FROM sqlite_master WHERE name='chunks_url_ord_hash'").fetchone():
+                # rows duplicated by re-indexing before dedupe existed; keep the oldest copy
+                dupes = "id NOT IN (SELECT MIN(id) FROM chunks GROUP BY url, ord, text_hash)"
+                conn.execute(f"INSERT OR IGNORE INTO dropped_ids SELECT id FROM chunks WHERE {dupes}")
+                conn.execute(f"DELETE FROM chunks WHERE {dupes}")
+                conn.execute("CREATE UNIQUE INDEX chunks_url_ord_hash ON chunks(url, ord, text_hash)")
+            conn.execute("CREATE INDEX IF NOT EXISTS chunks_text_hash ON chunks(text_hash)")
+            conn.execute("CREATE INDEX IF NOT EXISTS chunks_domain ON chunks(domain)")
+            conn.execute("""INSERT OR IGNORE INTO meta(key, value)
+                            SELECT 'next_id', COALESCE(MAX(id), -1) + 1 FROM chunks""")
+
+    def allocate_ids(self, n: int) -> list:
+        """Reserve n consecutive-as-possible ids; blocks come from the `meta` row so processes never collide."""
+        out = []
+        with self._id_lock:
+            while len(out) < n:
+                if self._next_id >= self._id_limit:
+                    want = max(ID_BLOCK, n - len(out))
+                    conn = self.connection()
+                    with conn:
+                        conn.execute("BEGIN IMMEDIATE")
+                        start = conn.execute("SELECT value FROM meta WHERE key='next_id'").fetchone()[0]
+                        conn.execute("UPDATE meta SET value=? WHERE key='next_id'", (start + want,))
+                    self._next_id, self._id_limit = start, start + want
+                take = min(n - len(out), self._id_limit - self._next_id)
+                out.extend(range(self._next_id, self._next_id + take))
+                self._next_id += take
+        return out
@@ -0,0 +1,127 @@
+"""Maintenance commands for the local vector store.
+
+    python -m core.cli migrate-index --type hnsw --report
+    python -m core.cli build-side-store
+    python -m core.cli ingest urls.txt | sitemap.xml | https://site/sitemap.xml | DIR
+"""
+import argparse, json, time
+import numpy as np
+from .chunk_db import ChunkDB
+from .constants import INDEX_TYPE, SIDE_STORE_DIR
+from .faiss_store import (INDEX_KINDS, index_kind, build_index, load_index, all_vectors, VectorIndex, l2_normalize,
+                          min_train_size, write_index_atomic)
+from .side_store import build_side_store
+
+
+def _timed_search(index, Q, k, **params):
+    vi = VectorIndex(index, target_kind=index_kind(index))
+    lat, found = [], []
+    for q in Q:
+        t0 = time.perf_counter()
+        _, ids = vi.search(q.reshape(1, -1), k, **params)
+        lat.append((time.perf_counter() - t0) * 1000)
+        found.append(ids[0])
+    return np.array(found), np.array(lat)
+
+
+def recall_report(baseline, candidate, n_queries: int = 200, k: int = 10, seed: int = 0):
+    """Recall@k and per-query latency of `candidate` against the exact `baseline`.
+
+    Queries are stored vectors with a little noise, which is close to how real queries land
+    near the passages they retrieve. Returns one row per search setting.
+    """
+    X, _ = all_vectors(baseline)
+    if not len(X): return []
+    rng = np.random.default_rng(seed)
+    Q = X[rng.integers(0, len(X), size=n_queries)] + rng.normal(0, 0.01, size=(n_queries, X.shape[1]))
+    Q = l2_normalize(Q).astype(np.float32)
+    truth, lat = _timed_search(baseline, Q, k)
+    rows = [dict(index="flat", setting="exact", recall=1.0, p50_ms=np.percentile(lat, 50), p99_ms=np.percentile(lat, 99))]
+    kind = index_kind(candidate)
+    if kind == "ivfpq": settings = [("nprobe", v) for v in (1, 4, 16, 64)]
+    elif kind == "hnsw": settings = [("ef_search", v) for v in (16, 32, 64, 128)]
+    else: settings = [(None, None)]
+    for name, value in settings:
+        got, lat = _timed_search(candidate, Q, k, **({name: value} if name else {}))
+        recall = np.mean([len(set(g) & set(t)) / k for g, t in zip(got, truth)])
+        rows.append(dict(index=kind, setting=f"{name}={value}" if name else "exact", recall=float(recall),
+                         p50_ms=np.percentile(lat, 50), p99_ms=np.percentile(lat, 99)))
+    return rows
+
+
+def cmd_migrate_index(args):
+    vi = VectorIndex.open(args.path, target_kind=args.type)
+    print(f"Loaded {args.path}: {vi.kind} index with {vi.index.ntotal} vectors "
+          f"(+{vi.wal_vectors} in the write-ahead segment)")
+    if args.type == "ivfpq" and vi.ntotal < min_train_size(args.type):  # hnsw/flat build from any size
+        raise SystemExit(f"Not migrating: IVF-PQ needs at least {min_train_size('ivfpq')} vectors to train "
+                         f"and {args.path} has {vi.ntotal}; use --type hnsw or flat")
+    t0 = time.perf_counter()
+
+    def publish(new):
+        """Called by compact with the rebuilt index, so the report and the published file share one build."""
+        print(f"Built {args.type} index in {time.perf_counter() - t0:.1f}s")
+        if args.report:
+            X, ids = vi.all_vectors()  # exact vectors for the baseline (PQ codes only decode approximately)
+            baseline = new if args.type == "flat" else build_index("flat", X, ids, d=vi.d)
+            print(f"{'index':<7}{'setting':<16}{'recall@' + str(args.k):>10}{'p50 ms':>10}{'p99 ms':>10}")
+            for r in recall_report(baseline, new, n_queries=args.queries, k=args.k):
+                print(f"{r['index']:<7}{r['setting']:<16}{r['recall']:>10.3f}{r['p50_ms']:>10.3f}{r['p99_ms']:>10.3f}")
+        if args.dry_run: return False
+        # the backup is one self-contained file: the old main index with the segment's vectors folded in
+        old = load_index(args.path)
+        Xd, idd = all_vectors(vi.delta)
+        if len(idd): old.add_with_ids(Xd, idd)
+        write_index_atomic(old, args.path + ".bak")
+        return True
+
+    # rebuilt and published like a compaction: under the index file lock, trimming only the covered segment
+    if vi.compact(kind=args.type, before_publish=publish):
+        print(f"Wrote {args.path} as {args.type} in {time.perf_counter() - t0:.1f}s "
+              f"(previous index kept as {args.path}.bak)")
+
+
+def cmd_build_side_store(args):
+    t0 = time.perf_counter()
+    info = build_side_store(ChunkDB(args.db), args.out)
+    print(f"Built side store generation {info['generation']} in {args.out}: {info['rows']} rows over "
+          f"{info['ids']} ids, {info['text_bytes'] / 2**20:.1f} MB text ({time.perf_counter() - t0:.1f}s)")
+
+
+def cmd_ingest(args):
+    from .ingest import ingest, read_sources  # pulls in the query pipeline; keep the other commands light
+    items = (i for src in args.sources for i in read_sources(src))
+    stats = ingest(items, batch=args.batch, checkpoint=None if args.no_checkpoint else args.checkpoint,
+                   limit=args.limit)
+    if args.json: print(json.dumps(stats))
+
+
+def main(argv=None):
+    p = argparse.ArgumentParser(prog="python -m core.cli", description="OpenScout vector store maintenance")
+    sub = p.add_subparsers(dest="cmd", required=True)
+    m = sub.add_parser("migrate-index", help="rebuild faiss_index.bin as another index type (no re-embedding)")
+    m.add_argument("--type", choices=INDEX_KINDS, default=INDEX_TYPE)
+    m.add_argument("--path", default="faiss_index.bin")
+    m.add_argument("--report", action="store_true", help="print recall/latency against the exact flat index")
+    m.add_argument("--queries", type=int, default=200)
+    m.add_argument("--k", type=int, default=10)
+    m.add_argument("--dry-run", action="store_true", help="build (and report) without replacing the file")
+    m.set_defaults(fn=cmd_migrate_index)
+    b = sub.add_parser("build-side-store", help="snapshot chunks.sqlite into the memory-mapped side store")
+    b.add_argument("--db", default="chunks.sqlite")
+    b.add_argument("--out", default=SIDE_STORE_DIR)
+    b.set_defaults(fn=cmd_build_side_store)
+    g = sub.add_parser("ingest", help="fetch/read, chunk, embed and store URL lists, sitemaps or saved pages")
+    g.add_argument("sources", nargs="+", help="file of URLs (one per line), sitemap (.xml file or URL), URL or directory")
+    g.add_argument("--batch", type=int, default=32, help="items per fetch/embed batch")
+    g.add_argument("--checkpoint", default="ingest.checkpoint", help="finished items, for resuming")
+    g.add_argument("--no-checkpoint", action="store_true")
+    g.add_argument("--limit", type=int, default=None, help="ingest at most this many new items")
+    g.add_argument("--json", action="store_true", help="print the final totals as JSON")
+    g.set_defaults(fn=cmd_ingest)
+    args = p.parse_args(argv)
+    args.fn(args)
+
+
+if __name__ == "__main__":
+    main()
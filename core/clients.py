@@ -0,0 +1,187 @@
+"""Process-wide registry of network clients, so a query never pays for TLS handshakes or SDK setup again.
+
+    http_client(name)            pooled keep-alive httpx.Client, one per name
+    async_http_client(name)      the same for httpx.AsyncClient, one per (name, event loop)
+    sdk_client(provider, key, f) SDK client built by f(), cached per (provider, api-key hash), least recently
+                                 used evicted past OPENSCOUT_CLIENT_CACHE_SIZE (per-request keys would grow it)
+    async_sdk_client(...)        the same for async SDK clients, also per event loop
+    warm(name, url)              open a pooled connection in the background ahead of a request
+    neo4j_driver(uri, user, pw)  one driver per URI and credentials, bounded the same way
+    with_retries(fn)             shared retry policy: 429/5xx/connection errors, full-jitter backoff
+    awith_retries(fn)            the same for coroutine functions
+
+`metrics()` reports requests vs newly opened connections per pooled client (the rest reused a connection)
+and SDK client builds vs cache hits.
+"""
+import asyncio, hashlib, random, threading, time, weakref
+from collections import OrderedDict
+import httpx
+from .constants import HTTP_TIMEOUT, HTTP_CONNECT_TIMEOUT, HTTP_MAX_RETRIES, HTTP_POOL_SIZE, CLIENT_CACHE_SIZE
+
+_lock = threading.RLock()  # reentrant: an SDK factory may ask for a pooled http_client
+_http: dict = {}
+_async_http: dict = {}  # name -> WeakKeyDictionary(event loop -> AsyncClient)
+_sdk: OrderedDict = OrderedDict()
+_async_sdk: OrderedDict = OrderedDict()  # (provider, key hash) -> WeakKeyDictionary(event loop -> client)
+_drivers: OrderedDict = OrderedDict()
+_stats: dict = {}
+
+
+def _stat(group: str, name: str) -> dict:
+    return _stats.setdefault(group, {}).setdefault(name, {})
+
+
+def _count(d: dict, key: str, n: int = 1):
+    with _lock: d[key] = d.get(key, 0) + n
+
+
+def _key_hash(secret: str | None) -> str:
+    return hashlib.sha256((secret or "").encode("utf-8")).hexdigest()[:16]
+
+
+def _defaults(kw: dict) -> dict:
+    kw.setdefault("timeout", httpx.Timeout(HTTP_TIMEOUT, connect=HTTP_CONNECT_TIMEOUT))
+    kw.setdefault("limits", httpx.Limits(max_connections=HTTP_POOL_SIZE, max_keepalive_connections=HTTP_POOL_SIZE))
+    return kw
+
+
+def http_client(name: str = "default", **kw) -> httpx.Client:
+    """Shared httpx.Client for `name`; keyword arguments only apply when it is first created."""
+    c = _http.get(name)
+    if c is not None: return c
+    with _lock:
+        if name not in _http:
+            st = _stat("http", name)
+            def trace(event, info):
+                if event == "connection.connect_tcp.complete": _count(st, "connections")
+            def hook(request):
+                _count(st, "requests"); request.extensions["trace"] = trace
+            kw = _defaults(kw)
+            # transport-level retries cover connection failures; status-based retries are with_retries' job
+            kw.setdefault("transport", httpx.HTTPTransport(retries=HTTP_MAX_RETRIES, http2=kw.pop("http2", False),
+                                                           limits=kw.pop("limits")))
+            _http[name] = httpx.Client(event_hooks={"request": [hook]}, **kw)
+        return _http[name]
+
+
+def async_http_client(name: str = "default", **kw) -> httpx.AsyncClient:
+    """Shared httpx.AsyncClient for `name` on the running event loop (async clients can't cross loops)."""
+    loop = asyncio.get_running_loop()
+    with _lock:
+        per_loop = _async_http.setdefault(name, weakref.WeakKeyDictionary())
+        c = per_loop.get(loop)
+        if c is None:
+            st = _stat("async_http", name)
+            async def trace(event, info):
+                if event == "connection.connect_tcp.complete": _count(st, "connections")
+            async def hook(request):
+                _count(st, "requests"); request.extensions["trace"] = trace
+            kw = _defaults(kw)
+            kw.setdefault("transport", httpx.AsyncHTTPTransport(retries=HTTP_MAX_RETRIES, http2=kw.pop("http2", False),
+                                                                limits=kw.pop("limits")))
+            c = per_loop[loop] = httpx.AsyncClient(event_hooks={"request": [hook]}, **kw)
+        return c
+
+
+def _lru(cache: OrderedDict, key, build):
+    """cache[key], built on a miss; the least recently used entries past CLIENT_CACHE_SIZE are dropped and
+    returned. Call with _lock held."""
+    if key in cache:
+        cache.move_to_end(key); return cache[key], []
+    cache[key] = build()
+    return cache[key], [cache.popitem(last=False)[1] for _ in range(len(cache) - max(1, CLIENT_CACHE_SIZE))]
+
+
+def sdk_client(provider: str, api_key: str | None, factory):
+    """`factory()` once per (provider, api key); keys are only kept as hashes. Evicted clients are just
+    dropped, not closed: they share the pooled http_client."""
+    key = (provider, _key_hash(api_key))
+    st = _stat("sdk", provider)
+    with _lock:
+        built = key not in _sdk
+        c, _ = _lru(_sdk, key, factory)
+        _count(st, "builds" if built else "hits")
+        return c
+
+
+def async_sdk_client(provider: str, api_key: str | None, factory):
+    """Like sdk_client for async SDK clients, whose connection pools belong to the running event loop."""
+    loop = asyncio.get_running_loop()
+    st = _stat("async_sdk", provider)
+    with _lock:
+        per_loop, _ = _lru(_async_sdk, (provider, _key_hash(api_key)), weakref.WeakKeyDictionary)
+        c = per_loop.get(loop)
+        if c is None:
+            c = per_loop[loop] = factory()
+            st["builds"] = st.get("builds", 0) + 1
+        else:
+            st["hits"] = st.get("hits", 0) + 1
+        return c
+
+
+def warm(name: str, url: str):
+    """HEAD `url` on the pooled client from a daemon thread, so the request that follows (e.g. the LLM call
+    after reranking) finds a connection with TCP and TLS already done. Any status will do; errors are ignored."""
+    def go():
+        try:
+            http_client(name).head(url); _count(_stat("http", name), "warms")
+        except Exception:
+            pass
+    threading.Thread(target=go, daemon=True).start()
+
+
+def neo4j_driver(uri: str, user: str, password: str):
+    from neo4j import GraphDatabase
+    key = (uri, user, _key_hash(password))
+    with _lock:
+        d, evicted = _lru(_drivers, key, lambda: GraphDatabase.driver(uri, auth=(user, password)))
+    for old in evicted:
+        try: old.close()
+        except Exception: pass
+    return d
+
+
+def retryable(e: Exception) -> bool:
+    status = getattr(e, "status_code", None) or getattr(getattr(e, "response", None), "status_code", None)
+    if status is not None:
+        return status == 429 or status >= 500
+    # no HTTP status: connection resets and timeouts are worth another try
+    return type(e).__name__ in ("APIConnectionError", "APITimeoutError", "ConnectError", "ReadTimeout", "TimeoutError",
+                                "RemoteProtocolError", "ConnectTimeout", "PoolTimeout")
+
+
+def _backoff(e: Exception, attempt: int, base: float, cap: float) -> float:
+    delay = random.uniform(0, min(cap, base * 2 ** attempt))  # full jitter
+    retry_after = getattr(getattr(e, "response", None), "headers", {}).get("retry-after")
+    if retry_after:
+        try: delay = max(delay, float(retry_after))
+        except ValueError: pass
+    return delay
+
+
+def with_retries(fn, retries: int = HTTP_MAX_RETRIES, base: float = 0.5, cap: float = 20.0):
+    for attempt in range(retries + 1):
+        try:
+            return fn()
+        except Exception as e:
+            if attempt == retries or not retryable(e): raise
+            time.sleep(_backoff(e, attempt, base, cap))
+
+
+async def awith_retries(fn, retries: int = HTTP_MAX_RETRIES, base: float = 0.5, cap: float = 20.0):
+    for attempt in range(retries + 1):
+        try:
+            return await fn()
+        except Exception as e:
+            if attempt == retries or not retryable(e): raise
+            await asyncio.sleep(_backoff(e, attempt, base, cap))
+
+
+def metrics() -> dict:
+    with _lock:
+        out = {g: {n: dict(v) for n, v in d.items()} for g, d in _stats.items()}
+    for g in ("http", "async_http"):
+        for v in out.get(g, {}).values():
+            v["reused"] = v.get("requests", 0) - v.get("connections", 0)
+    out["neo4j_drivers"] = len(_drivers)
+    return out
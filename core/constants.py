@@ -1,3 +1,126 @@
+import os
+
 EMBED_DIM = 1536
 CHUNK_TOKENS = 1000
 CHUNK_OVERLAP = 150
+# Chunk on paragraph/heading boundaries of the extracted text where they fit the token budget.
+CHUNK_RESPECT_BLOCKS = os.getenv("OPENSCOUT_CHUNK_RESPECT_BLOCKS", "1") == "1"
+# Source passages in the synthesis prompt are packed into at most this many tokens (fewer when the model's
+# context window minus the answer budget is smaller), shared across hits by rerank score.
+CONTEXT_TOKENS = int(os.getenv("OPENSCOUT_CONTEXT_TOKENS", "3000"))
+# Ask providers to cache the static prompt prefix (Anthropic cache_control, OpenAI prompt_cache_key).
+PROMPT_CACHE = os.getenv("OPENSCOUT_PROMPT_CACHE", "1") == "1"
+# Groq's OpenAI-compatible API; point it at a local stub for tests and benchmarks.
+GROQ_BASE_URL = os.getenv("OPENSCOUT_GROQ_BASE_URL", "https://api.groq.com/openai/v1").rstrip("/")
+
+# On-disk embedding cache keyed by (model, sha256(chunk text)); least-recently-used eviction once full.
+EMBED_CACHE_DIR = os.getenv("OPENSCOUT_EMBED_CACHE_DIR", ".cache/embeddings")
+EMBED_CACHE_BYTES = int(os.getenv("OPENSCOUT_EMBED_CACHE_BYTES", str(512 * 1024 * 1024)))
+EMBED_CACHE_TTL = int(os.getenv("OPENSCOUT_EMBED_CACHE_TTL", str(30 * 24 * 3600)))  # seconds
+
+# Embedding requests are split into batches by token budget and sent concurrently.
+EMBED_BATCH_TOKENS = int(os.getenv("OPENSCOUT_EMBED_BATCH_TOKENS", "100000"))
+EMBED_BATCH_SIZE = int(os.getenv("OPENSCOUT_EMBED_BATCH_SIZE", "256"))
+EMBED_MAX_INPUT_TOKENS = 8191  # per-input limit of the OpenAI embedding models
+EMBED_CONCURRENCY = int(os.getenv("OPENSCOUT_EMBED_CONCURRENCY", "4"))
+EMBED_MAX_RETRIES = int(os.getenv("OPENSCOUT_EMBED_MAX_RETRIES", "5"))
+
+# FAISS index type: "flat" (exact), "ivfpq" or "hnsw". ANN types are built from the flat index
+# once it holds INDEX_TRAIN_MIN vectors (IVF-PQ also needs ~39 training points per centroid).
+INDEX_TYPE = os.getenv("OPENSCOUT_INDEX_TYPE", "flat").lower()
+INDEX_TRAIN_MIN = int(os.getenv("OPENSCOUT_INDEX_TRAIN_MIN", "10000"))
+IVF_NLIST = int(os.getenv("OPENSCOUT_IVF_NLIST", "256"))
+IVF_PQ_M = int(os.getenv("OPENSCOUT_IVF_PQ_M", "64"))  # sub-quantizers; must divide EMBED_DIM
+IVF_NPROBE = int(os.getenv("OPENSCOUT_IVF_NPROBE", "16"))
+HNSW_M = int(os.getenv("OPENSCOUT_HNSW_M", "32"))
+HNSW_EF_CONSTRUCTION = int(os.getenv("OPENSCOUT_HNSW_EF_CONSTRUCTION", "200"))
+HNSW_EF_SEARCH = int(os.getenv("OPENSCOUT_HNSW_EF_SEARCH", "64"))
+
+# New vectors go to a write-ahead segment next to the index; it is folded into the main file in the
+# background once it holds this many vectors.
+WAL_COMPACT_VECTORS = int(os.getenv("OPENSCOUT_WAL_COMPACT_VECTORS", "2000"))
+# Map the main index file read-only instead of loading it into each process's heap (shared page cache).
+INDEX_MMAP = os.getenv("OPENSCOUT_INDEX_MMAP", "0") == "1"
+
+# Result diversification in faiss_store.search: candidates closer than this cosine to an already chosen
+# hit are near-duplicates; 0 disables the per-domain cap and MMR (lambda near 1 favours relevance).
+SEARCH_DUP_THRESHOLD = float(os.getenv("OPENSCOUT_SEARCH_DUP_THRESHOLD", "0.97"))
+SEARCH_MAX_PER_DOMAIN = int(os.getenv("OPENSCOUT_SEARCH_MAX_PER_DOMAIN", "0"))
+SEARCH_MMR_LAMBDA = float(os.getenv("OPENSCOUT_SEARCH_MMR_LAMBDA", "0"))
+
+# Serve chunk lookups from the memory-mapped side store (built by `python -m core.cli build-side-store`).
+SIDE_STORE = os.getenv("OPENSCOUT_SIDE_STORE", "0") == "1"
+SIDE_STORE_DIR = os.getenv("OPENSCOUT_SIDE_STORE_DIR", "chunks.side")
+
+# Streaming graph mode: pages are chunked/embedded as they arrive and retrieval starts once this share
+# of the search results has been fetched or the deadline passes. Pages still downloading then miss this
+# query's retrieval; they finish and are indexed in the background for later queries.
+STREAM_PIPELINE = os.getenv("OPENSCOUT_STREAM_PIPELINE", "1") == "1"
+STREAM_MIN_FRACTION = float(os.getenv("OPENSCOUT_STREAM_MIN_FRACTION", "0.75"))
+STREAM_DEADLINE_S = float(os.getenv("OPENSCOUT_STREAM_DEADLINE_S", "8"))
+
+# In-process LRU of query embeddings, keyed by (model, whitespace-normalized query).
+QUERY_CACHE_SIZE = int(os.getenv("OPENSCOUT_QUERY_CACHE_SIZE", "1024"))
+
+# Shared HTTP clients (core/clients.py): default timeouts, pool size and retries for API calls.
+HTTP_TIMEOUT = float(os.getenv("OPENSCOUT_HTTP_TIMEOUT", "60"))
+HTTP_CONNECT_TIMEOUT = float(os.getenv("OPENSCOUT_HTTP_CONNECT_TIMEOUT", "5"))
+HTTP_MAX_RETRIES = int(os.getenv("OPENSCOUT_HTTP_MAX_RETRIES", "2"))
+HTTP_POOL_SIZE = int(os.getenv("OPENSCOUT_HTTP_POOL_SIZE", "20"))
+CLIENT_CACHE_SIZE = int(os.getenv("OPENSCOUT_CLIENT_CACHE_SIZE", "32"))  # SDK clients / neo4j drivers kept per key
+
+# Page fetching: one pooled client, capped in total and per host; bodies stop at FETCH_MAX_BYTES.
+# Pages with ETag/Last-Modified are kept (extracted) in an on-disk cache and revalidated with conditional GETs.
+FETCH_CONCURRENCY = int(os.getenv("OPENSCOUT_FETCH_CONCURRENCY", "16"))
+FETCH_PER_HOST = int(os.getenv("OPENSCOUT_FETCH_PER_HOST", "4"))
+FETCH_TIMEOUT = float(os.getenv("OPENSCOUT_FETCH_TIMEOUT", "15"))
+FETCH_MAX_BYTES = int(os.getenv("OPENSCOUT_FETCH_MAX_BYTES", str(5 * 1024 * 1024)))
+HTTP_CACHE_DIR = os.getenv("OPENSCOUT_HTTP_CACHE_DIR", ".cache/http")
+HTTP_CACHE_BYTES = int(os.getenv("OPENSCOUT_HTTP_CACHE_BYTES", str(256 * 1024 * 1024)))
+HTTP_CACHE_TTL = int(os.getenv("OPENSCOUT_HTTP_CACHE_TTL", str(7 * 24 * 3600)))  # seconds
+
+# HTML extraction runs in a process pool (0 = a thread of the fetch loop's process); extracted text is
+# cached by URL + body hash.
+EXTRACT_WORKERS = int(os.getenv("OPENSCOUT_EXTRACT_WORKERS", str(min(4, os.cpu_count() or 1))))
+EXTRACT_CACHE_DIR = os.getenv("OPENSCOUT_EXTRACT_CACHE_DIR", ".cache/extract")
+EXTRACT_CACHE_BYTES = int(os.getenv("OPENSCOUT_EXTRACT_CACHE_BYTES", str(256 * 1024 * 1024)))
+
+# Cross-encoder reranking. Backend "torch", "int8" (dynamic int8 quantization of the torch model) or "onnx"
+# (ONNX Runtime; RERANK_ONNX_FILE selects e.g. a quantized export). Reranking is skipped when the top
+# retrieval score leads the next one by at least RERANK_SKIP_GAP (0 = always rerank).
+RERANK_MODEL = os.getenv("OPENSCOUT_RERANK_MODEL", "cross-encoder/ms-marco-MiniLM-L-6-v2")
+RERANK_BACKEND = os.getenv("OPENSCOUT_RERANK_BACKEND", "torch").lower()
+RERANK_ONNX_FILE = os.getenv("OPENSCOUT_RERANK_ONNX_FILE", "")
+RERANK_MAX_LENGTH = int(os.getenv("OPENSCOUT_RERANK_MAX_LENGTH", "256"))  # query + passage tokens
+RERANK_BATCH_SIZE = int(os.getenv("OPENSCOUT_RERANK_BATCH_SIZE", "16"))
+RERANK_CACHE_SIZE = int(os.getenv("OPENSCOUT_RERANK_CACHE_SIZE", "4096"))
+RERANK_SKIP_GAP = float(os.getenv("OPENSCOUT_RERANK_SKIP_GAP", "0"))
+
+# Semantic answer cache: a question at least ANSWER_CACHE_THRESHOLD cosine-similar to one answered within
+# ANSWER_CACHE_TTL seconds (same LLM and answer mode, sources unchanged) is served without the pipeline.
+ANSWER_CACHE = os.getenv("OPENSCOUT_ANSWER_CACHE", "1") == "1"
+ANSWER_CACHE_PATH = os.getenv("OPENSCOUT_ANSWER_CACHE_PATH", "answers.sqlite")
+ANSWER_CACHE_TTL = int(os.getenv("OPENSCOUT_ANSWER_CACHE_TTL", str(6 * 3600)))
+ANSWER_CACHE_THRESHOLD = float(os.getenv("OPENSCOUT_ANSWER_CACHE_THRESHOLD", "0.95"))
+
+# Web search results (Tavily / MCP) are cached per (provider, normalized query, k) for this many seconds.
+SEARCH_CACHE_TTL = int(os.getenv("OPENSCOUT_SEARCH_CACHE_TTL", "600"))
+SEARCH_CACHE_SIZE = int(os.getenv("OPENSCOUT_SEARCH_CACHE_SIZE", "2048"))
+
+# Headless query server (python -m core.server). At most SERVER_CONCURRENCY pipelines run at once per
+# process; up to SERVER_QUEUE more requests wait for a slot, beyond that requests get 503 + Retry-After.
+SERVER_HOST = os.getenv("OPENSCOUT_SERVER_HOST", "127.0.0.1")
+SERVER_PORT = int(os.getenv("OPENSCOUT_SERVER_PORT", "8000"))
+SERVER_WORKERS = int(os.getenv("OPENSCOUT_SERVER_WORKERS", "1"))  # processes
+SERVER_CONCURRENCY = int(os.getenv("OPENSCOUT_SERVER_CONCURRENCY", "8"))
+SERVER_QUEUE = int(os.getenv("OPENSCOUT_SERVER_QUEUE", "32"))
+SERVER_QUEUE_TIMEOUT = float(os.getenv("OPENSCOUT_SERVER_QUEUE_TIMEOUT", "30"))  # seconds waiting for a slot
+
+# Tracing: per-request spans and counters as one JSON line per query (TRACE_LOG file, else the log) and
+# process totals in Prometheus text format (/metrics on core.server; METRICS_FILE is rewritten after each
+# request). PROFILE = "cprofile" or "pyinstrument" profiles each request into PROFILE_DIR.
+TRACE = os.getenv("OPENSCOUT_TRACE", "1") == "1"
+TRACE_LOG = os.getenv("OPENSCOUT_TRACE_LOG", "")
+METRICS_FILE = os.getenv("OPENSCOUT_METRICS_FILE", "")
+PROFILE = os.getenv("OPENSCOUT_PROFILE", "").lower()
+PROFILE_DIR = os.getenv("OPENSCOUT_PROFILE_DIR", ".cache/profiles")
@@ -1,7 +1,21 @@
-import os
+import os, threading
+from collections import OrderedDict
+from concurrent.futures import Future, ThreadPoolExecutor
 import numpy as np
+import tiktoken
+from diskcache import Cache
 from openai import OpenAI
-from .faiss_store import l2_normalize
+from .constants import (EMBED_CACHE_DIR, EMBED_CACHE_BYTES, EMBED_CACHE_TTL, EMBED_BATCH_TOKENS, EMBED_BATCH_SIZE,
+                        EMBED_MAX_INPUT_TOKENS, EMBED_CONCURRENCY, EMBED_MAX_RETRIES, QUERY_CACHE_SIZE)
+from .clients import http_client, sdk_client, with_retries
+from .faiss_store import l2_normalize, text_hash
+from . import trace
+
+_cache = None
+_enc = None
+_query_cache: OrderedDict = OrderedDict()  # (model, normalized query) -> vector, most recent last
+_query_lock = threading.Lock()
+_query_inflight: dict = {}  # cache key -> Future of an embedding in progress
 
 
 def _client(api_key: str | None):
@@ -12,14 +26,130 @@ def _client(api_key: str | None):
         raise RuntimeError(
             "OpenAI API key not provided. Set OPENAI_API_KEY in .env or paste it in the sidebar."
         )
-    return OpenAI(api_key=key)
+    # retries are handled per batch below, with backoff shared across the concurrent requests
+    return sdk_client("openai-embed", key, lambda: OpenAI(api_key=key, max_retries=0, http_client=http_client("openai")))
+
+
+def _encoding():
+    global _enc
+    if _enc is None:
+        _enc = tiktoken.get_encoding("cl100k_base")  # tokenizer of the text-embedding-3 models
+    return _enc
+
+
+def _get_cache() -> Cache:
+    global _cache
+    if _cache is None:
+        _cache = Cache(EMBED_CACHE_DIR, size_limit=EMBED_CACHE_BYTES, eviction_policy="least-recently-used")
+    return _cache
+
+
+def _batches(token_counts, max_tokens: int = EMBED_BATCH_TOKENS, max_items: int = EMBED_BATCH_SIZE):
+    """Group consecutive input positions so each batch stays within the token and item limits."""
+    out, cur, total = [], [], 0
+    for i, n in enumerate(token_counts):
+        if cur and (total + n > max_tokens or len(cur) >= max_items):
+            out.append(cur); cur, total = [], 0
+        cur.append(i); total += n
+    if cur: out.append(cur)
+    return out
+
+
+def embed_batched(texts, embed_fn, max_tokens: int = EMBED_BATCH_TOKENS, max_items: int = EMBED_BATCH_SIZE,
+                  concurrency: int = EMBED_CONCURRENCY) -> np.ndarray:
+    """Embed `texts` with `embed_fn(list[str]) -> array-like` in token-bounded batches, run concurrently.
+
+    Inputs longer than the model limit are truncated. Failed batches are retried on 429/5xx with
+    jittered exponential backoff; rows of the result follow the order of `texts`.
+    """
+    enc = _encoding()
+    texts, counts = list(texts), []
+    for i, t in enumerate(texts):
+        toks = enc.encode(t, disallowed_special=())
+        if len(toks) > EMBED_MAX_INPUT_TOKENS:
+            toks = toks[:EMBED_MAX_INPUT_TOKENS]
+            texts[i] = enc.decode(toks)
+        counts.append(max(1, len(toks)))
+    batches = _batches(counts, max_tokens, max_items)
+    trace.count("embed.texts", len(texts)); trace.count("embed.tokens", sum(counts)); trace.count("embed.requests", len(batches))
+    run = lambda b: np.asarray(with_retries(lambda: embed_fn([texts[i] for i in b]), retries=EMBED_MAX_RETRIES),
+                               dtype=np.float32)
+    if len(batches) <= 1 or concurrency <= 1:
+        parts = [run(b) for b in batches]
+    else:
+        with ThreadPoolExecutor(max_workers=min(concurrency, len(batches))) as pool:
+            parts = list(pool.map(run, batches))
+    return np.vstack(parts) if parts else np.zeros((0, 0), dtype=np.float32)
+
+
+def _embed_remote(texts, api_key: str | None, model: str) -> np.ndarray:
+    client = _client(api_key)
+    def call(batch):
+        res = client.embeddings.create(model=model, input=batch)
+        return [d.embedding for d in sorted(res.data, key=lambda d: d.index)]
+    return embed_batched(texts, call)
 
 
 def embed_texts_openai(texts, api_key: str | None = None, model="text-embedding-3-small"):
-    res = _client(api_key).embeddings.create(model=model, input=texts)
-    X = np.array([d.embedding for d in res.data], dtype=np.float32)
-    return l2_normalize(X)
+    """Embed texts, serving previously seen (model, text) pairs from the on-disk cache.
+
+    Only cache misses are sent to the API; duplicate texts within one call are embedded once.
+    """
+    texts = list(texts)
+    cache = _get_cache()
+    keys = [(model, text_hash(t)) for t in texts]
+    vecs: list = [None] * len(texts)
+    missing: dict = {}  # cache key -> positions in `texts`
+    for i, k in enumerate(keys):
+        hit = cache.get(k)
+        if hit is not None:
+            vecs[i] = np.frombuffer(hit, dtype=np.float32)
+        else:
+            missing.setdefault(k, []).append(i)
+    trace.count("cache.embed.hit", len(texts) - sum(len(v) for v in missing.values()))
+    trace.count("cache.embed.miss", len(missing))
+    if missing:
+        order = list(missing)
+        with trace.span("embed.remote"):
+            X = _embed_remote([texts[missing[k][0]] for k in order], api_key, model)
+        for k, v in zip(order, X):
+            cache.set(k, v.tobytes(), expire=EMBED_CACHE_TTL)
+            for i in missing[k]: vecs[i] = v
+    if not vecs:
+        return np.zeros((0, 0), dtype=np.float32)
+    return l2_normalize(np.vstack(vecs).astype(np.float32))
+
+
+def _normalize_query(text: str) -> str:
+    """Cache key only: runs of whitespace don't change the embedding much, but case can ("US" vs "us")."""
+    return " ".join(text.split())
 
 
 def embed_one_openai(text, api_key: str | None = None, model="text-embedding-3-small"):
-    return embed_texts_openai([text], api_key, model=model)[0]
+    """Embed a single query; repeated queries in this process are served from an in-memory LRU, and concurrent
+    callers for the same query (the answer-cache lookup and the graph) share one request."""
+    key = (model, _normalize_query(text))
+    with _query_lock:
+        if key in _query_cache:
+            _query_cache.move_to_end(key)
+            trace.count("cache.query_vec.hit")
+            return _query_cache[key]
+        fut = _query_inflight.get(key)
+        owner = fut is None
+        if owner: fut = _query_inflight[key] = Future()
+    if not owner:
+        trace.count("cache.query_vec.coalesced")
+        return fut.result()
+    trace.count("cache.query_vec.miss")
+    try:
+        vec = embed_texts_openai([text], api_key, model=model)[0]
+    except BaseException as e:
+        with _query_lock: _query_inflight.pop(key, None)
+        fut.set_exception(e)
+        raise
+    with _query_lock:
+        _query_cache[key] = vec
+        while len(_query_cache) > QUERY_CACHE_SIZE: _query_cache.popitem(last=False)
+        _query_inflight.pop(key, None)
+    fut.set_result(vec)
+    return vec
@@ -1,69 +1,560 @@
-import os, sqlite3, faiss, numpy as np, time
-import streamlit as st
-from .constants import EMBED_DIM
+import os, faiss, numpy as np, time, hashlib, struct, threading
+from contextlib import contextmanager, nullcontext
+from loguru import logger
+try:
+    import fcntl
+except ImportError:  # Windows: no cross-process locking, run a single writer process
+    fcntl = None
+from .chunk_db import ChunkDB, text_hash
+from .side_store import SideStore
+from . import trace
+from .constants import (EMBED_DIM, INDEX_TYPE, INDEX_TRAIN_MIN, IVF_NLIST, IVF_PQ_M, IVF_NPROBE,
+                        HNSW_M, HNSW_EF_CONSTRUCTION, HNSW_EF_SEARCH, WAL_COMPACT_VECTORS, INDEX_MMAP,
+                        SEARCH_DUP_THRESHOLD, SEARCH_MAX_PER_DOMAIN, SEARCH_MMR_LAMBDA,
+                        SIDE_STORE, SIDE_STORE_DIR)
+
+INDEX_KINDS = ("flat", "ivfpq", "hnsw")
+
+
+def build_index(kind: str, X: np.ndarray | None = None, ids: np.ndarray | None = None, d: int = EMBED_DIM):
+    """Create an ID-mapped inner-product index of `kind`, training it on X and adding (X, ids) if given."""
+    if kind == "flat":
+        sub = faiss.IndexFlatIP(d)
+    elif kind == "hnsw":
+        sub = faiss.IndexHNSWFlat(d, HNSW_M, faiss.METRIC_INNER_PRODUCT)
+        sub.hnsw.efConstruction = HNSW_EF_CONSTRUCTION
+    elif kind == "ivfpq":
+        if X is None or len(X) < min_train_size("ivfpq"):
+            raise ValueError(f"IVF-PQ needs at least {min_train_size('ivfpq')} vectors to train")
+        sub = faiss.IndexIVFPQ(faiss.IndexFlatIP(d), d, IVF_NLIST, IVF_PQ_M, 8, faiss.METRIC_INNER_PRODUCT)
+        sub.train(X.astype(np.float32))
+        sub.nprobe = IVF_NPROBE
+    else:
+        raise ValueError(f"Unknown index type {kind!r}; expected one of {INDEX_KINDS}")
+    index = faiss.IndexIDMap(sub)
+    if X is not None and len(X):
+        index.add_with_ids(X.astype(np.float32), ids.astype(np.int64))
+    return index
+
+
+def min_train_size(kind: str) -> int:
+    if kind == "ivfpq":
+        # k-means wants ~39 points per centroid, both for the coarse lists and the 256-entry PQ codebooks
+        return max(INDEX_TRAIN_MIN, 39 * max(IVF_NLIST, 256))
+    return INDEX_TRAIN_MIN if kind != "flat" else 0
+
+
+def index_kind(index) -> str:
+    if isinstance(index, VectorIndex): index = index.index
+    sub = faiss.downcast_index(index.index if hasattr(index, "id_map") else index)
+    if isinstance(sub, faiss.IndexHNSW): return "hnsw"
+    if isinstance(sub, faiss.IndexIVF): return "ivfpq"
+    return "flat"
+
+
+def all_vectors(index):
+    """Return (X, ids) for every vector held by an ID-mapped index, without re-embedding anything."""
+    if isinstance(index, VectorIndex): return index.all_vectors()
+    sub = faiss.downcast_index(index.index)
+    if isinstance(sub, faiss.IndexIVF):
+        sub.make_direct_map()  # IVF lists need a direct map before reconstruct_n; PQ codes decode lossily
+    ids = faiss.vector_to_array(index.id_map).astype(np.int64)
+    X = sub.reconstruct_n(0, sub.ntotal) if sub.ntotal else np.zeros((0, index.d), dtype=np.float32)
+    return X, ids
+
+
+def migrate_index(index, kind: str):
+    """Rebuild `index` as `kind` from the vectors it already stores."""
+    X, ids = all_vectors(index)
+    return build_index(kind, X, ids, d=index.d)
+
+
+_WAL_MAGIC = b"OSWL"
+_WAL_HEADER = struct.Struct("<4sqi")  # magic, n vectors, dim; followed by n int64 ids and n*dim float32
+
+
+def write_index_atomic(index, path: str):
+    """Write to a temp file, fsync, then rename over `path` so readers never see a partial index."""
+    tmp = f"{path}.tmp{os.getpid()}"
+    faiss.write_index(index, tmp)
+    with open(tmp, "rb") as f: os.fsync(f.fileno())
+    os.replace(tmp, path)
+    _fsync_dir(path)
+
+
+def _write_bytes_atomic(data, path: str):
+    tmp = f"{path}.tmp{os.getpid()}"
+    with open(tmp, "wb") as f:
+        f.write(data); f.flush(); os.fsync(f.fileno())
+    os.replace(tmp, path)
+    _fsync_dir(path)
+
+
+def _fsync_dir(path: str):
+    try:
+        fd = os.open(os.path.dirname(os.path.abspath(path)), os.O_RDONLY)
+    except OSError:
+        return  # not supported on this platform (e.g. Windows)
+    try: os.fsync(fd)
+    except OSError: pass
+    finally: os.close(fd)
+
+
+@contextmanager
+def _flock(path: str, exclusive: bool = True, blocking: bool = True):
+    """Cross-process advisory lock on `path`; yields False if non-blocking and already held."""
+    if fcntl is None:
+        yield True
+        return
+    with open(path, "a+b") as f:
+        try:
+            fcntl.flock(f, (fcntl.LOCK_EX if exclusive else fcntl.LOCK_SH) | (0 if blocking else fcntl.LOCK_NB))
+        except BlockingIOError:
+            yield False
+            return
+        try: yield True
+        finally: fcntl.flock(f, fcntl.LOCK_UN)
+
+
+def _ino(path: str):
+    """Identity of a published file; a new generation is a new inode (mtime guards against inode reuse)."""
+    try:
+        st_ = os.stat(path)
+    except FileNotFoundError:
+        return None
+    return (st_.st_dev, st_.st_ino, st_.st_mtime_ns)
+
+
+def read_wal(path: str, offset: int = 0):
+    """Return ([(ids, X), ...], end) for a write-ahead segment from `offset`, stopping at a torn tail record."""
+    records, good = [], offset
+    if not os.path.exists(path): return records, good
+    with open(path, "rb") as f:
+        f.seek(offset)
+        while True:
+            head = f.read(_WAL_HEADER.size)
+            if len(head) < _WAL_HEADER.size: break
+            magic, n, d = _WAL_HEADER.unpack(head)
+            body = f.read(n * 8 + n * d * 4)
+            if magic != _WAL_MAGIC or len(body) < n * 8 + n * d * 4: break
+            ids = np.frombuffer(body[:n * 8], dtype=np.int64)
+            records.append((ids, np.frombuffer(body[n * 8:], dtype=np.float32).reshape(n, d)))
+            good = f.tell()
+    return records, good
+
+
+def read_index_file(path: str, mmap: bool = False):
+    """Read an index from disk; with mmap, vectors stay in the (shared) OS page cache, read-only."""
+    if not mmap:
+        return faiss.read_index(path)
+    flag = getattr(faiss, "IO_FLAG_MMAP_IFC", None)  # zero-copy mapping, FAISS >= 1.10
+    if flag is None: flag = faiss.IO_FLAG_MMAP | faiss.IO_FLAG_READ_ONLY
+    return faiss.read_index(path, flag)
+
+
+class VectorIndex:
+    """The live FAISS index: a main ("base") index plus a small exact delta of vectors added since it was written.
+
+    New vectors are appended to a write-ahead segment (`<path>.wal`) and the in-memory delta rather than
+    rewriting the whole index; `maybe_compact` folds them into a new generation of the main file in a
+    background thread and publishes it with an atomic rename. With `mmap=True` the main file is mapped
+    read-only so worker processes share its pages; every process tails the segment and picks up newly
+    published generations on its next search or add. Unknown attributes fall through to the base index.
+    """
+    def __init__(self, index, target_kind: str = INDEX_TYPE, path: str | None = None, mmap: bool = False):
+        self.index = index
+        self.delta = build_index("flat", d=index.d)
+        self.target_kind = target_kind
+        self.path = path
+        self.mmap = mmap
+        self.wal_path = f"{path}.wal" if path else None
+        self._lock = threading.RLock()
+        self._compactor: threading.Thread | None = None
+        self._base_ino = _ino(path) if path else None
+        self._base_ids = None  # sorted ids of the base generation, built on first use
+        self._wal_offset = 0
+
+    def __getattr__(self, name):
+        return getattr(self.__dict__["index"], name)
+
+    @classmethod
+    def open(cls, path: str = "faiss_index.bin", target_kind: str = INDEX_TYPE, mmap: bool = INDEX_MMAP):
+        """Load the current generation of the main index and replay the write-ahead segment."""
+        vi = cls(load_index(path, mmap=mmap), target_kind, path, mmap)
+        with vi._lock, _flock(f"{path}.lock", exclusive=True):
+            records, good = read_wal(vi.wal_path)
+            if os.path.exists(vi.wal_path) and os.path.getsize(vi.wal_path) != good:
+                with open(vi.wal_path, "r+b") as f: f.truncate(good)  # torn tail from a crashed writer
+            vi._apply(records, good)
+        return vi
+
+    @property
+    def ntotal(self) -> int:
+        return self.index.ntotal + self.delta.ntotal
+
+    @property
+    def kind(self) -> str:
+        return index_kind(self.index)
+
+    @property
+    def wal_vectors(self) -> int:
+        return self.delta.ntotal
+
+    def _set_base(self, index):
+        self.index, self._base_ids = index, None
+
+    def _in_base(self, ids: np.ndarray) -> np.ndarray:
+        if self._base_ids is None:
+            self._base_ids = np.sort(faiss.vector_to_array(self.index.id_map).astype(np.int64))
+        base = self._base_ids
+        if not len(base): return np.zeros(len(ids), dtype=bool)
+        return base[np.minimum(np.searchsorted(base, ids), len(base) - 1)] == ids
+
+    def _apply(self, records, end):
+        """Add segment records to the delta. Ids the base already holds are skipped: a crash after compact()
+        published a new base but before it trimmed the segment leaves records that base already covers."""
+        for ids, X in records:
+            fresh = ~self._in_base(ids)
+            if fresh.all(): self.delta.add_with_ids(X, ids)
+            elif fresh.any(): self.delta.add_with_ids(np.ascontiguousarray(X[fresh]), np.ascontiguousarray(ids[fresh]))
+        self._wal_offset = end
+
+    def _sync(self):
+        """Catch up with the files on disk; caller holds the file lock. A new base generation comes with a
+        rewritten segment, so the delta is rebuilt from scratch; otherwise only the segment tail is read."""
+        base_ino = _ino(self.path)
+        if base_ino != self._base_ino:
+            self._set_base(load_index(self.path, mmap=self.mmap))
+            self._base_ino = base_ino
+            self.delta.reset()
+            self._wal_offset = 0
+        self._apply(*read_wal(self.wal_path, self._wal_offset))
+
+    def _refresh(self):
+        if not self.path: return
+        wal_size = os.path.getsize(self.wal_path) if os.path.exists(self.wal_path) else 0
+        if _ino(self.path) == self._base_ino and wal_size == self._wal_offset:
+            return  # nothing new on disk: the common case costs two stat calls
+        with _flock(f"{self.path}.lock", exclusive=False):
+            self._sync()
+
+    def ids(self) -> np.ndarray:
+        with self._lock:
+            self._refresh()
+            return np.concatenate([faiss.vector_to_array(self.index.id_map),
+                                   faiss.vector_to_array(self.delta.id_map)]).astype(np.int64)
+
+    def all_vectors(self):
+        with self._lock:
+            self._refresh()
+            base = self.index if not self.mmap else load_index(self.path)  # mapped indexes are read-only
+            Xb, ib = all_vectors(base)
+            Xd, idd = all_vectors(self.delta)
+        return np.vstack([Xb, Xd]), np.concatenate([ib, idd])
+
+    def add_with_ids(self, X, ids):
+        X, ids = np.ascontiguousarray(X, dtype=np.float32), np.ascontiguousarray(ids, dtype=np.int64)
+        with self._lock:
+            if not self.wal_path:
+                self.delta.add_with_ids(X, ids)
+                return
+            with _flock(f"{self.path}.lock", exclusive=True):
+                self._sync()  # read other writers' records first so our offset stays at the end
+                with open(self.wal_path, "ab") as f:
+                    f.write(_WAL_HEADER.pack(_WAL_MAGIC, len(ids), X.shape[1]))
+                    f.write(ids.tobytes()); f.write(X.tobytes())
+                    f.flush(); os.fsync(f.fileno())
+                    end = f.tell()
+            self.delta.add_with_ids(X, ids)
+            self._wal_offset = end
+
+    def needs_rebuild(self) -> bool:
+        return self.target_kind != self.kind and self.ntotal >= min_train_size(self.target_kind)
+
+    def compact(self, kind: str | None = None, drop=None, before_publish=None) -> bool:
+        """Write a new generation of the main file (base + delta, rebuilt as the target type when due) and
+        publish it atomically, then trim the segment (a crash in between is safe: replay skips the records the
+        new base holds). Only one process compacts at a time.
+        With `kind`, waits for a running compaction and always rebuilds as that type (migrate-index); with
+        `drop`, also waits, and rebuilds without the vectors of those ids. `before_publish(new)` sees the built
+        index before it is written; returning False abandons the compaction (migrate-index --report/--dry-run)."""
+        if not self.path: return False
+        wait = kind is not None or drop is not None
+        with _flock(f"{self.path}.compact.lock", exclusive=True, blocking=wait) as got:
+            if not got: return False
+            with self._lock:
+                self._refresh()
+                Xd, idd = all_vectors(self.delta)
+                covered, base_ino = self._wal_offset, self._base_ino
+            # the slow part (reading, training, serialising) runs without holding any lock
+            new = load_index(self.path) if base_ino else build_index("flat", d=self.index.d)
+            target = kind or self.target_kind
+            due = target != index_kind(new) and new.ntotal + len(idd) >= min_train_size(target)
+            if kind or due or drop is not None:
+                if not (kind or due): target = index_kind(new)  # dropping alone keeps the current type
+                Xb, ib = all_vectors(new)
+                X, ids = np.vstack([Xb, Xd]), np.concatenate([ib, idd])
+                if drop is not None:
+                    keep = ~np.isin(ids, drop)
+                    X, ids = X[keep], ids[keep]
+                new = build_index(target, X, ids, d=new.d)
+            elif len(idd):
+                new.add_with_ids(Xd, idd)
+            if before_publish is not None and before_publish(new) is False: return False
+            tmp = f"{self.path}.tmp{os.getpid()}"
+            write_index_atomic(new, tmp)
+            with self._lock, _flock(f"{self.path}.lock", exclusive=True):
+                os.replace(tmp, self.path)
+                rest = b""
+                if os.path.exists(self.wal_path):
+                    with open(self.wal_path, "rb") as f:
+                        f.seek(covered); rest = f.read()
+                _write_bytes_atomic(rest, self.wal_path)
+                _fsync_dir(self.path)
+                # adopt the new generation directly rather than re-reading it
+                self._set_base(load_index(self.path, mmap=True) if self.mmap else new)
+                self._base_ino = _ino(self.path)
+                self.delta.reset()
+                self._apply(*read_wal(self.wal_path))
+        return True
+
+    def maybe_compact(self, min_vectors: int = WAL_COMPACT_VECTORS, background: bool = True):
+        """Compact once the segment is large enough (or the index is due a rebuild), off the request path."""
+        if not self.path or (self.wal_vectors < min_vectors and not self.needs_rebuild()):
+            return
+        if not background:
+            return self.compact()
+        with self._lock:
+            if self._compactor and self._compactor.is_alive(): return
+            self._compactor = threading.Thread(target=self._compact_quietly, name="faiss-compact", daemon=True)
+            self._compactor.start()
+
+    def _compact_quietly(self):
+        try:
+            self.compact()
+        except Exception:
+            logger.exception("FAISS index compaction failed; vectors remain in the write-ahead segment")
+
+    def search_params(self, nprobe: int | None = None, ef_search: int | None = None):
+        kind = self.kind
+        if kind == "ivfpq": return faiss.SearchParametersIVF(nprobe=nprobe or IVF_NPROBE)
+        if kind == "hnsw": return faiss.SearchParametersHNSW(efSearch=ef_search or HNSW_EF_SEARCH)
+        return None
+
+    def search(self, q, n, nprobe: int | None = None, ef_search: int | None = None, with_vectors: bool = False):
+        """Top-n (scores, ids) over base + delta; with_vectors also returns the stored vectors (n x d per query),
+        reconstructed during the search itself so no second lookup by id is needed."""
+        with self._lock:
+            self._refresh()
+            params = self.search_params(nprobe, ef_search)
+            parts = [_search_idmap(self.index, q, n, params, with_vectors)]
+            if self.delta.ntotal:
+                parts.append(_search_idmap(self.delta, q, min(n, self.delta.ntotal), None, with_vectors))
+        if len(parts) == 1:
+            return parts[0] if with_vectors else parts[0][:2]
+        # merge the top-n lists by score; -1 padding sorts last
+        D, I = np.hstack([p[0] for p in parts]), np.hstack([p[1] for p in parts])
+        D = np.where(I < 0, -np.inf, D)
+        order = np.argsort(-D, axis=1, kind="stable")[:, :n]
+        D, I = np.take_along_axis(D, order, axis=1), np.take_along_axis(I, order, axis=1)
+        if not with_vectors: return D, I
+        R = np.concatenate([p[2] for p in parts], axis=1)
+        return D, I, np.take_along_axis(R, order[:, :, None], axis=1)
+
+
+def _search_idmap(index, q, n, params=None, with_vectors=False):
+    if not with_vectors:
+        D, I = index.search(q, n, params=params) if params else index.search(q, n)
+        return D, I
+    # IndexIDMap can't reconstruct by id, but its sub-index can reconstruct the positions it returns
+    sub = faiss.downcast_index(index.index)
+    D, P, R = sub.search_and_reconstruct(q, n, params=params) if params else sub.search_and_reconstruct(q, n)
+    id_map, I = faiss.vector_to_array(index.id_map), np.full(P.shape, -1, dtype=np.int64)
+    I[P >= 0] = id_map[P[P >= 0]]
+    return D, I, R
+
+
+def load_index(path: str = "faiss_index.bin", mmap: bool = False):
+    """Read a saved index, or create an empty one of the configured type."""
+    if not os.path.exists(path):
+        # IVF-PQ cannot be trained on an empty store; it starts flat and is built at compaction
+        return build_index("flat" if INDEX_TYPE == "ivfpq" else INDEX_TYPE)
+    index = read_index_file(path, mmap=mmap)
+    # If the loaded index doesn't support add_with_ids, wrap it in an ID map
+    if not hasattr(index, "add_with_ids") or not hasattr(index, "id_map"):
+        try:
+            index = faiss.IndexIDMap(index)
+        except Exception:
+            # final fallback: raise a helpful error
+            raise RuntimeError("Loaded FAISS index does not support add_with_ids and cannot be wrapped.")
+    return index
+
+
+def _writer_lock(index):
+    """Cross-process lock held by add_vectors from its row commit until the vectors are in the segment, and
+    by _reconcile, so no process mistakes another writer's just-committed rows for orphans."""
+    path = getattr(index, "path", None)
+    return _flock(f"{path}.write.lock", exclusive=True) if path else nullcontext()
+
+
+def _reconcile(index: VectorIndex, conn):
+    """Drop chunk rows whose vectors never reached disk (e.g. a crash between the SQLite commit and the
+    segment write), so the text-hash dedupe doesn't treat them as indexed. Only rows older than the last
+    durable index write are candidates, and nothing is dropped when there is no index file at all."""
+    if not index.path or not os.path.exists(index.path):
+        if conn.execute("SELECT 1 FROM chunks LIMIT 1").fetchone():
+            logger.warning(f"{index.path} is missing; chunk rows are kept. To rebuild from scratch, delete "
+                           f"chunks.sqlite and {index.path}.wal as well (the embedding cache avoids re-paying)")
+        return
+    with _writer_lock(index):
+        last = max(os.path.getmtime(p) for p in (index.path, index.wal_path) if os.path.exists(p))
+        rows = np.array([r[0] for r in conn.execute(
+            "SELECT id FROM chunks WHERE created_at < datetime(?, 'unixepoch')", (int(last),))], dtype=np.int64)
+        orphans = np.setdiff1d(rows, index.ids(), assume_unique=True)
+        if len(orphans):
+            logger.warning(f"Removing {len(orphans)} chunk rows with no vector in the FAISS index")
+            with conn:
+                conn.executemany("DELETE FROM chunks WHERE id=?", [(int(i),) for i in orphans])
+
+
+def _drop_duplicate_vectors(index: VectorIndex, conn):
+    """Remove the vectors of chunk rows that ChunkDB's schema migration deleted as duplicates (listed in
+    `dropped_ids`); otherwise every search spends overfetch slots on ids with no row behind them."""
+    ids = np.array([r[0] for r in conn.execute("SELECT id FROM dropped_ids")], dtype=np.int64)
+    if not len(ids): return
+    stale = np.intersect1d(ids, index.ids())
+    if len(stale):
+        logger.info(f"Removing {len(stale)} vectors of duplicate chunk rows from {index.path}")
+        if not index.compact(drop=stale): return
+    with conn:
+        conn.executemany("DELETE FROM dropped_ids WHERE id=?", [(int(i),) for i in ids])
+
+
+_store = None
+_store_lock = threading.Lock()
+
 
-@st.cache_resource
 def get_index_and_db():
+    """The process-wide (VectorIndex, ChunkDB) pair, opened on first use and shared by every caller."""
+    global _store
+    if _store is None:
+        with _store_lock:
+            if _store is None: _store = _open_store()
+    return _store
+
+
+def _open_store():
     idx_path, db_path = "faiss_index.bin", "chunks.sqlite"
-    # Use an IndexFlatIP wrapped in an IndexIDMap so we can add vectors with explicit ids.
-    # If a saved index exists, load it; if it doesn't support add_with_ids, wrap it.
-    index = faiss.IndexFlatIP(EMBED_DIM)
-    # wrap to provide add_with_ids / id lookups
-    try:
-        index = faiss.IndexIDMap(index)
-    except Exception:
-        pass
-    if os.path.exists(idx_path):
-        index = faiss.read_index(idx_path)
-        # If the loaded index doesn't support add_with_ids, wrap it in an ID map
-        if not hasattr(index, "add_with_ids"):
-            try:
-                index = faiss.IndexIDMap(index)
-            except Exception:
-                # final fallback: raise a helpful error
-                raise RuntimeError("Loaded FAISS index does not support add_with_ids and cannot be wrapped.")
-    conn = sqlite3.connect(db_path, check_same_thread=False)
-    conn.execute("""CREATE TABLE IF NOT EXISTS chunks(
-        id INTEGER PRIMARY KEY, url TEXT, title TEXT, ord INT,
-        text TEXT, domain TEXT, embedding_dim INT, created_at TEXT
-    );""")
+    index = VectorIndex.open(idx_path)
+    conn = ChunkDB(db_path)
+    if SIDE_STORE and SideStore.exists(SIDE_STORE_DIR):
+        conn.side_store = SideStore(SIDE_STORE_DIR)
+    _reconcile(index, conn)
+    _drop_duplicate_vectors(index, conn)
+    index.maybe_compact()
     return index, conn
 
 def save_index(index, path="faiss_index.bin"):
-    faiss.write_index(index, path)
+    """Persist the whole index synchronously; prefer `VectorIndex.maybe_compact` on the request path."""
+    if isinstance(index, VectorIndex) and index.path == path:
+        return index.compact()
+    write_index_atomic(migrate_index(index, index.kind) if isinstance(index, VectorIndex) else index, path)
 
 def l2_normalize(X: np.ndarray) -> np.ndarray:
     n = np.linalg.norm(X, axis=1, keepdims=True) + 1e-12
     return X / n
 
-def _max_id(conn): row = conn.execute("SELECT MAX(id) FROM chunks").fetchone(); return row[0] if row and row[0] else -1
+def stored_hashes(conn, hashes) -> set:
+    """Subset of `hashes` that already have a row (and therefore a vector) in the store."""
+    hashes, found = list(set(hashes)), set()
+    for i in range(0, len(hashes), 500):
+        part = hashes[i:i+500]
+        q = ",".join("?"*len(part))
+        found.update(r[0] for r in conn.execute(f"SELECT text_hash FROM chunks WHERE text_hash IN ({q})", part))
+    return found
+
+def _allocate_ids(conn, n):
+    if isinstance(conn, ChunkDB): return conn.allocate_ids(n)
+    row = conn.execute("SELECT MAX(id) FROM chunks").fetchone()
+    start = row[0] + 1 if row and row[0] is not None else 0
+    return list(range(start, start + n))
 
 def add_vectors(index, conn, X, metas):
-    start = _max_id(conn) + 1
-    ids = (start + np.arange(len(metas))).astype(np.int64)
-    index.add_with_ids(X.astype(np.float32), ids)
-    with conn:
-        for i, m in enumerate(metas):
-            conn.execute("""INSERT INTO chunks(id,url,title,ord,text,domain,embedding_dim,created_at)
-                            VALUES(?,?,?,?,?,?,?,datetime('now'))""",
-                         (int(ids[i]), m.get("url",""), m.get("title",""), m.get("ord",0),
-                          m.get("text",""), m.get("domain",""), X.shape[1]))
+    """Insert vectors and their chunk rows, skipping chunks whose text is already stored."""
+    hashes = [m.get("text_hash") or text_hash(m.get("text","")) for m in metas]
+    with getattr(conn, "write_lock", nullcontext()), _writer_lock(index):
+        seen = stored_hashes(conn, hashes)
+        keep = []
+        for i, h in enumerate(hashes):
+            if h in seen: continue
+            seen.add(h); keep.append(i)
+        if not keep: return np.zeros(0, dtype=np.int64)
+        X, metas, hashes = X[keep], [metas[i] for i in keep], [hashes[i] for i in keep]
+        ids = np.array(_allocate_ids(conn, len(metas)), dtype=np.int64)
+        # rows first, vectors second: a crash in between leaves rows that _reconcile drops on the next start
+        with conn:
+            conn.executemany("""INSERT INTO chunks(id,url,title,ord,text,domain,embedding_dim,created_at,text_hash)
+                                VALUES(?,?,?,?,?,?,?,datetime('now'),?)
+                                ON CONFLICT(url, ord, text_hash) DO NOTHING""",
+                             [(int(ids[i]), m.get("url",""), m.get("title",""), m.get("ord",0),
+                               m.get("text",""), m.get("domain",""), X.shape[1], hashes[i]) for i, m in enumerate(metas)])
+        index.add_with_ids(X.astype(np.float32), ids)
     return ids
 
 def fetch_by_ids(conn, ids):
     if not ids: return []
-    q = ",".join("?"*len(ids))
-    rows = conn.execute(f"SELECT id,url,title,ord,text,domain FROM chunks WHERE id IN ({q})", ids).fetchall()
-    m = {r[0]: r for r in rows}
-    out = []
-    for i in ids:
-        if i in m:
-            id_,url,title,ord_,text,dom = m[i]
-            out.append(dict(id=id_, url=url, title=title, ord=ord_, text=text, domain=dom))
-    return out
-
-def search(index, conn, qvec, k=6, overfetch=4):
+    side = getattr(conn, "side_store", None)
+    got, rest = side.fetch(ids) if side is not None else ({}, ids)
+    if rest:
+        q = ",".join("?"*len(rest))
+        rows = conn.execute(f"SELECT id,url,title,ord,text,domain FROM chunks WHERE id IN ({q})", rest).fetchall()
+        for id_,url,title,ord_,text,dom in rows:
+            got[id_] = dict(id=id_, url=url, title=title, ord=ord_, text=text, domain=dom)
+    return [got[i] for i in ids if i in got]
+
+def _select(hits, vecs, k, dup_threshold, max_per_domain, mmr_lambda):
+    """Pick k distinct hits from score-ordered candidates: drop repeated (url, ord) and identical text,
+    drop vectors within `dup_threshold` cosine of one already chosen, cap hits per domain, and if
+    `mmr_lambda` is set trade relevance against similarity to what is already chosen (MMR)."""
+    chosen, seen_pos, seen_text, per_dom = [], set(), set(), {}
+    pool = list(range(len(hits)))
+    while pool and len(chosen) < k:
+        if mmr_lambda and vecs is not None and chosen:
+            sim = (vecs[pool] @ vecs[chosen].T).max(axis=1)
+            rel = np.array([hits[i]["score"] for i in pool])
+            pick = pool[int(np.argmax(mmr_lambda * rel - (1 - mmr_lambda) * sim))]
+        else:
+            pick = pool[0]
+        pool.remove(pick)
+        h = hits[pick]
+        pos, txt = (h["url"], h["ord"]), hashlib.sha1(" ".join((h["text"] or "").split()).encode("utf-8")).digest()
+        if pos in seen_pos or txt in seen_text: continue
+        if max_per_domain and per_dom.get(h["domain"], 0) >= max_per_domain: continue
+        if vecs is not None and chosen and float((vecs[chosen] @ vecs[pick]).max()) >= dup_threshold: continue
+        chosen.append(pick); seen_pos.add(pos); seen_text.add(txt)
+        per_dom[h["domain"]] = per_dom.get(h["domain"], 0) + 1
+    return [hits[i] for i in chosen]
+
+def search(index, conn, qvec, k=6, overfetch=4, nprobe=None, ef_search=None,
+           dup_threshold=SEARCH_DUP_THRESHOLD, max_per_domain=SEARCH_MAX_PER_DOMAIN, mmr_lambda=SEARCH_MMR_LAMBDA):
+    """Top-k distinct chunks for `qvec`, each hit carrying its FAISS inner-product `score`.
+
+    The k*overfetch candidates are filtered (see _select) so k different passages come back even when
+    the same page was indexed more than once.
+    """
     q = l2_normalize(qvec.reshape(1,-1)).astype(np.float32)
-    scores, ids = index.search(q, k*overfetch)
-    ids = ids[0].tolist()
-    return fetch_by_ids(conn, ids)[:k]
+    vecs = None
+    with trace.span("faiss.search"):
+        if isinstance(index, VectorIndex):
+            scores, ids, vecs = index.search(q, k*overfetch, nprobe=nprobe, ef_search=ef_search, with_vectors=True)
+        else:
+            scores, ids = index.search(q, k*overfetch)
+    valid = ids[0] >= 0
+    ids, scores = ids[0][valid].tolist(), scores[0][valid].tolist()
+    trace.count("faiss.searches"); trace.count("faiss.candidates", len(ids))
+    hits = fetch_by_ids(conn, ids)
+    by_id = {i: (s, j) for j, (i, s) in enumerate(zip(ids, scores))}
+    for h in hits: h["score"] = by_id[h["id"]][0]
+    if vecs is not None:
+        vecs = l2_normalize(vecs[0][valid][[by_id[h["id"]][1] for h in hits]]) if hits else None
+    return _select(hits, vecs, k, dup_threshold, max_per_domain, mmr_lambda)
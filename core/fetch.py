@@ -1,19 +1,177 @@
-import httpx, trafilatura, asyncio, urllib.parse
+import httpx, trafilatura, asyncio, time, urllib.parse, threading, weakref, importlib.util, hashlib
+import multiprocessing as mp
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from diskcache import Cache
+from loguru import logger
+from .clients import async_http_client
+from . import trace
+from .constants import (FETCH_CONCURRENCY, FETCH_PER_HOST, FETCH_TIMEOUT, FETCH_MAX_BYTES, HTTP_CACHE_DIR,
+                        HTTP_CACHE_BYTES, HTTP_CACHE_TTL, EXTRACT_WORKERS, EXTRACT_CACHE_DIR, EXTRACT_CACHE_BYTES)
 
-async def _fetch_one(client, url):
+_HTML_TYPES = ("text/html", "application/xhtml+xml")
+_http_cache = None
+_fetchers: "weakref.WeakKeyDictionary" = weakref.WeakKeyDictionary()  # event loop -> _Fetcher
+_loop = None
+_loop_lock = threading.Lock()
+_extract_cache = None
+_pool = None
+_pool_lock = threading.Lock()
+
+
+def _get_http_cache() -> Cache:
+    global _http_cache
+    if _http_cache is None:
+        _http_cache = Cache(HTTP_CACHE_DIR, size_limit=HTTP_CACHE_BYTES, eviction_policy="least-recently-used")
+    return _http_cache
+
+
+def _get_extract_cache() -> Cache:
+    global _extract_cache
+    if _extract_cache is None:
+        _extract_cache = Cache(EXTRACT_CACHE_DIR, size_limit=EXTRACT_CACHE_BYTES, eviction_policy="least-recently-used")
+    return _extract_cache
+
+
+def _extract_pool(workers: int = EXTRACT_WORKERS):
+    global _pool
+    with _pool_lock:
+        if _pool is None and workers > 0:
+            # spawn: the parent runs the fetch loop thread, and forking a threaded process is unsafe
+            _pool = ProcessPoolExecutor(max_workers=workers, mp_context=mp.get_context("spawn"))
+        return _pool
+
+
+class _Fetcher:
+    """Pooled client plus global and per-host limits; bound to the event loop it was created on."""
+    def __init__(self):
+        http2 = importlib.util.find_spec("h2") is not None  # httpx only speaks HTTP/2 with the h2 extra
+        limits = httpx.Limits(max_connections=FETCH_CONCURRENCY, max_keepalive_connections=FETCH_CONCURRENCY)
+        self.client = async_http_client("fetch", follow_redirects=True, http2=http2, limits=limits,
+                                        timeout=FETCH_TIMEOUT, headers={"User-Agent": "OpenScout/1.0"})
+        self.slots = asyncio.Semaphore(FETCH_CONCURRENCY)
+        self.hosts: dict = {}
+
+    def host_slot(self, host: str) -> asyncio.Semaphore:
+        if host not in self.hosts: self.hosts[host] = asyncio.Semaphore(FETCH_PER_HOST)
+        return self.hosts[host]
+
+
+def _fetcher() -> _Fetcher:
+    loop = asyncio.get_running_loop()
+    f = _fetchers.get(loop)
+    if f is None: f = _fetchers[loop] = _Fetcher()
+    return f
+
+
+def run(coro):
+    """Run `coro` on a long-lived background loop so the pooled client (and its connections) outlive the call."""
+    global _loop
+    with _loop_lock:
+        if _loop is None:
+            _loop = asyncio.new_event_loop()
+            threading.Thread(target=_loop.run_forever, name="fetch-loop", daemon=True).start()
+    return asyncio.run_coroutine_threadsafe(trace.bind(coro), _loop).result()  # keep the caller's trace
+
+
+def _extract(url, html):
+    # one parse for both metadata and text (extract_metadata + extract would parse the tree twice)
+    doc = trafilatura.bare_extraction(html, url=url, with_metadata=True, include_comments=False, include_tables=False)
+    title = getattr(doc, "title", None) or ""
+    text = getattr(doc, "text", None) or ""
+    domain = urllib.parse.urlparse(url).netloc
+    return {"url": url, "title": title or url, "text": text, "domain": domain}
+
+
+async def _extract_async(url, body: bytes, encoding: str):
+    """Extract off the event loop, in the process pool (or a thread when EXTRACT_WORKERS=0).
+    Results are cached by URL + body hash, so an unchanged page is never parsed twice."""
+    cache = _get_extract_cache()
+    key = (url, hashlib.sha256(body).hexdigest())
+    page = cache.get(key)
+    trace.count("cache.extract.hit" if page is not None else "cache.extract.miss")
+    if page is not None: return page
+    html = body.decode(encoding, errors="replace")
+    pool = _extract_pool()
+    loop = asyncio.get_running_loop()
+    try:
+        page = await loop.run_in_executor(pool, _extract, url, html)
+    except BrokenProcessPool:
+        global _pool
+        with _pool_lock:
+            if _pool is pool: _pool = None  # a worker died; start a fresh pool next time
+        page = await asyncio.to_thread(_extract, url, html)
+    cache.set(key, page, expire=HTTP_CACHE_TTL)
+    return page
+
+
+def _empty(url, error):
+    return {"url": url, "title": url, "text": "", "domain": "", "error": error}
+
+
+async def _fetch_one(f: _Fetcher, url):
+    """Fetch and extract one page. Seen pages are revalidated with If-None-Match/If-Modified-Since, and a 304
+    returns the stored extraction. Bodies stop at FETCH_MAX_BYTES; non-HTML responses are not downloaded."""
+    cache = _get_http_cache()
+    entry = cache.get(url)
+    headers = {}
+    if entry:
+        if entry.get("etag"): headers["If-None-Match"] = entry["etag"]
+        if entry.get("last_modified"): headers["If-Modified-Since"] = entry["last_modified"]
+    host = urllib.parse.urlparse(url).netloc
     try:
-        r = await client.get(url, timeout=15)
-        r.raise_for_status()
-        html = r.text
-        title = ""
-        meta = trafilatura.extract_metadata(html)
-        if meta and getattr(meta, "title", None): title = meta.title
-        text = trafilatura.extract(html, include_comments=False, include_tables=False) or ""
-        domain = urllib.parse.urlparse(url).netloc
-        return {"url": url, "title": title or url, "text": text, "domain": domain}
-    except Exception:
-        return {"url": url, "title": url, "text": "", "domain": ""}
+        async with f.slots, f.host_slot(host):
+            async with f.client.stream("GET", url, headers=headers) as r:
+                if r.status_code == 304 and entry:
+                    trace.count("cache.http.revalidated"); trace.count("fetch.pages")
+                    cache.touch(url, expire=HTTP_CACHE_TTL)
+                    return dict(entry["page"], url=url)
+                r.raise_for_status()
+                ctype = r.headers.get("content-type", "").split(";")[0].strip().lower()
+                if ctype and ctype not in _HTML_TYPES:
+                    return _empty(url, f"skipped content-type {ctype}")
+                body = bytearray()
+                async for part in r.aiter_bytes():
+                    body += part
+                    if len(body) >= FETCH_MAX_BYTES:
+                        logger.debug("fetch {}: truncated at {} bytes", url, FETCH_MAX_BYTES)
+                        break
+                body, encoding = bytes(body[:FETCH_MAX_BYTES]), r.charset_encoding or "utf-8"
+                trace.count("fetch.bytes", len(body)); trace.count("fetch.pages")
+                validators = dict(etag=r.headers.get("etag"), last_modified=r.headers.get("last-modified"))
+                no_store = "no-store" in r.headers.get("cache-control", "").lower()
+        page = await _extract_async(url, body, encoding)
+        if (validators["etag"] or validators["last_modified"]) and not no_store:
+            cache.set(url, dict(validators, page=page), expire=HTTP_CACHE_TTL)
+        return page
+    except Exception as e:
+        logger.warning("fetch {} failed: {!r}", url, e)
+        trace.count("fetch.failed")
+        return _empty(url, repr(e))
+
 
 async def fetch_many(urls):
-    async with httpx.AsyncClient(follow_redirects=True, headers={"User-Agent":"OpenScout/1.0"}) as client:
-        return await asyncio.gather(*[_fetch_one(client,u) for u in urls])
+    f = _fetcher()
+    return await asyncio.gather(*[_fetch_one(f, u) for u in urls])
+
+async def iter_fetch(urls, min_count: int | None = None, deadline: float | None = None, keep: list | None = None):
+    """Yield pages in completion order. Stops once `min_count` pages have arrived or `deadline`
+    (a time.monotonic() value) passes. Downloads still running then are cancelled, or, if `keep` is a
+    list, appended to it as tasks for the caller to finish."""
+    f = _fetcher()
+    pending = {asyncio.ensure_future(_fetch_one(f, u)) for u in urls}
+    got = 0
+    stopped = False
+    try:
+        while pending and (min_count is None or got < min_count):
+            timeout = None if deadline is None else max(0.0, deadline - time.monotonic())
+            done, pending = await asyncio.wait(pending, timeout=timeout, return_when=asyncio.FIRST_COMPLETED)
+            if not done: break  # deadline reached
+            for t in done:
+                got += 1
+                yield t.result()
+        stopped = True
+    finally:
+        if stopped and keep is not None: keep.extend(pending)
+        else:
+            for t in pending: t.cancel()
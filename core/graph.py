@@ -1,12 +1,21 @@
+import asyncio, math, time
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import aclosing, contextmanager
+from langchain_core.runnables import RunnableLambda
+from loguru import logger
 from langgraph.graph import StateGraph, END
 from pydantic import BaseModel
 from typing import List, Dict, Callable
-from .chunk import chunk_text
+from .chunk import iter_chunks
 from .embed import embed_texts_openai, embed_one_openai
-from .faiss_store import add_vectors, save_index, search, get_index_and_db
-from .fetch import fetch_many
+from .faiss_store import add_vectors, search, get_index_and_db, stored_hashes, text_hash
+from .constants import STREAM_PIPELINE, STREAM_MIN_FRACTION, STREAM_DEADLINE_S
+from .fetch import fetch_many, iter_fetch, run as run_fetch
 from .search import tavily_search
 from .synthesize import synthesize_with_llm
+from . import trace
+
+_pool = ThreadPoolExecutor(max_workers=4, thread_name_prefix="query-embed")
 
 class State(BaseModel):
     query: str
@@ -19,54 +28,215 @@ class State(BaseModel):
     chunks: List[Dict] = []
     hits: List[Dict] = []
     tools: object | None = None  # MCPTools
+    stream: bool = STREAM_PIPELINE
+    stream_min_fraction: float = STREAM_MIN_FRACTION  # start retrieval once this share of pages arrived...
+    stream_deadline: float = STREAM_DEADLINE_S  # ...or after this many seconds of fetching
+    qvec_future: object | None = None  # query embedding, started alongside search
+    started_at: float = 0.0
+    timings: Dict[str, List[float]] = {}  # stage -> [start, end] seconds since started_at
     synthesizer: Callable = None
 
-def node_search(s: State) -> State:
+@contextmanager
+def _stage(s: State, name: str):
+    if not s.started_at: s.started_at = time.perf_counter()
+    t0 = time.perf_counter() - s.started_at
+    try:
+        with trace.span(f"stage.{name}"):
+            yield
+    finally:
+        s.timings[name] = [round(t0, 4), round(time.perf_counter() - s.started_at, 4)]
+
+def _embed_query(s: State):
+    with _stage(s, "embed_query"):
+        return embed_one_openai(s.query, api_key=s.openai_api_key)
+
+def _search(s: State):
     if s.use_mcp and s.tools:
-        results = s.tools.search(s.query, k=8)
-    else:
-        results = tavily_search(s.query, s.tavily_api_key, k=8)
+        return s.tools.search(s.query, k=8)
+    return tavily_search(s.query, s.tavily_api_key, k=8)
+
+def _start_search(s: State):
+    s.started_at = time.perf_counter()
+    # the query vector depends only on the query, so embed it while search/fetch/index run
+    s.qvec_future = _pool.submit(trace.wrap(_embed_query), s)
+
+def _set_results(s: State, results):
     s.urls = [r["url"] for r in results if r.get("url")]
     s._results = results
+
+def node_search(s: State) -> State:
+    _start_search(s)
+    with _stage(s, "search"):
+        _set_results(s, _search(s))
+    return s
+
+async def anode_search(s: State) -> State:
+    _start_search(s)
+    with _stage(s, "search"):
+        _set_results(s, await asyncio.to_thread(_search, s))  # search SDKs are blocking
     return s
 
 def node_fetch(s: State) -> State:
-    import asyncio
-    s.pages = asyncio.run(fetch_many(s.urls))
+    with _stage(s, "fetch"):
+        s.pages = run_fetch(fetch_many(s.urls))
+    return s
+
+async def anode_fetch(s: State) -> State:
+    with _stage(s, "fetch"):
+        s.pages = await fetch_many(s.urls)
     return s
 
+def _page_chunks(p: Dict) -> List[Dict]:
+    if not p.get("text"): return []
+    return [{"url": p["url"], "title": p["title"], "ord": ord_, "text": t,
+             "domain": p["domain"], "text_hash": text_hash(t)}
+            for ord_, t in enumerate(iter_chunks(p["text"]))]
+
+def _index_chunks(index, conn, chunks: List[Dict], api_key: str):
+    # chunks already in the store were embedded and indexed by an earlier query
+    known = stored_hashes(conn, [c["text_hash"] for c in chunks])
+    new_chunks = [c for c in chunks if c["text_hash"] not in known]
+    if not new_chunks: return
+    # prefer API key from State (passed from app session) otherwise fall back to env
+    X = embed_texts_openai([c["text"] for c in new_chunks], api_key=api_key)
+    add_vectors(index, conn, X, new_chunks)
+
+def _index_pages(s: State):
+    index, conn = get_index_and_db()
+    s.chunks = [c for p in s.pages for c in _page_chunks(p)]
+    if s.chunks:
+        _index_chunks(index, conn, s.chunks, s.openai_api_key)
+        # vectors are already durable in the write-ahead segment; fold it into the main file off the request path
+        index.maybe_compact()
+
 def node_index(s: State) -> State:
+    with _stage(s, "index"):
+        _index_pages(s)
+    return s
+
+async def anode_index(s: State) -> State:
+    with _stage(s, "index"):
+        await asyncio.to_thread(_index_pages, s)
+    return s
+
+async def _index_as_they_come(pages, index, conn, api_key: str, chunks_out: List[Dict]):
+    """Chunk and embed each page from the async iterator `pages` as soon as it arrives. Chunks that arrive
+    while an embedding call is in flight are batched into the next call, so pages share requests without
+    waiting for each other."""
+    queue: asyncio.Queue = asyncio.Queue()
+
+    async def embedder():
+        done = False
+        while not done:
+            batch = [await queue.get()]
+            while not queue.empty(): batch.append(queue.get_nowait())
+            done = None in batch
+            chunks = [c for b in batch if b for c in b]
+            if chunks: await asyncio.to_thread(_index_chunks, index, conn, chunks, api_key)
+
+    async def chunk_page(p):
+        # tokenizing a large page takes a while; on this loop it would stall every other fetch and extraction
+        chunks = await asyncio.to_thread(_page_chunks, p)
+        chunks_out.extend(chunks)
+        if chunks: queue.put_nowait(chunks)
+
+    worker = asyncio.create_task(embedder())
+    chunkers = []
+    try:
+        async for p in pages:
+            chunkers.append(asyncio.create_task(chunk_page(p)))
+        await asyncio.gather(*chunkers)
+    finally:
+        for t in chunkers: t.cancel()  # no-op for finished ones
+        queue.put_nowait(None)
+        await worker
+
+async def _completed(tasks):
+    for t in asyncio.as_completed(tasks):
+        yield await t
+
+_late: set = set()  # background tasks indexing pages that arrived after retrieval started
+
+async def _index_late(tasks, index, conn, api_key: str):
+    try:
+        await _index_as_they_come(_completed(tasks), index, conn, api_key, [])
+        trace.count("fetch.late_pages", len(tasks))
+        index.maybe_compact()
+    except Exception:
+        logger.exception("Indexing late pages failed")
+
+async def _fetch_and_index(s: State):
+    """Fetch, chunk and index the search results, returning once `stream_min_fraction` of them are indexed
+    or `stream_deadline` has passed. Pages still downloading then are not part of this query's retrieval;
+    they keep downloading and are indexed in the background, for the queries that follow."""
     index, conn = get_index_and_db()
-    to_chunks = []
-    for p in s.pages:
-        if not p.get("text"): continue
-        for ord_, t in enumerate(chunk_text(p["text"])):
-            to_chunks.append({"url": p["url"], "title": p["title"], "ord": ord_, "text": t, "domain": p["domain"]})
-    if not to_chunks:
-        s.chunks = []
-        return s
-    # prefer API key from State (passed from app session) otherwise fall back to env
-    X = embed_texts_openai([c["text"] for c in to_chunks], api_key=s.openai_api_key)
-    add_vectors(index, conn, X, to_chunks)
-    save_index(index)
-    s.chunks = to_chunks
+    need = max(1, math.ceil(len(s.urls) * s.stream_min_fraction))
+    late: list = []
+
+    async def arrived():
+        async with aclosing(iter_fetch(s.urls, min_count=need, deadline=time.monotonic() + s.stream_deadline,
+                                       keep=late)) as pages:
+            async for p in pages:
+                s.pages.append(p)
+                yield p
+
+    try:
+        async with aclosing(arrived()) as pages:
+            await _index_as_they_come(pages, index, conn, s.openai_api_key, s.chunks)
+    except BaseException:
+        for t in late: t.cancel()
+        raise
+    if late:
+        # runs on past this request (the caller's loop is long-lived); its counters land in a finished trace
+        task = asyncio.create_task(_index_late(late, index, conn, s.openai_api_key))
+        _late.add(task); task.add_done_callback(_late.discard)
+    else:
+        index.maybe_compact()
+
+def node_fetch_index(s: State) -> State:
+    s.pages, s.chunks = [], []
+    with _stage(s, "fetch_index"):
+        if s.urls:
+            run_fetch(_fetch_and_index(s))
+    return s
+
+async def anode_fetch_index(s: State) -> State:
+    s.pages, s.chunks = [], []
+    with _stage(s, "fetch_index"):
+        if s.urls:
+            await _fetch_and_index(s)
     return s
 
 def node_retrieve(s: State) -> State:
     index, conn = get_index_and_db()
-    qvec = embed_one_openai(s.query, api_key=s.openai_api_key)
-    s.hits = search(index, conn, qvec, k=s.k)
+    with _stage(s, "retrieve"):
+        qvec = s.qvec_future.result() if s.qvec_future is not None else _embed_query(s)
+        s.hits = search(index, conn, qvec, k=s.k)
+    return s
+
+async def anode_retrieve(s: State) -> State:
+    index, conn = get_index_and_db()
+    with _stage(s, "retrieve"):
+        if s.qvec_future is not None: qvec = await asyncio.wrap_future(s.qvec_future)
+        else: qvec = await asyncio.to_thread(_embed_query, s)
+        s.hits = await asyncio.to_thread(search, index, conn, qvec, k=s.k)
     return s
 
+# every node has a sync and an async body: app_graph.invoke keeps working for Streamlit, while
+# app_graph.ainvoke lets many queries share the caller's event loop and connection pools
 g = StateGraph(State)
-g.add_node("search", node_search)
-g.add_node("fetch", node_fetch)
-g.add_node("index", node_index)
-g.add_node("retrieve", node_retrieve)
+g.add_node("search", RunnableLambda(node_search, afunc=anode_search))
+g.add_node("fetch", RunnableLambda(node_fetch, afunc=anode_fetch))
+g.add_node("index", RunnableLambda(node_index, afunc=anode_index))
+g.add_node("retrieve", RunnableLambda(node_retrieve, afunc=anode_retrieve))
+g.add_node("fetch_index", RunnableLambda(node_fetch_index, afunc=anode_fetch_index))
 g.set_entry_point("search")
-g.add_edge("search","fetch")
+# streaming mode overlaps fetch with chunk/embed/index; otherwise each stage waits for the previous one
+g.add_conditional_edges("search", lambda s: "fetch_index" if s.stream else "fetch",
+                        {"fetch_index": "fetch_index", "fetch": "fetch"})
 g.add_edge("fetch","index")
 g.add_edge("index","retrieve")
+g.add_edge("fetch_index","retrieve")
 app_graph = g.compile()
 
 def synthesizer(llm, query: str, hits: List[Dict], mode: str, temperature: float, max_tokens: int):
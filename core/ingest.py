@@ -0,0 +1,139 @@
+"""Bulk ingestion: pre-index URL lists, sitemaps and saved pages so live queries mostly hit the local store.
+
+    python -m core.cli ingest urls.txt
+    python -m core.cli ingest https://example.com/sitemap.xml --batch 64
+    python -m core.cli ingest ./saved_pages/
+
+Items go through the same path as a query: fetch (pooled, per-host limited, HTTP-cached) → extract → chunk
+→ embed (only texts not already stored or cached) → add. Batches are pipelined: the next batch downloads
+while the previous one is embedded and written. Finished items are appended to a checkpoint file after their
+chunks are in the store, so an interrupted run resumes where it stopped; items that failed are retried.
+"""
+import asyncio, os, time, urllib.parse
+import xml.etree.ElementTree as ET
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+from loguru import logger
+from .clients import http_client
+from .faiss_store import get_index_and_db
+from .fetch import fetch_many, run as run_fetch, _extract_async
+from .graph import _page_chunks, _index_chunks
+
+FILE_TYPES = (".html", ".htm", ".txt", ".md")
+_SM = "{http://www.sitemaps.org/schemas/sitemap/0.9}"
+
+
+def _is_url(s: str) -> bool:
+    return urllib.parse.urlparse(s).scheme in ("http", "https")
+
+
+def sitemap_urls(src: str, depth: int = 3):
+    """Page URLs listed in a sitemap (URL or file), following nested sitemap indexes."""
+    if _is_url(src):
+        r = http_client("ingest").get(src, follow_redirects=True)
+        r.raise_for_status()
+        root = ET.fromstring(r.content)
+    else:
+        root = ET.parse(src).getroot()
+    locs = [e.text.strip() for e in root.iter(f"{_SM}loc") if e.text]
+    if root.tag == f"{_SM}sitemapindex":
+        if depth <= 0: return
+        for loc in locs: yield from sitemap_urls(loc, depth - 1)
+    else:
+        yield from locs
+
+
+def read_sources(src: str):
+    """Items to ingest: http(s) URLs, or local file paths for a directory of saved pages."""
+    if os.path.isdir(src):
+        for p in sorted(Path(src).rglob("*")):
+            if p.is_file() and p.suffix.lower() in FILE_TYPES: yield str(p)
+    elif src.lower().endswith(".xml") or (_is_url(src) and "sitemap" in src.lower()):
+        yield from sitemap_urls(src)
+    elif _is_url(src):
+        yield src
+    else:
+        with open(src, encoding="utf-8") as f:
+            for line in f:
+                line = line.strip()
+                if line and not line.startswith("#"): yield line
+
+
+async def _load_file(path: str):
+    p = Path(path)
+    url, body = p.resolve().as_uri(), p.read_bytes()
+    if p.suffix.lower() in (".html", ".htm"):
+        return await _extract_async(url, body, "utf-8")
+    return {"url": url, "title": p.stem, "text": body.decode("utf-8", errors="replace"), "domain": ""}
+
+
+async def _load(batch):
+    urls = [i for i in batch if _is_url(i)]
+    files = [i for i in batch if not _is_url(i)]
+    pages = await fetch_many(urls)
+    pages += await asyncio.gather(*[_load_file(f) for f in files])
+    return dict(zip(urls + files, pages))  # item -> page
+
+
+class Checkpoint:
+    """Append-only list of finished items; one line each, flushed per batch."""
+    def __init__(self, path: str | None):
+        self.path, self.done = path, set()
+        if path and os.path.exists(path):
+            with open(path, encoding="utf-8") as f: self.done = {l.rstrip("\n") for l in f if l.strip()}
+
+    def add(self, items):
+        if not self.path or not items: return
+        with open(self.path, "a", encoding="utf-8") as f:
+            f.writelines(i + "\n" for i in items)
+            f.flush(); os.fsync(f.fileno())
+        self.done.update(items)
+
+
+def ingest(items, batch: int = 32, checkpoint: str | None = "ingest.checkpoint", api_key: str | None = None,
+           limit: int | None = None, report_every: float = 5.0, log=print) -> dict:
+    """Fetch/read, chunk, embed and store `items`, skipping those already in `checkpoint`. Returns totals."""
+    ckpt = Checkpoint(checkpoint)
+    todo, seen = [], set()
+    for i in items:
+        if i in ckpt.done or i in seen: continue
+        seen.add(i); todo.append(i)
+        if limit and len(todo) >= limit: break
+    index, conn = get_index_and_db()
+    stats = dict(items=len(todo), skipped=len(ckpt.done), docs=0, empty=0, failed=0, chunks=0, new_chunks=0)
+    t0 = last = time.perf_counter()
+
+    def store(pages: dict):
+        ok = {i: p for i, p in pages.items() if not p.get("error")}
+        chunks = [c for p in ok.values() for c in _page_chunks(p)]
+        before = index.ntotal
+        if chunks: _index_chunks(index, conn, chunks, api_key)  # dedupes against stored text hashes
+        ckpt.add(list(ok))  # only after the vectors are in the write-ahead segment
+        stats["docs"] += len(ok)
+        stats["empty"] += sum(1 for p in ok.values() if not p.get("text"))
+        stats["failed"] += len(pages) - len(ok)
+        stats["chunks"] += len(chunks)
+        stats["new_chunks"] += index.ntotal - before
+        index.maybe_compact()
+
+    def progress(final=False):
+        dt = time.perf_counter() - t0
+        done = stats["docs"] + stats["failed"]
+        log(f"{'done' if final else 'progress'}: {done}/{stats['items']} items, {stats['docs'] / dt:.1f} docs/s, "
+            f"{stats['new_chunks']} new / {stats['chunks']} chunks, {stats['failed']} failed, {dt:.1f}s")
+
+    with ThreadPoolExecutor(max_workers=1, thread_name_prefix="ingest-store") as pool:
+        pending = None
+        for b in range(0, len(todo), batch):
+            pages = run_fetch(_load(todo[b:b + batch]))  # overlaps with the previous batch's embedding
+            if pending: pending.result()
+            pending = pool.submit(store, pages)
+            if time.perf_counter() - last >= report_every:
+                last = time.perf_counter(); progress()
+        if pending: pending.result()
+    index.compact()
+    stats["seconds"] = round(time.perf_counter() - t0, 2)
+    stats["docs_per_s"] = round(stats["docs"] / max(stats["seconds"], 1e-9), 2)
+    progress(final=True)
+    if stats["failed"]: logger.warning(f"{stats['failed']} items failed; run again to retry them")
+    return stats
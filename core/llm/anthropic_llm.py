@@ -1,20 +1,51 @@
 import anthropic
-from .base import LLM
+from .base import LLM, count_usage
+from ..clients import http_client, async_http_client, sdk_client, async_sdk_client, warm
+from ..constants import HTTP_MAX_RETRIES, PROMPT_CACHE
 class AnthropicLLM(LLM):
     name = "Anthropic"
     def __init__(self, api_key: str, model="claude-3-5-sonnet-latest"):
-        self.client = anthropic.Anthropic(api_key=api_key) if api_key else anthropic.Anthropic()
+        self.api_key = api_key
+        self.client = sdk_client("anthropic", api_key, lambda: anthropic.Anthropic(
+            api_key=api_key or None, max_retries=HTTP_MAX_RETRIES, http_client=http_client("anthropic")))
         self.model = model
-    def chat(self, messages, stream=False, **kw):
+    @staticmethod
+    def _split(messages):
         sys = ""; conv=[]
         for m in messages:
             if m["role"]=="system": sys=m["content"]
             else: conv.append({"role": m["role"], "content": m["content"]})
+        # cache breakpoint after the system prompt, the prefix every call shares
+        if sys and PROMPT_CACHE: sys = [{"type": "text", "text": sys, "cache_control": {"type": "ephemeral"}}]
+        return sys, conv
+    @staticmethod
+    def _usage(u):
+        cached = getattr(u, "cache_read_input_tokens", 0) or 0
+        count_usage(u.input_tokens + cached + (getattr(u, "cache_creation_input_tokens", 0) or 0), cached)
+    def warm(self):
+        warm("anthropic", str(self.client.base_url))
+    def chat(self, messages, stream=False, **kw):
+        sys, conv = self._split(messages)
         if stream:
             s = self.client.messages.stream(model=self.model, system=sys, messages=conv, **kw)
             def gen():
                 with s as stream_resp:
                     for ev in stream_resp.text_stream: yield ev
+                    self._usage(stream_resp.get_final_message().usage)
             return gen()
         r = self.client.messages.create(model=self.model, system=sys, messages=conv, **kw)
+        self._usage(r.usage)
+        return "".join([b.text for b in r.content if getattr(b,"type","")== "text"])
+    async def achat(self, messages, stream=False, **kw):
+        sys, conv = self._split(messages)
+        client = async_sdk_client("anthropic", self.api_key, lambda: anthropic.AsyncAnthropic(
+            api_key=self.api_key or None, max_retries=HTTP_MAX_RETRIES, http_client=async_http_client("anthropic")))
+        if stream:
+            async def gen():
+                async with client.messages.stream(model=self.model, system=sys, messages=conv, **kw) as stream_resp:
+                    async for ev in stream_resp.text_stream: yield ev
+                    self._usage((await stream_resp.get_final_message()).usage)
+            return gen()
+        r = await client.messages.create(model=self.model, system=sys, messages=conv, **kw)
+        self._usage(r.usage)
         return "".join([b.text for b in r.content if getattr(b,"type","")== "text"])
@@ -1,5 +1,30 @@
+import asyncio
 from typing import List, Dict, Any
+from .. import trace
+
+_DONE = object()
+
+async def aiter_in_thread(it):
+    """Drive a blocking iterator (e.g. a sync SDK stream) from async code without blocking the loop."""
+    while True:
+        item = await asyncio.to_thread(next, it, _DONE)
+        if item is _DONE: return
+        yield item
+
+def count_usage(prompt_tokens, cached_tokens):
+    """Prompt tokens sent vs served from the provider's prompt cache, per query trace and in /metrics."""
+    trace.count("llm.prompt_tokens", prompt_tokens or 0)
+    trace.count("llm.cached_tokens", cached_tokens or 0)
+
 class LLM:
     name: str
     def chat(self, messages: List[Dict[str,str]], stream: bool=False, **kw) -> Any:
         raise NotImplementedError
+    def warm(self):
+        """Best effort: open a connection to the provider ahead of the request (no-op by default)."""
+    async def achat(self, messages: List[Dict[str,str]], stream: bool=False, **kw) -> Any:
+        """Async `chat`: a str, or an async iterator of text deltas when stream=True. Adapters without a
+        native async client fall back to running `chat` in a worker thread."""
+        out = await asyncio.to_thread(self.chat, messages, stream, **kw)
+        if not stream or isinstance(out, str): return out
+        return aiter_in_thread(iter(out))
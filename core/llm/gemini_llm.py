@@ -1,18 +1,48 @@
 import google.generativeai as genai
-from .base import LLM
+from .base import LLM, count_usage
 class GeminiLLM(LLM):
     name = "Gemini"
     def __init__(self, api_key: str, model="gemini-1.5-pro"):
         genai.configure(api_key=api_key) if api_key else genai.configure()
         self.model = genai.GenerativeModel(model)
-    def chat(self, messages, stream=False, **kw):
+    @staticmethod
+    def _prompt(messages):
         sys = "\n".join([m["content"] for m in messages if m["role"]=="system"])
         text = "\n".join([f"{m['role'].upper()}: {m['content']}" for m in messages if m["role"]!="system"])
+        return sys, text
+    def _model(self, sys):
+        # the system prompt goes in system_instruction, ahead of the contents, where implicit prefix caching
+        # can reuse it; explicit CachedContent needs a far longer prefix (32k tokens) than ours. Building the
+        # model object is local and cheap, and adapters live for one query, so it isn't cached
+        if not sys: return self.model
+        return genai.GenerativeModel(self.model.model_name, system_instruction=sys)
+    @staticmethod
+    def _usage(r):
+        u = getattr(r, "usage_metadata", None)
+        if u is not None: count_usage(u.prompt_token_count, getattr(u, "cached_content_token_count", 0))
+    def chat(self, messages, stream=False, **kw):
+        sys, text = self._prompt(messages)
         if stream:
-            s = self.model.generate_content([sys, text], stream=True, **kw)
+            s = self._model(sys).generate_content(text, stream=True, **kw)
             def gen():
+                c = None
                 for c in s:
                     if c.text: yield c.text
+                self._usage(c)
+            return gen()
+        r = self._model(sys).generate_content(text, **kw)
+        self._usage(r)
+        return r.text or ""
+    async def achat(self, messages, stream=False, **kw):
+        sys, text = self._prompt(messages)
+        if stream:
+            s = await self._model(sys).generate_content_async(text, stream=True, **kw)
+            async def gen():
+                c = None
+                async for c in s:
+                    if c.text: yield c.text
+                self._usage(c)
             return gen()
-        r = self.model.generate_content([sys, text], **kw)
+        r = await self._model(sys).generate_content_async(text, **kw)
+        self._usage(r)
         return r.text or ""
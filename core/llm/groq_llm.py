@@ -1,40 +1,107 @@
-import httpx
-from .base import LLM
+import json
+from .base import LLM, count_usage
+from ..clients import http_client, async_http_client, with_retries, awith_retries, warm
+from ..constants import GROQ_BASE_URL
+
+_PARAMS = ("temperature", "max_tokens", "top_p", "stop", "seed")
 
 class GroqLLM(LLM):
+    """Groq through its OpenAI-compatible chat completions API, streamed as SSE over the pooled clients."""
     name = "Groq"
-    def __init__(self, api_key: str, model: str = "groq-1.0"):
+    def __init__(self, api_key: str, model: str = "llama-3.1-8b-instant"):
         self.api_key = api_key
         self.model = model
 
-    def chat(self, messages, stream=False, **kw):
-        # Build a simple prompt from messages
-        prompt_parts = []
-        for m in messages:
-            role = m.get("role", "user")
-            content = m.get("content", "")
-            prompt_parts.append(f"{role.upper()}: {content}")
-        prompt = "\n".join(prompt_parts)
-
-        if not self.api_key:
-            # Graceful fallback when no key is provided
-            return (
-                "[Groq adapter] No GROQ_API_KEY provided. Provide the key in the sidebar to use Groq,\n"
-                "or select a different LLM.\n\n" +
-                "Request prompt:\n" + prompt[:1000]
-            )
-
-        url = kw.get("endpoint") or "https://api.groq.ai/v1/generate"
+    def _no_key(self, messages):
+        # Graceful fallback when no key is provided
+        prompt = "\n".join(f"{m.get('role', 'user').upper()}: {m.get('content', '')}" for m in messages)
+        return (
+            "[Groq adapter] No GROQ_API_KEY provided. Provide the key in the sidebar to use Groq,\n"
+            "or select a different LLM.\n\n" +
+            "Request prompt:\n" + prompt[:1000]
+        )
+
+    def _request(self, messages, stream, kw):
         headers = {"Authorization": f"Bearer {self.api_key}", "Content-Type": "application/json"}
-        data = {"model": self.model, "input": prompt}
-
-        try:
-            r = httpx.post(url, json=data, headers=headers, timeout=30.0)
-            r.raise_for_status()
-            j = r.json()
-            # Try common response fields
-            if isinstance(j, dict):
-                return j.get("text") or j.get("output") or j.get("result") or str(j)
-            return str(j)
-        except Exception as e:
-            return f"[Groq adapter] request failed: {e}"
+        data = {"model": self.model, "messages": [{"role": m["role"], "content": m["content"]} for m in messages],
+                "stream": stream, **{k: kw[k] for k in _PARAMS if kw.get(k) is not None}}
+        return f"{GROQ_BASE_URL}/chat/completions", headers, data
+
+    @staticmethod
+    def _usage(j):
+        # streamed responses report usage under x_groq on the last chunk
+        u = j.get("usage") or (j.get("x_groq") or {}).get("usage")
+        if u: count_usage(u.get("prompt_tokens"), (u.get("prompt_tokens_details") or {}).get("cached_tokens"))
+
+    @classmethod
+    def _event(cls, line):
+        """Text delta of one SSE line ("" for keep-alives, usage chunks and [DONE]). An error event raises
+        rather than ending the answer early as if it were complete."""
+        if not line.startswith("data:"): return ""
+        payload = line[5:].strip()
+        if not payload or payload == "[DONE]": return ""
+        j = json.loads(payload)
+        if j.get("error"):
+            err = j["error"]
+            raise RuntimeError(f"Groq stream error: {err.get('message', err) if isinstance(err, dict) else err}")
+        cls._usage(j)
+        return ((j.get("choices") or [{}])[0].get("delta") or {}).get("content") or ""
+
+    @classmethod
+    def _text(cls, j):
+        cls._usage(j)
+        return j["choices"][0]["message"].get("content") or ""
+
+    def warm(self):
+        warm("groq", f"{GROQ_BASE_URL}/models")
+
+    def chat(self, messages, stream=False, **kw):
+        if not self.api_key: return self._no_key(messages)
+        url, headers, data = self._request(messages, stream, kw)
+        client = http_client("groq")
+        if not stream:
+            def call():
+                r = client.post(url, json=data, headers=headers)
+                r.raise_for_status()
+                return r
+            return self._text(with_retries(call).json())
+        def open_stream():
+            # retries cover the request up to the response headers; nothing has been yielded yet
+            r = client.send(client.build_request("POST", url, json=data, headers=headers), stream=True)
+            if r.is_error:
+                r.read(); r.close(); r.raise_for_status()
+            return r
+        r = with_retries(open_stream)
+        def gen():
+            try:
+                for line in r.iter_lines():
+                    delta = self._event(line)
+                    if delta: yield delta
+            finally:
+                r.close()
+        return gen()
+
+    async def achat(self, messages, stream=False, **kw):
+        if not self.api_key: return self._no_key(messages)
+        url, headers, data = self._request(messages, stream, kw)
+        client = async_http_client("groq")
+        if not stream:
+            async def call():
+                r = await client.post(url, json=data, headers=headers)
+                r.raise_for_status()
+                return r
+            return self._text((await awith_retries(call)).json())
+        async def open_stream():
+            r = await client.send(client.build_request("POST", url, json=data, headers=headers), stream=True)
+            if r.is_error:
+                await r.aread(); await r.aclose(); r.raise_for_status()
+            return r
+        r = await awith_retries(open_stream)
+        async def gen():
+            try:
+                async for line in r.aiter_lines():
+                    delta = self._event(line)
+                    if delta: yield delta
+            finally:
+                await r.aclose()
+        return gen()
@@ -1,16 +1,49 @@
-from openai import OpenAI
-from .base import LLM
+from openai import OpenAI, AsyncOpenAI
+from .base import LLM, count_usage
+from ..clients import http_client, async_http_client, sdk_client, async_sdk_client, warm
+from ..constants import HTTP_MAX_RETRIES, PROMPT_CACHE
 
 class OpenAILLM(LLM):
     name = "OpenAI"
     def __init__(self, api_key: str, model="gpt-4o-mini"):
-        self.client = OpenAI(api_key=api_key) if api_key else OpenAI()
+        self.api_key = api_key
+        # one SDK client per key for the whole process, all on the shared keep-alive pool
+        self.client = sdk_client("openai", api_key, lambda: OpenAI(api_key=api_key or None, max_retries=HTTP_MAX_RETRIES,
+                                                                   http_client=http_client("openai")))
         self.model = model
+    @staticmethod
+    def _kw(stream, kw):
+        # OpenAI caches prompt prefixes automatically; a fixed key keeps our requests on the same cache shard
+        if PROMPT_CACHE: kw.setdefault("prompt_cache_key", "openscout-synth")
+        if stream: kw.setdefault("stream_options", {"include_usage": True})
+        return kw
+    @staticmethod
+    def _usage(u):
+        if u is not None:
+            count_usage(u.prompt_tokens, getattr(getattr(u, "prompt_tokens_details", None), "cached_tokens", 0))
+    def warm(self):
+        warm("openai", str(self.client.base_url))
     def chat(self, messages, stream=False, **kw):
-        resp = self.client.chat.completions.create(model=self.model, messages=messages, stream=stream, **kw)
-        if not stream: return resp.choices[0].message.content or ""
+        resp = self.client.chat.completions.create(model=self.model, messages=messages, stream=stream, **self._kw(stream, kw))
+        if not stream:
+            self._usage(resp.usage)
+            return resp.choices[0].message.content or ""
         def gen():
             for c in resp:
-                delta = c.choices[0].delta.content or ""
+                delta = c.choices[0].delta.content if c.choices else None
                 if delta: yield delta
+                if getattr(c, "usage", None) is not None: self._usage(c.usage)  # the last, choice-less chunk
+        return gen()
+    async def achat(self, messages, stream=False, **kw):
+        client = async_sdk_client("openai", self.api_key, lambda: AsyncOpenAI(
+            api_key=self.api_key or None, max_retries=HTTP_MAX_RETRIES, http_client=async_http_client("openai")))
+        resp = await client.chat.completions.create(model=self.model, messages=messages, stream=stream, **self._kw(stream, kw))
+        if not stream:
+            self._usage(resp.usage)
+            return resp.choices[0].message.content or ""
+        async def gen():
+            async for c in resp:
+                delta = c.choices[0].delta.content if c.choices else None
+                if delta: yield delta
+                if getattr(c, "usage", None) is not None: self._usage(c.usage)
         return gen()
@@ -3,9 +3,7 @@ MCPTools exposes a stable tool interface for the app/graph.
 This starter implements MCP adapters by wrapping SDKs so everything runs out of the box.
 Later, you can replace the internals with a real MCP client without changing call sites.
 """
-from tavily import TavilyClient, errors as tavily_errors
 import os
-from neo4j import GraphDatabase
 
 """
 MCPTools exposes a stable tool interface for the app/graph.
@@ -21,8 +19,8 @@ The goal: switch to a real MCP server by setting MCP_URL without changing the re
 import os
 from typing import List
 import httpx
-from tavily import TavilyClient, errors as tavily_errors
-from neo4j import GraphDatabase
+from ..clients import http_client, neo4j_driver, with_retries
+from ..search import cached_search, tavily_search
 
 
 class MCPTools:
@@ -32,9 +30,8 @@ class MCPTools:
         self.mcp_url = self.keys.get("MCP_URL") or os.getenv("MCP_URL")
         self._neo4j_driver = None
         if self.keys.get("NEO4J_URI") and self.keys.get("NEO4J_USERNAME") and self.keys.get("NEO4J_PASSWORD"):
-            self._neo4j_driver = GraphDatabase.driver(
-                self.keys["NEO4J_URI"], auth=(self.keys["NEO4J_USERNAME"], self.keys["NEO4J_PASSWORD"]) 
-            )
+            # MCPTools is built per query; the driver (and its connection pool) is shared per URI + credentials
+            self._neo4j_driver = neo4j_driver(self.keys["NEO4J_URI"], self.keys["NEO4J_USERNAME"], self.keys["NEO4J_PASSWORD"])
 
     # --- Helper: call remote MCP endpoints if configured ---
     def _call_mcp(self, path: str, payload: dict, timeout: float = 20.0) -> dict:
@@ -46,9 +43,11 @@ class MCPTools:
         if self.keys.get("MCP_API_KEY"):
             headers["Authorization"] = f"Bearer {self.keys.get('MCP_API_KEY')}"
         try:
-            r = httpx.post(url, json=payload, headers=headers, timeout=timeout)
-            r.raise_for_status()
-            return r.json()
+            def call():
+                r = http_client("mcp").post(url, json=payload, headers=headers, timeout=timeout)
+                r.raise_for_status()
+                return r
+            return with_retries(call).json()
         except httpx.HTTPStatusError as e:
             raise RuntimeError(f"MCP server returned HTTP {e.response.status_code}: {e.response.text}") from e
         except Exception as e:
@@ -56,31 +55,20 @@ class MCPTools:
 
     # --- MCP search ---
     def search(self, query: str, k: int = 8) -> List[dict]:
-        # If MCP server configured, call it first
+        # If MCP server configured, call it first (cached and coalesced per server, like the local search)
         if self.mcp_url:
-            payload = {"query": query, "k": k}
-            res = self._call_mcp("/search", payload)
-            # Expecting {'results': [{'url':..., 'title':..., 'content':...}, ...]}
-            out = []
-            for r in res.get("results", []):
-                out.append({"url": r.get("url", ""), "title": r.get("title", ""), "snippet": r.get("content", "")})
-            return out
+            def remote():
+                payload = {"query": query, "k": k}
+                res = self._call_mcp("/search", payload)
+                # Expecting {'results': [{'url':..., 'title':..., 'content':...}, ...]}
+                out = []
+                for r in res.get("results", []):
+                    out.append({"url": r.get("url", ""), "title": r.get("title", ""), "snippet": r.get("content", "")})
+                return out
+            return cached_search(f"mcp:{self.mcp_url}", query, k, remote)
 
         # Local SDK fallback
-        client = TavilyClient(api_key=self.keys.get("TAVILY_API_KEY")) if self.keys.get("TAVILY_API_KEY") else TavilyClient()
-        try:
-            res = client.search(query=query, max_results=k)
-        except Exception as e:
-            if isinstance(e, tavily_errors.InvalidAPIKeyError):
-                raise RuntimeError(
-                    "Tavily API key is missing or invalid. Please set TAVILY_API_KEY in .env or paste it in the sidebar."
-                ) from e
-            raise RuntimeError(f"Tavily search failed: {e}") from e
-
-        out = []
-        for r in res.get("results", []):
-            out.append({"url": r.get("url", ""), "title": r.get("title", ""), "snippet": r.get("content", "")})
-        return out
+        return tavily_search(query, self.keys.get("TAVILY_API_KEY"), k)
 
     def extract(self, urls: List[str]) -> List[dict]:
         # remote MCP: call /extract which should return cleaned page objects
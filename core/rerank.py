@@ -1,15 +1,92 @@
+import hashlib, threading
+from collections import OrderedDict
+from loguru import logger
 from sentence_transformers import CrossEncoder
+from .constants import (RERANK_MODEL, RERANK_BACKEND, RERANK_ONNX_FILE, RERANK_MAX_LENGTH, RERANK_BATCH_SIZE,
+                        RERANK_CACHE_SIZE, RERANK_SKIP_GAP)
+from . import trace
+
 _model = None
+_lock = threading.Lock()
+_scores: OrderedDict = OrderedDict()  # (query hash, chunk id) -> score, most recent last
+_scores_lock = threading.Lock()
+
+
+def _load(backend: str = RERANK_BACKEND):
+    kw = dict(max_length=RERANK_MAX_LENGTH)
+    if backend == "onnx":
+        # ONNX Runtime on CPU; RERANK_ONNX_FILE picks an exported variant such as onnx/model_qint8_avx2.onnx
+        kw["backend"] = "onnx"
+        if RERANK_ONNX_FILE: kw["model_kwargs"] = {"file_name": RERANK_ONNX_FILE}
+    try:
+        model = CrossEncoder(RERANK_MODEL, **kw)
+    except Exception as e:
+        if backend != "onnx": raise
+        logger.warning("ONNX reranker unavailable ({!r}); using the torch backend", e)
+        return _load("torch")
+    if backend == "int8":
+        import torch
+        # dynamic int8 quantization of the linear layers: the bulk of a MiniLM forward pass on CPU
+        model.model = torch.quantization.quantize_dynamic(model.model, {torch.nn.Linear}, dtype=torch.qint8)
+    return model
+
+
 def _get():
     global _model
     if _model is None:
-        _model = CrossEncoder("cross-encoder/ms-marco-MiniLM-L-6-v2")
+        with _lock:  # a query arriving during warm-up waits for it instead of loading a second copy
+            if _model is None: _model = _load()
     return _model
 
+
+def warm_up(background: bool = True):
+    """Load the cross-encoder and run one batch, so the first query doesn't pay for it."""
+    def run():
+        try:
+            _get().predict([("warm up", "warm up")], batch_size=1, show_progress_bar=False)
+        except Exception as e:
+            logger.warning("reranker warm-up failed: {!r}", e)
+    if background: threading.Thread(target=run, name="rerank-warmup", daemon=True).start()
+    else: run()
+
+
+def _hit_key(h: dict):
+    return h["id"] if h.get("id") is not None else hashlib.sha1(h.get("text", "").encode("utf-8")).hexdigest()
+
+
+def _decisive(hits: list[dict], gap: float) -> bool:
+    """The retrieval scores already separate the best passage from the rest by at least `gap`."""
+    if gap <= 0 or len(hits) < 2 or any("score" not in h for h in hits[:2]): return False
+    return hits[0]["score"] - hits[1]["score"] >= gap
+
+
 def maybe_rerank(query: str, hits: list[dict], top_k: int = 6):
     if not hits: return hits
-    model = _get()
-    pairs = [(query, h.get("text","")) for h in hits]
-    scores = model.predict(pairs).tolist()
+    if _decisive(hits, RERANK_SKIP_GAP):
+        trace.count("rerank.skipped"); return hits[:top_k]
+    with trace.span("rerank"):
+        return _rerank(query, hits, top_k)
+
+
+def _rerank(query: str, hits: list[dict], top_k: int):
+    qh = hashlib.sha1(f"{RERANK_MODEL}\0{query}".encode("utf-8")).hexdigest()
+    keys = [(qh, _hit_key(h)) for h in hits]
+    with _scores_lock:
+        scores = [_scores.get(k) for k in keys]
+        for k, s in zip(keys, scores):
+            if s is not None: _scores.move_to_end(k)
+    todo = [i for i, s in enumerate(scores) if s is None]
+    trace.count("cache.rerank.hit", len(hits) - len(todo)); trace.count("cache.rerank.miss", len(todo))
+    if todo:
+        # anything past max_length tokens is truncated by the tokenizer; don't ship ~1000-word chunks to it
+        cap = RERANK_MAX_LENGTH * 8
+        # longest first keeps similar lengths in a batch, so less padding
+        todo.sort(key=lambda i: len(hits[i].get("text", "")), reverse=True)
+        pairs = [(query, hits[i].get("text", "")[:cap]) for i in todo]
+        out = _get().predict(pairs, batch_size=RERANK_BATCH_SIZE, show_progress_bar=False).tolist()
+        with _scores_lock:
+            for i, s in zip(todo, out):
+                scores[i] = _scores[keys[i]] = s
+            while len(_scores) > RERANK_CACHE_SIZE: _scores.popitem(last=False)
     ranked = sorted(zip(hits, scores), key=lambda x: x[1], reverse=True)[:top_k]
-    return [h for h,_ in ranked]
+    return [dict(h, rerank_score=float(s)) for h, s in ranked]
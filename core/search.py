@@ -1,13 +1,54 @@
+import threading, time
+from collections import OrderedDict
+from concurrent.futures import Future
 from tavily import TavilyClient, errors as tavily_errors
+from .clients import sdk_client
+from . import trace
+from .constants import SEARCH_CACHE_TTL, SEARCH_CACHE_SIZE
 
+_results: OrderedDict = OrderedDict()  # (provider, normalized query, k) -> (expires, results), most recent last
+_inflight: dict = {}  # same key -> Future of the request currently running
+_lock = threading.Lock()
 
-def tavily_search(query: str, api_key: str, k: int = 8):
-    """Search via Tavily with clearer error messages.
 
-    Raises RuntimeError with actionable message on auth or other failures so callers
-    (and the UI) can show helpful guidance to the user.
-    """
-    client = TavilyClient(api_key=api_key) if api_key else TavilyClient()
+def _normalize(query: str) -> str:
+    return " ".join(query.split()).casefold()
+
+
+def cached_search(provider: str, query: str, k: int, fn):
+    """Results of `fn()` for (provider, query, k), served from a TTL cache. Identical requests that arrive
+    while one is in flight wait for it instead of calling the provider again; failures are not cached."""
+    key = (provider, _normalize(query), k)
+    with _lock:
+        hit = _results.get(key)
+        if hit and hit[0] > time.monotonic():
+            _results.move_to_end(key)
+            trace.count("cache.search.hit")
+            return [dict(r) for r in hit[1]]
+        fut = _inflight.get(key)
+        leader = fut is None
+        if leader: fut = _inflight[key] = Future()
+    trace.count("cache.search.miss" if leader else "cache.search.coalesced")
+    if not leader:
+        return [dict(r) for r in fut.result()]
+    try:
+        res = fn()
+    except BaseException as e:
+        fut.set_exception(e)
+        raise
+    else:
+        fut.set_result(res)
+        with _lock:
+            _results[key] = (time.monotonic() + SEARCH_CACHE_TTL, res)
+            _results.move_to_end(key)
+            while len(_results) > SEARCH_CACHE_SIZE: _results.popitem(last=False)
+        return [dict(r) for r in res]
+    finally:
+        with _lock: _inflight.pop(key, None)
+
+
+def _tavily(query: str, api_key: str, k: int):
+    client = sdk_client("tavily", api_key, lambda: TavilyClient(api_key=api_key) if api_key else TavilyClient())
     try:
         res = client.search(query=query, max_results=k)
     except Exception as e:
@@ -24,3 +65,13 @@ def tavily_search(query: str, api_key: str, k: int = 8):
     for r in res.get("results", []):
         out.append({"url": r.get("url", ""), "title": r.get("title", ""), "snippet": r.get("content", "")})
     return out
+
+
+def tavily_search(query: str, api_key: str, k: int = 8):
+    """Search via Tavily with clearer error messages.
+
+    Raises RuntimeError with actionable message on auth or other failures so callers
+    (and the UI) can show helpful guidance to the user. Results are cached per normalized
+    query for OPENSCOUT_SEARCH_CACHE_TTL seconds and concurrent identical searches are coalesced.
+    """
+    return cached_search("tavily", query, k, lambda: _tavily(query, api_key, k))
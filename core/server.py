@@ -0,0 +1,313 @@
+"""Headless query service: the search → fetch → index → retrieve → answer pipeline over HTTP.
+
+    python -m core.server --port 8000 --workers 2
+
+    POST /query   {"query": "...", "llm": "OpenAI / gpt-4o-mini", "k": 6, "mode": "concise", "stream": true,
+                   "use_mcp": false, "rerank": true, "keys": {...}}
+    GET  /healthz liveness;  GET /readyz  200 once the index, reranker and answer cache are loaded
+    GET  /metrics Prometheus text: stage latencies, fetch/embed/FAISS counters, cache hits, connection reuse
+
+With "stream": true (default) the answer is sent as server-sent events: one `sources` event with the retrieved
+passages, `token` events with answer text as the LLM produces it, then `done` ({answer, citations, cached,
+timings}) or `error`. Otherwise a single JSON object. Bad settings (k, max_tokens, temperature, an unknown
+llm or mode) are answered with 400 before the request is queued. API keys come from the environment (the
+same variables as the UI); the LLM and search-provider keys can be overridden per request with "keys".
+MCP_URL and the NEO4J_* settings are environment-only, so a request can't point the server at hosts of its
+choosing.
+
+Each worker process keeps the index, chunk store, reranker, answer cache and network clients warm. At most
+OPENSCOUT_SERVER_CONCURRENCY pipelines run at once per process and OPENSCOUT_SERVER_QUEUE more requests wait;
+further requests are turned away with 503 and Retry-After so a load balancer can send them elsewhere (a
+request that waits longer than OPENSCOUT_SERVER_QUEUE_TIMEOUT gets a "server busy" error instead).
+"""
+import argparse, asyncio, json, os, time
+from contextlib import asynccontextmanager
+from loguru import logger
+from starlette.applications import Starlette
+from starlette.requests import Request
+from starlette.responses import JSONResponse, PlainTextResponse, StreamingResponse
+from starlette.routing import Route
+from .answer_cache import AnswerCache
+from .constants import (ANSWER_CACHE, SERVER_HOST, SERVER_PORT, SERVER_WORKERS, SERVER_CONCURRENCY, SERVER_QUEUE,
+                        SERVER_QUEUE_TIMEOUT)
+from .embed import embed_one_openai
+from .faiss_store import get_index_and_db
+from .graph import app_graph, State
+from .llm.registry import build_llm, LLM_LABELS
+from .mcp.adapters import MCPTools
+from .rerank import maybe_rerank, warm_up as warm_up_reranker
+from .synth_prompt import ANSWER_MODES
+from .synthesize import build_messages
+from . import trace
+
+OVERRIDABLE_KEYS = ("OPENAI_API_KEY", "TAVILY_API_KEY", "ANTHROPIC_API_KEY", "GOOGLE_API_KEY", "GROQ_API_KEY")
+KEY_NAMES = OVERRIDABLE_KEYS + ("MCP_URL", "NEO4J_URI", "NEO4J_USERNAME", "NEO4J_PASSWORD")
+DEFAULT_LLM = os.getenv("OPENSCOUT_SERVER_LLM", "OpenAI / gpt-4o-mini")
+
+
+class Busy(Exception):
+    pass
+
+
+class Slots:
+    """At most `concurrency` pipelines at a time; new requests are refused while `queue` others already wait."""
+    def __init__(self, concurrency: int, queue: int, timeout: float):
+        self._sem = asyncio.Semaphore(concurrency)
+        self.capacity, self.timeout = concurrency + queue, timeout
+        self.waiting = self.running = 0
+
+    def reserve(self):
+        """Admit a request or raise Busy. Synchronous, so requests arriving together can't all pass the check.
+        Returns the reservation's release function: `acquire` takes it over, and calling it again is a no-op,
+        so the caller can release unconditionally once the response is done."""
+        if self.waiting + self.running >= self.capacity: raise Busy()
+        self.waiting += 1
+        held = [True]
+        def release():
+            if held[0]: held[0] = False; self.waiting -= 1
+        return release
+
+    @asynccontextmanager
+    async def acquire(self, release):
+        try:
+            await asyncio.wait_for(self._sem.acquire(), self.timeout)
+        except asyncio.TimeoutError:
+            raise Busy() from None
+        finally:
+            release()
+        self.running += 1
+        try:
+            yield
+        finally:
+            self.running -= 1
+            self._sem.release()
+
+
+def _keys(body: dict) -> dict:
+    keys = {k: os.getenv(k, "") for k in KEY_NAMES}
+    given = body.get("keys")
+    if isinstance(given, dict):
+        keys.update({k: v for k, v in given.items() if k in OVERRIDABLE_KEYS and v and isinstance(v, str)})
+    return keys
+
+
+def _number(body: dict, name: str, cast, default, lo, hi):
+    v = body.get(name)
+    if v is None or v == "": return default
+    try:
+        if isinstance(v, bool): raise TypeError
+        v = cast(v)
+    except (TypeError, ValueError):
+        raise ValueError(f"'{name}' must be a number") from None
+    if not lo <= v <= hi: raise ValueError(f"'{name}' must be between {lo} and {hi}")
+    return v
+
+
+def _params(body: dict) -> dict:
+    """The request's settings, checked; a ValueError names the bad field (the caller answers 400)."""
+    label, mode = body.get("llm") or DEFAULT_LLM, body.get("mode") or "concise"
+    if label not in LLM_LABELS: raise ValueError(f"unknown 'llm' {label!r}; expected one of {list(LLM_LABELS)}")
+    if mode not in ANSWER_MODES: raise ValueError(f"unknown 'mode' {mode!r}; expected one of {list(ANSWER_MODES)}")
+    return dict(llm=label, mode=mode, k=_number(body, "k", int, 6, 1, 50),
+                max_tokens=_number(body, "max_tokens", int, 512, 1, 16384),
+                temperature=_number(body, "temperature", float, 0.2, 0.0, 2.0))
+
+
+def _slim(hits):
+    return [{k: h.get(k) for k in ("url", "title", "text", "score", "rerank_score") if k in h} for h in hits]
+
+
+async def answer_events(app, body: dict, params: dict | None = None):
+    """The pipeline for one request as (event, data) pairs: sources, token*, done."""
+    p = params or _params(body)
+    with trace.request("query", llm=p["llm"], mode=p["mode"], entry="server") as t:
+        async for ev in _answer_events(app, body, p):
+            if t is not None and ev[0] == "done": ev[1]["trace_id"] = t.id
+            yield ev
+
+
+async def _lookup(cache, query: str, label: str, mode: str, keys: dict):
+    """(query vector, cached entry or None); failures only cost the cache, never the request."""
+    try:
+        qvec = await asyncio.to_thread(embed_one_openai, query, api_key=keys["OPENAI_API_KEY"])
+        _, conn = get_index_and_db()
+        return qvec, await asyncio.to_thread(cache.lookup, qvec, label, mode, conn)
+    except Exception:
+        logger.exception("Answer cache lookup failed")
+        return None, None
+
+
+async def _answer_events(app, body: dict, p: dict):
+    query, label, mode, k = (body.get("query") or "").strip(), p["llm"], p["mode"], p["k"]
+    keys = _keys(body)
+    llm = build_llm(label, keys)
+    cache = app.state.answer_cache
+    t0 = time.perf_counter()
+
+    # the cache lookup runs alongside the graph rather than ahead of it, so a miss costs no extra round
+    # trip; both embed the query through embed_one_openai, which coalesces the two into one request
+    lookup = asyncio.create_task(_lookup(cache, query, label, mode, keys)) if cache is not None else None
+    graph = asyncio.create_task(app_graph.ainvoke(State(
+        query=query, k=k, use_mcp=bool(body.get("use_mcp")), tools=MCPTools(keys),
+        tavily_api_key=keys["TAVILY_API_KEY"], openai_api_key=keys["OPENAI_API_KEY"])))
+    try:
+        qvec, cached = await lookup if lookup is not None else (None, None)
+    except BaseException:
+        graph.cancel()
+        raise
+    if cached:
+        graph.cancel()
+        yield "sources", _slim(cached["hits"])
+        yield "token", cached["answer"]
+        yield "done", dict(answer=cached["answer"], citations=cached["citations"], cached=True,
+                           similar_query=cached["query"], seconds=round(time.perf_counter() - t0, 3))
+        return
+
+    try:
+        result = await graph
+    except BaseException:
+        graph.cancel()  # client gone: don't leave the pipeline running detached from the request
+        raise
+    hits = result.get("hits", []) or []
+    if body.get("rerank", True):
+        hits = await asyncio.to_thread(maybe_rerank, query, hits, top_k=k)
+    yield "sources", _slim(hits)
+
+    t_llm = time.perf_counter()
+    max_tokens = p["max_tokens"]
+    out = await llm.achat(build_messages(query, hits, mode, llm, max_tokens), stream=True,
+                          temperature=p["temperature"], max_tokens=max_tokens)
+    answer = ""
+    if isinstance(out, str):
+        answer = out
+        trace.observe("llm.total", time.perf_counter() - t_llm, t_llm)
+        yield "token", out
+    else:
+        async for delta in trace.atimed_stream(out, t0=t_llm):
+            answer += delta
+            yield "token", delta
+    citations = [{"id": i} for i, _ in enumerate(hits, start=1) if f"[#{i}]" in answer]
+    if cache is not None and qvec is not None:
+        await asyncio.to_thread(cache.put, qvec, label, mode, query, hits, answer, citations)
+    yield "done", dict(answer=answer, citations=citations, cached=False, timings=result.get("timings", {}),
+                       seconds=round(time.perf_counter() - t0, 3))
+
+
+def _sse(event: str, data) -> str:
+    return f"event: {event}\ndata: {json.dumps(data)}\n\n"
+
+
+def _busy():
+    return JSONResponse({"error": "server busy"}, status_code=503, headers={"Retry-After": "1"})
+
+
+class _ReservedStream(StreamingResponse):
+    """Releases the request's reservation however the response ends. A client that disconnects before the
+    body iterator starts never runs the generator (or its finally), and Starlette skips background tasks
+    when the send fails, so this wraps the whole ASGI call instead."""
+    def __init__(self, content, release, **kw):
+        super().__init__(content, **kw)
+        self._release = release
+
+    async def __call__(self, scope, receive, send):
+        try:
+            await super().__call__(scope, receive, send)
+        finally:
+            self._release()
+
+
+async def query(request: Request):
+    try:
+        body = await request.json()
+    except ValueError:
+        return JSONResponse({"error": "body must be JSON"}, status_code=400)
+    if not isinstance(body, dict) or not (body.get("query") or "").strip():
+        return JSONResponse({"error": "missing 'query'"}, status_code=400)
+    try:
+        params = _params(body)
+    except ValueError as e:
+        return JSONResponse({"error": str(e)}, status_code=400)
+    slots: Slots = request.app.state.slots
+    try:
+        release = slots.reserve()
+    except Busy:
+        return _busy()
+
+    if not body.get("stream", True):
+        try:
+            async with slots.acquire(release):
+                sources, out = [], {}
+                async for event, data in answer_events(request.app, body, params):
+                    if event == "sources": sources = data
+                    elif event == "done": out = data
+            return JSONResponse({**out, "sources": sources})
+        except Busy:
+            return _busy()
+        except Exception as e:
+            logger.exception("Query failed")
+            return JSONResponse({"error": str(e)}, status_code=500)
+        finally:
+            release()
+
+    async def stream():
+        # the slot is taken inside the stream so a client that goes away early can't hold on to it
+        try:
+            async with slots.acquire(release):
+                async for event, data in answer_events(request.app, body, params):
+                    yield _sse(event, data)
+        except Busy:
+            yield _sse("error", {"error": "server busy"})
+        except Exception as e:
+            logger.exception("Query failed")
+            yield _sse("error", {"error": str(e)})
+    return _ReservedStream(stream(), release, media_type="text/event-stream",
+                           headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"})
+
+
+async def metrics(request: Request):
+    return PlainTextResponse(trace.prometheus(), media_type="text/plain; version=0.0.4")
+
+
+async def healthz(request: Request):
+    return JSONResponse({"status": "ok"})
+
+
+async def readyz(request: Request):
+    s = request.app.state
+    body = {"ready": s.ready, "running": s.slots.running, "waiting": s.slots.waiting}
+    return JSONResponse(body, status_code=200 if s.ready else 503)
+
+
+def _warm(app):
+    get_index_and_db()
+    warm_up_reranker(background=False)
+    app.state.answer_cache = AnswerCache() if ANSWER_CACHE else None
+    app.state.ready = True
+    logger.info("Query server ready")
+
+
+@asynccontextmanager
+async def lifespan(app):
+    app.state.ready, app.state.answer_cache = False, None
+    app.state.slots = Slots(SERVER_CONCURRENCY, SERVER_QUEUE, SERVER_QUEUE_TIMEOUT)
+    warm = asyncio.create_task(asyncio.to_thread(_warm, app))  # /healthz answers while models load
+    yield
+    await asyncio.gather(warm, return_exceptions=True)
+
+
+app = Starlette(routes=[Route("/query", query, methods=["POST"]), Route("/healthz", healthz),
+                        Route("/readyz", readyz), Route("/metrics", metrics)], lifespan=lifespan)
+
+
+def main(argv=None):
+    import uvicorn
+    p = argparse.ArgumentParser(description="OpenScout headless query server")
+    p.add_argument("--host", default=SERVER_HOST)
+    p.add_argument("--port", type=int, default=SERVER_PORT)
+    p.add_argument("--workers", type=int, default=SERVER_WORKERS, help="worker processes, each with its own warm resources")
+    args = p.parse_args(argv)
+    uvicorn.run("core.server:app", host=args.host, port=args.port, workers=args.workers, log_level="info")
+
+
+if __name__ == "__main__":
+    main()
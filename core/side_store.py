@@ -0,0 +1,110 @@
+"""Read-only columnar copy of the chunk table, memory-mapped and indexed directly by FAISS id.
+
+SQLite stays the source of truth; `build_side_store` snapshots it into a new generation directory:
+
+    chunks.side/CURRENT          name of the live generation (replaced atomically)
+    chunks.side/<gen>/text.bin   all chunk texts, utf-8, back to back
+    chunks.side/<gen>/*.npy      per-id columns: text offsets, ord, url/title/domain codes, presence
+    chunks.side/<gen>/dicts.json url/title/domain dictionaries
+
+Looking up k ids is then array indexing plus k slices of the text blob, with no SQL, and the pages are
+shared by every process through the OS page cache. Ids added after the snapshot fall back to SQLite.
+"""
+import json, mmap, os, shutil, threading, time
+import numpy as np
+
+_COLUMNS = ("offsets", "present", "ord", "url", "title", "domain")
+
+
+def build_side_store(conn, root: str = "chunks.side") -> dict:
+    """Snapshot the chunks table into a new generation under `root` and publish it."""
+    os.makedirs(root, exist_ok=True)
+    gen = f"g{time.time_ns()}"
+    d = os.path.join(root, gen)
+    os.makedirs(d)
+    top = conn.execute("SELECT MAX(id), COUNT(*) FROM chunks").fetchone()
+    n = (top[0] + 1) if top and top[0] is not None else 0
+    offsets = np.zeros(n + 1, dtype=np.int64)
+    present = np.zeros(n, dtype=np.uint8)
+    ords = np.zeros(n, dtype=np.int32)
+    codes = {c: np.full(n, -1, dtype=np.int32) for c in ("url", "title", "domain")}
+    dicts = {c: {} for c in codes}
+    pos, last = 0, -1
+    with open(os.path.join(d, "text.bin"), "wb") as blob:
+        for id_, url, title, ord_, text, dom in conn.execute(
+                "SELECT id,url,title,ord,text,domain FROM chunks ORDER BY id"):
+            offsets[last + 1:id_ + 1] = pos  # ids with no row get an empty span
+            data = (text or "").encode("utf-8")
+            blob.write(data)
+            pos += len(data)
+            present[id_], ords[id_] = 1, ord_ or 0
+            for c, v in (("url", url), ("title", title), ("domain", dom)):
+                codes[c][id_] = dicts[c].setdefault(v or "", len(dicts[c]))
+            last = id_
+        offsets[last + 1:] = pos
+        blob.flush(); os.fsync(blob.fileno())
+    np.save(os.path.join(d, "offsets.npy"), offsets)
+    np.save(os.path.join(d, "present.npy"), present)
+    np.save(os.path.join(d, "ord.npy"), ords)
+    for c, arr in codes.items(): np.save(os.path.join(d, f"{c}.npy"), arr)
+    with open(os.path.join(d, "dicts.json"), "w", encoding="utf-8") as f:
+        json.dump({c: list(v) for c, v in dicts.items()}, f)
+    tmp = os.path.join(root, f"CURRENT.tmp{os.getpid()}")
+    with open(tmp, "w") as f:
+        f.write(gen); f.flush(); os.fsync(f.fileno())
+    os.replace(tmp, os.path.join(root, "CURRENT"))
+    # older generations may still be mapped by running readers; leave only the previous one for them
+    for old in sorted(g for g in os.listdir(root) if g.startswith("g") and g != gen)[:-1]:
+        shutil.rmtree(os.path.join(root, old), ignore_errors=True)
+    return dict(generation=gen, ids=n, rows=int(present.sum()), text_bytes=int(pos))
+
+
+class SideStore:
+    """Memory-mapped reader over the live generation; reopens when a new one is published."""
+    def __init__(self, root: str = "chunks.side"):
+        self.root = root
+        self._lock = threading.Lock()
+        self._gen, self._cur_stat = None, None
+        self._cols, self._text, self._dicts = {}, None, {}
+
+    @staticmethod
+    def exists(root: str = "chunks.side") -> bool:
+        return os.path.exists(os.path.join(root, "CURRENT"))
+
+    def _open(self):
+        cur = os.path.join(self.root, "CURRENT")
+        st = os.stat(cur)
+        stat = (st.st_ino, st.st_mtime_ns)
+        if stat == self._cur_stat: return
+        with self._lock:
+            if stat == self._cur_stat: return
+            with open(cur) as f: gen = f.read().strip()
+            d = os.path.join(self.root, gen)
+            # plain ndarray views over the mappings: np.memmap indexing adds per-call overhead
+            cols = {c: np.asarray(np.load(os.path.join(d, f"{c}.npy"), mmap_mode="r")) for c in _COLUMNS}
+            with open(os.path.join(d, "text.bin"), "rb") as f:
+                size = os.fstat(f.fileno()).st_size
+                text = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) if size else b""
+            with open(os.path.join(d, "dicts.json"), encoding="utf-8") as f: dicts = json.load(f)
+            self._cols, self._text, self._dicts, self._gen, self._cur_stat = cols, text, dicts, gen, stat
+
+    def __len__(self):
+        self._open()
+        return len(self._cols["present"])
+
+    def fetch(self, ids):
+        """Rows for `ids` in the same shape as fetch_by_ids; returns (rows_by_id, ids not covered)."""
+        self._open()
+        c, n = self._cols, len(self._cols["present"])
+        arr = np.asarray(ids, dtype=np.int64)
+        inside = (arr >= 0) & (arr < n)
+        found = inside.copy()
+        found[inside] = c["present"][arr[inside]] == 1
+        sel = arr[found]
+        starts, ends = c["offsets"][sel].tolist(), c["offsets"][sel + 1].tolist()
+        urls, titles, doms, ords = (c[k][sel].tolist() for k in ("url", "title", "domain", "ord"))
+        U, T, D, text = self._dicts["url"], self._dicts["title"], self._dicts["domain"], self._text
+        got = {i: dict(id=i, url=U[urls[j]], title=T[titles[j]], ord=ords[j],
+                       text=text[starts[j]:ends[j]].decode("utf-8"), domain=D[doms[j]])
+               for j, i in enumerate(sel.tolist())}
+        return got, arr[~found].tolist()
@@ -1,20 +1,117 @@
+import math, re
 from typing import List, Dict, Tuple
 from .synth_prompt import SYSTEM_PROMPT
+from .constants import CONTEXT_TOKENS
+from . import trace
 
-def _ctx(hits: List[Dict]) -> str:
-    parts = []
-    for i,h in enumerate(hits, start=1):
-        parts.append(f"[#{i}] {h.get('title','')}\nURL: {h.get('url','')}\n{(h.get('text','')[:1500])}")
-    return "\n\n".join(parts)
+# Context windows (tokens) by model-name prefix; unknown models get the conservative default.
+CONTEXT_WINDOWS = {"gpt-4o": 128000, "gpt-4.1": 1000000, "gpt-4-turbo": 128000, "gpt-3.5": 16385,
+                   "claude-": 200000, "gemini-1.5": 1000000, "gemini-2": 1000000,
+                   "llama-3": 131072, "mixtral": 32768}
+DEFAULT_WINDOW = 8192
+_PROMPT_OVERHEAD = 600  # system prompt + question + per-request framing, rounded up
 
-def _messages(question: str, hits: List[Dict], mode: str, word_budget: int = 180):
+_WS = re.compile(r"\s+")
+_encs: Dict[str, object] = {}
+
+def _model_name(llm) -> str:
+    m = getattr(llm, "model", "") if llm is not None else ""
+    # Gemini's adapter keeps a GenerativeModel; its name looks like "models/gemini-1.5-pro"
+    return (m if isinstance(m, str) else getattr(m, "model_name", "")).rsplit("/", 1)[-1]
+
+def _tokenizer(model: str):
+    """tiktoken's encoding for OpenAI models; cl100k for the rest, which is close enough for budgeting."""
+    if model not in _encs:
+        try:
+            import tiktoken
+            _encs[model] = tiktoken.encoding_for_model(model)
+        except Exception:
+            from .chunk import _encoding
+            _encs[model] = _encoding()
+    return _encs[model]
+
+def context_budget(llm=None, max_tokens: int = 512) -> int:
+    model = _model_name(llm)
+    window = next((w for p, w in CONTEXT_WINDOWS.items() if model.startswith(p)), DEFAULT_WINDOW)
+    return max(256, min(CONTEXT_TOKENS, window - max_tokens - _PROMPT_OVERHEAD))
+
+def _weights(hits: List[Dict]) -> List[float]:
+    """Budget shares: a softmax over the z-scored rerank (or retrieval) scores, half-mixed with an even
+    split so a weak hit still gets room for a sentence or two."""
+    s = [float(h.get("rerank_score", h.get("score", 0.0)) or 0.0) for h in hits]
+    mu = sum(s) / len(s); sd = math.sqrt(sum((x - mu) ** 2 for x in s) / len(s)) or 1.0
+    e = [math.exp((x - mu) / sd) for x in s]
+    return [0.5 * x / sum(e) + 0.5 / len(s) for x in e]
+
+def pack_context(hits: List[Dict], budget: int, enc=None) -> Tuple[str, int]:
+    """Source passages for the prompt within `budget` tokens, returned with the tokens used.
+
+    Each hit gets a share of the budget by score and keeps whole sentences from its start. Sentences that a
+    higher-ranked hit already contributed (the overlap between neighbouring chunks) are skipped. Budget
+    left over by short hits goes to the others in rank order. Hits keep their [#i] number even when an
+    empty one is dropped, so citations still line up with the sources list."""
+    if not hits: return "", 0
+    from .chunk import _iter_sents
+    enc = enc or _tokenizer("")
+    n = lambda t: len(enc.encode_ordinary(t))
+    heads = [f"[#{i}] {h.get('title','')}\nURL: {h.get('url','')}\n" for i, h in enumerate(hits, start=1)]
+    sents = [[(s, n(" " + s)) for s in _iter_sents(_WS.sub(" ", h.get("text", "")).strip())] for h in hits]
+    order = sorted(range(len(hits)), key=lambda i: -float(hits[i].get("rerank_score", hits[i].get("score", 0.0)) or 0.0))
+    shares = _weights(hits)
+    seen, body, pos, used = set(), [[] for _ in hits], [0] * len(hits), 0
+
+    def fill(i, room):
+        """Append hit i's next sentences while they fit in `room`; returns the tokens spent."""
+        spent = 0
+        while pos[i] < len(sents[i]):
+            s, t = sents[i][pos[i]]
+            key = s.casefold()
+            if key in seen: pos[i] += 1; continue
+            if t > room - spent:
+                if not body[i] and room - spent > 8:  # a first sentence longer than the share: cut at a token,
+                    # dropping a trailing partial character (a token prefix can end inside a multibyte one)
+                    cut = enc.decode_bytes(enc.encode_ordinary(s)[:room - spent - n(" …")])
+                    body[i].append(cut.decode("utf-8", errors="ignore").rstrip() + " …")
+                    spent = room; pos[i] += 1; seen.add(key)
+                break
+            body[i].append(s); seen.add(key); spent += t; pos[i] += 1
+        return spent
+
+    for i in order:
+        head = n(heads[i])
+        room = int(budget * shares[i]) - head
+        if room > 8: used += head + fill(i, room)
+    for i in order:
+        left = budget - used
+        if left <= 8: break
+        if body[i]: used += fill(i, left)
+        elif pos[i] < len(sents[i]) and left > n(heads[i]) + 8: used += n(heads[i]) + fill(i, left - n(heads[i]))
+    parts = [heads[i] + " ".join(body[i]) for i in range(len(hits)) if body[i]]
+    return "\n\n".join(parts), used
+
+def build_messages(question: str, hits: List[Dict], mode: str, llm=None, max_tokens: int = 512):
+    """Chat messages for the answer: sources packed to the model's budget, answer length scaled to max_tokens."""
+    ctx, used = pack_context(hits, context_budget(llm, max_tokens), _tokenizer(_model_name(llm)))
+    trace.count("context.tokens", used)
+    word_budget = max(60, int(max_tokens * 0.35))
+    # most-stable first (system prompt, then settings, then question and passages) for provider prefix caches
     return [
         {"role":"system","content": SYSTEM_PROMPT},
-        {"role":"user","content": f"question: {question}\nanswer_mode: {mode}\nword_budget: {word_budget}\ntop_passages:\n{_ctx(hits)}"}
+        {"role":"user","content": f"answer_mode: {mode}\nword_budget: {word_budget}\nquestion: {question}\ntop_passages:\n{ctx}"}
     ]
 
 def synthesize_with_llm(llm, question: str, hits: List[Dict], mode: str="concise",
                         temperature: float=0.2, max_tokens: int=512) -> Tuple[str, List[Dict]]:
-    out = llm.chat(_messages(question, hits, mode), stream=False, temperature=temperature, max_tokens=max_tokens)
+    messages = build_messages(question, hits, mode, llm, max_tokens)
+    with trace.span("llm.total"):
+        out = llm.chat(messages, stream=False, temperature=temperature, max_tokens=max_tokens)
+    used = [{"id": i} for i,_ in enumerate(hits, start=1) if f"[#{i}]" in out]
+    return out, used
+
+async def asynthesize_with_llm(llm, question: str, hits: List[Dict], mode: str="concise",
+                               temperature: float=0.2, max_tokens: int=512) -> Tuple[str, List[Dict]]:
+    messages = build_messages(question, hits, mode, llm, max_tokens)
+    with trace.span("llm.total"):
+        out = await llm.achat(messages, stream=False, temperature=temperature, max_tokens=max_tokens)
     used = [{"id": i} for i,_ in enumerate(hits, start=1) if f"[#{i}]" in out]
     return out, used
@@ -0,0 +1,206 @@
+"""Per-request tracing and process-wide metrics for the query pipeline.
+
+    with trace.request("query", llm=label) as t:   # one per user query (UI, server, benchmarks)
+        with trace.span("rerank"): ...              # wall time of a stage
+        trace.count("fetch.bytes", n)               # a counter: bytes, pages, tokens, cache hits...
+
+Spans and counters land on the request's Trace (found through a ContextVar, so asyncio tasks and
+asyncio.to_thread inherit it; use `bind` / `wrap` to carry it into other loops and thread pools) and in
+process-wide totals. When a request ends its trace is written as one JSON line (OPENSCOUT_TRACE_LOG, or the
+log), and the totals are available in Prometheus text format from `prometheus()` (served at /metrics by
+core.server and written to OPENSCOUT_METRICS_FILE after every request). OPENSCOUT_PROFILE=cprofile or
+pyinstrument also profiles each request into OPENSCOUT_PROFILE_DIR.
+"""
+import contextvars, json, os, threading, time, uuid
+from contextlib import contextmanager
+from loguru import logger
+from .constants import TRACE, TRACE_LOG, METRICS_FILE, PROFILE, PROFILE_DIR
+
+_current: contextvars.ContextVar = contextvars.ContextVar("openscout_trace", default=None)
+_lock = threading.Lock()
+_counters: dict = {}  # name -> total
+_spans: dict = {}  # name -> [bucket counts..., +Inf count, sum]
+_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30)
+_profiling = threading.Lock()  # cProfile can't run twice at once
+
+
+class Trace:
+    def __init__(self, name: str, **fields):
+        self.id, self.name, self.fields = uuid.uuid4().hex[:12], name, fields
+        self.t0 = time.perf_counter()
+        self.spans: list = []  # [name, start, seconds] relative to t0
+        self.counters: dict = {}
+        self._lock = threading.Lock()
+
+    def to_dict(self) -> dict:
+        with self._lock:
+            return dict(trace_id=self.id, name=self.name, **self.fields,
+                        seconds=round(time.perf_counter() - self.t0, 4),
+                        spans=[[n, round(s, 4), round(d, 4)] for n, s, d in self.spans], counters=dict(self.counters))
+
+
+def current() -> Trace | None:
+    return _current.get()
+
+
+def count(name: str, n: float = 1):
+    with _lock: _counters[name] = _counters.get(name, 0) + n
+    t = _current.get()
+    if t is not None:
+        with t._lock: t.counters[name] = t.counters.get(name, 0) + n
+
+
+def observe(name: str, seconds: float, start: float | None = None):
+    with _lock:
+        h = _spans.setdefault(name, [0] * (len(_BUCKETS) + 2))
+        for i, b in enumerate(_BUCKETS):
+            if seconds <= b: h[i] += 1
+        h[-2] += 1; h[-1] += seconds
+    t = _current.get()
+    if t is not None:
+        if start is None: start = time.perf_counter() - seconds
+        with t._lock: t.spans.append([name, start - t.t0, seconds])
+
+
+@contextmanager
+def span(name: str):
+    t0 = time.perf_counter()
+    try:
+        yield
+    finally:
+        observe(name, time.perf_counter() - t0, t0)
+
+
+def timed_stream(it, name: str = "llm", t0: float | None = None):
+    """Pass a sync stream of text deltas through, recording `{name}.ttft` and `{name}.total` from `t0`
+    (a perf_counter() taken before the request was sent; default: now)."""
+    t0, first = t0 or time.perf_counter(), True
+    try:
+        for x in it:
+            if first: observe(f"{name}.ttft", time.perf_counter() - t0, t0); first = False
+            yield x
+    finally:
+        observe(f"{name}.total", time.perf_counter() - t0, t0)
+
+
+async def atimed_stream(it, name: str = "llm", t0: float | None = None):
+    t0, first = t0 or time.perf_counter(), True
+    try:
+        async for x in it:
+            if first: observe(f"{name}.ttft", time.perf_counter() - t0, t0); first = False
+            yield x
+    finally:
+        observe(f"{name}.total", time.perf_counter() - t0, t0)
+
+
+def wrap(fn):
+    """`fn` bound to the caller's trace, for thread pools that don't copy context (ThreadPoolExecutor.submit)."""
+    ctx = contextvars.copy_context()
+    return lambda *a, **kw: ctx.run(fn, *a, **kw)
+
+
+async def bind(coro, t: Trace | None = None):
+    """Await `coro` under trace `t` (default: the caller's), e.g. on another thread's event loop."""
+    _current.set(t if t is not None else _current.get())
+    return await coro
+
+
+def _profiler():
+    if PROFILE == "pyinstrument":
+        try:
+            from pyinstrument import Profiler
+            return Profiler(async_mode="enabled")
+        except ImportError:
+            logger.warning("OPENSCOUT_PROFILE=pyinstrument but pyinstrument is not installed")
+            return None
+    if PROFILE == "cprofile" and _profiling.acquire(blocking=False):
+        import cProfile
+        return cProfile.Profile()
+    return None
+
+
+def _save_profile(prof, t: Trace):
+    os.makedirs(PROFILE_DIR, exist_ok=True)
+    if PROFILE == "pyinstrument":
+        path = os.path.join(PROFILE_DIR, f"{t.id}.html")
+        with open(path, "w", encoding="utf-8") as f: f.write(prof.output_html())
+    else:
+        path = os.path.join(PROFILE_DIR, f"{t.id}.prof")
+        prof.dump_stats(path)
+        _profiling.release()
+    t.fields["profile"] = path
+
+
+@contextmanager
+def request(name: str = "query", **fields):
+    """Trace one request. Nested calls reuse the outer trace."""
+    if not TRACE or _current.get() is not None:
+        yield _current.get()
+        return
+    t = Trace(name, **fields)
+    token = _current.set(t)
+    prof = _profiler()
+    if prof is not None: prof.start() if PROFILE == "pyinstrument" else prof.enable()
+    try:
+        yield t
+    except BaseException as e:
+        t.fields["error"] = repr(e)
+        raise
+    finally:
+        if prof is not None:
+            prof.stop() if PROFILE == "pyinstrument" else prof.disable()
+            _save_profile(prof, t)
+        try:
+            _current.reset(token)
+        except ValueError:  # closed from another context (e.g. an abandoned async generator)
+            pass
+        observe(f"request.{name}", time.perf_counter() - t.t0)
+        _emit(t)
+
+
+def _emit(t: Trace):
+    line = json.dumps(t.to_dict(), default=str)
+    try:
+        if TRACE_LOG:
+            with _lock, open(TRACE_LOG, "a", encoding="utf-8") as f: f.write(line + "\n")
+        else:
+            logger.info("trace {}", line)
+        if METRICS_FILE: write_metrics(METRICS_FILE)
+    except OSError:
+        logger.exception("Could not write trace output")
+
+
+def _metric(name: str) -> str:
+    return "openscout_" + "".join(c if c.isalnum() else "_" for c in name)
+
+
+def prometheus() -> str:
+    """Totals since process start in Prometheus text exposition format."""
+    from .clients import metrics as client_metrics
+    with _lock:
+        counters, spans = dict(_counters), {k: list(v) for k, v in _spans.items()}
+    out = []
+    for name in sorted(counters):
+        m = _metric(name) + "_total"
+        out += [f"# TYPE {m} counter", f"{m} {counters[name]:g}"]
+    if spans:
+        out.append("# TYPE openscout_span_seconds histogram")
+    for name in sorted(spans):
+        h = spans[name]
+        out += [f'openscout_span_seconds_bucket{{span="{name}",le="{b:g}"}} {h[i]}' for i, b in enumerate(_BUCKETS)]
+        out += [f'openscout_span_seconds_bucket{{span="{name}",le="+Inf"}} {h[-2]}',
+                f'openscout_span_seconds_sum{{span="{name}"}} {h[-1]:.6f}',
+                f'openscout_span_seconds_count{{span="{name}"}} {h[-2]}']
+    pools = client_metrics()
+    for kind in ("http", "async_http"):
+        for what in ("requests", "connections"):
+            m = f"openscout_{kind}_{what}_total"
+            rows = [f'{m}{{client="{n}"}} {v.get(what, 0)}' for n, v in sorted(pools.get(kind, {}).items())]
+            if rows: out += [f"# TYPE {m} counter", *rows]
+    return "\n".join(out) + "\n"
+
+
+def write_metrics(path: str):
+    tmp = f"{path}.tmp{os.getpid()}"
+    with open(tmp, "w", encoding="utf-8") as f: f.write(prometheus())
+    os.replace(tmp, path)  # node_exporter's textfile collector must never see a partial file
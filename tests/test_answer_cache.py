@@ -0,0 +1,88 @@
+"""core.answer_cache.AnswerCache on temporary SQLite files with small stub query vectors."""
+import time
+import numpy as np
+import pytest
+from core.answer_cache import AnswerCache
+from core.chunk_db import ChunkDB
+
+LABEL, MODE = "OpenAI / gpt-4o-mini", "concise"
+
+
+def vec(*xs):
+    v = np.array(xs + (0.0,) * (4 - len(xs)), dtype=np.float32)
+    return v / np.linalg.norm(v)
+
+
+@pytest.fixture
+def chunks(tmp_path):
+    db = ChunkDB(str(tmp_path / "chunks.sqlite"))
+    with db:
+        db.executemany("INSERT INTO chunks(id,url,title,ord,text,domain,embedding_dim,created_at,text_hash) "
+                       "VALUES(?,?,?,?,?,?,?,'2000-01-01 00:00:00',?)",
+                       [(i, f"https://e.com/{i}", "", 0, f"text {i}", "e.com", 4, str(i)) for i in range(3)])
+    return db
+
+
+@pytest.fixture
+def cache(tmp_path):
+    return AnswerCache(str(tmp_path / "answers.sqlite"), ttl=3600, threshold=0.9, dim=4)
+
+
+HITS = [{"id": 0, "url": "https://e.com/0", "title": "", "text": "text 0", "score": 0.8, "rerank_score": 3.1},
+        {"id": 1, "url": "https://e.com/1", "title": "", "text": "text 1", "score": 0.7}]
+
+
+def put(cache, qvec, label=LABEL, mode=MODE, hits=HITS, answer="Answer [#1]."):
+    cache.put(qvec, label, mode, "what is x", hits, answer, [{"id": 1}])
+
+
+def test_similar_query_hits_and_distant_one_misses(cache, chunks):
+    put(cache, vec(1, 0))
+    hit = cache.lookup(vec(1, 0.2), LABEL, MODE, chunks)  # cosine ~0.98
+    assert hit["answer"] == "Answer [#1]." and hit["query"] == "what is x" and hit["similarity"] > 0.9
+    assert [h["id"] for h in hit["hits"]] == [0, 1] and "rerank_score" not in hit["hits"][0]
+    assert cache.lookup(vec(1, 1), LABEL, MODE, chunks) is None  # cosine ~0.71, below the threshold
+
+
+def test_entries_are_scoped_to_llm_and_mode(cache, chunks):
+    put(cache, vec(1, 0))
+    assert cache.lookup(vec(1, 0), "Groq / Llama 3.1 8B", MODE, chunks) is None
+    assert cache.lookup(vec(1, 0), LABEL, "detailed", chunks) is None
+    assert cache.lookup(vec(1, 0), LABEL, MODE, chunks) is not None
+
+
+def test_reindexed_source_invalidates_the_answer(cache, chunks):
+    put(cache, vec(1, 0))
+    with chunks:  # the cited page comes back with new content after the answer was written
+        chunks.execute("INSERT INTO chunks(id,url,title,ord,text,domain,embedding_dim,created_at,text_hash) "
+                       "VALUES(9,'https://e.com/1','',1,'new','e.com',4,'2999-01-01 00:00:00','new')")
+    assert cache.lookup(vec(1, 0), LABEL, MODE, chunks) is None
+    assert cache._db.execute("SELECT COUNT(*) FROM answers").fetchone()[0] == 0  # stale entry dropped
+
+
+def test_deleted_source_invalidates_the_answer(cache, chunks):
+    put(cache, vec(1, 0))
+    with chunks: chunks.execute("DELETE FROM chunks WHERE id=0")
+    assert cache.lookup(vec(1, 0), LABEL, MODE, chunks) is None
+
+
+def test_expired_entries_miss(tmp_path, chunks):
+    cache = AnswerCache(str(tmp_path / "answers.sqlite"), ttl=0.05, threshold=0.9, dim=4)
+    put(cache, vec(1, 0))
+    time.sleep(0.1)
+    assert cache.lookup(vec(1, 0), LABEL, MODE, chunks) is None
+
+
+@pytest.mark.parametrize("answer,hits", [("", HITS), ("   ", HITS), ("I couldn't find sources.", [])])
+def test_empty_answers_are_not_stored(cache, chunks, answer, hits):
+    put(cache, vec(1, 0), hits=hits, answer=answer)
+    assert cache._db.execute("SELECT COUNT(*) FROM answers").fetchone()[0] == 0
+    assert cache.lookup(vec(1, 0), LABEL, MODE, chunks) is None
+
+
+def test_other_processes_entries_are_picked_up(tmp_path, chunks):
+    a = AnswerCache(str(tmp_path / "answers.sqlite"), threshold=0.9, dim=4)
+    b = AnswerCache(str(tmp_path / "answers.sqlite"), threshold=0.9, dim=4)
+    assert b.lookup(vec(0, 1), LABEL, MODE, chunks) is None
+    put(a, vec(0, 1))
+    assert b.lookup(vec(0, 1), LABEL, MODE, chunks)["answer"] == "Answer [#1]."
@@ -0,0 +1,76 @@
+"""Property tests for core.chunk: chunks stay within their token budget, never split a character, and
+(without overlap) keep all of the text in order."""
+import random
+import pytest
+import tiktoken
+from core import chunk
+
+WORDS = ("the of and to in is that for it as index vector query page fetch cache latency passage "
+         "Xylophone naïve don't 1,234 e.g. (see above) state-of-the-art").split()
+CJK = "東京都は日本の首都であり人口が最も多い都市です検索結果をまとめる"
+# cl100k_base's split pattern
+PAT = (r"""'(?i:[sdmt]|ll|ve|re)|[^\r\n\p{L}\p{N}]?+\p{L}++|\p{N}{1,3}+| ?[^\s\p{L}\p{N}]++[\r\n]*+|\s++$|"""
+       r"""\s*[\r\n]|\s+(?!\S)|\s""")
+
+
+def merge_encoding(seed: int) -> tiktoken.Encoding:
+    """A small BPE where a word and its space-prefixed form are different tokens, and often only the spaced
+    form is in the vocabulary (like cl100k's " the" vs "the"), so a sentence's token count depends on whether
+    a space precedes it. Multibyte characters are frequently split across byte tokens."""
+    rng, ranks = random.Random(seed), {bytes([i]): i for i in range(256)}
+    for w in WORDS + list(CJK):
+        for form in ((" " + w,) if rng.random() < 0.5 else (w, " " + w)):
+            b = form.encode()
+            for j in range(2, len(b) + 1): ranks.setdefault(b[:j], len(ranks))
+    return tiktoken.Encoding(f"test_bpe_{seed}", pat_str=PAT, mergeable_ranks=ranks, special_tokens={})
+
+
+def random_document(rng: random.Random) -> str:
+    out = []
+    for _ in range(rng.randint(1, 30)):
+        r = rng.random()
+        if r < 0.1:
+            out.append(" ".join(rng.choices(WORDS, k=rng.randint(1, 6))).title())
+        elif r < 0.2:  # CJK: no spaces, sentences end in full-width stops
+            out.append("".join("".join(rng.choices(CJK, k=rng.randint(2, 60))) + rng.choice("。！？")
+                               for _ in range(rng.randint(1, 8))))
+        elif r < 0.25:  # giant words
+            out.append(rng.choice(["z" * rng.randint(50, 3000), "".join(rng.choices(CJK, k=rng.randint(50, 800)))])
+                       + " " + " ".join(rng.choices(WORDS, k=rng.randint(5, 300))))
+        else:
+            out.append(" ".join(" ".join(rng.choices(WORDS, k=rng.randint(3, 40))) + rng.choice(".!?")
+                                for _ in range(rng.randint(1, 12))))
+    return "\n".join(out)
+
+
+@pytest.fixture
+def use_encoding(monkeypatch):
+    def use(seed):
+        enc = merge_encoding(seed)
+        monkeypatch.setattr(chunk, "_enc", enc)
+        return enc
+    return use
+
+
+@pytest.mark.parametrize("seed", range(60))
+def test_chunks_fit_budget_and_keep_characters(seed, use_encoding):
+    enc, rng = use_encoding(seed), random.Random(seed)
+    for _ in range(5):
+        target, overlap = rng.choice([8, 16, 50, 200]), rng.choice([0, 10, 50])
+        for c in chunk.iter_chunks(random_document(rng), target, overlap, rng.random() < 0.5):
+            assert len(enc.encode_ordinary(c)) <= target, (target, c[:80])
+            assert "�" not in c
+
+
+@pytest.mark.parametrize("seed", range(30))
+def test_no_overlap_keeps_all_text_in_order(seed, use_encoding):
+    use_encoding(seed)
+    rng = random.Random(1000 + seed)
+    text = random_document(rng)
+    chunks = chunk.chunk_text(text, rng.choice([8, 16, 50, 200]), 0, rng.random() < 0.5)
+    assert "".join("".join(chunks).split()) == "".join(text.split())
+
+
+def test_cjk_sentences_end_at_full_stops():
+    sents = ["東京都は日本の首都です。", "人口が最も多い！", "本当ですか？", "検索結果"]
+    assert list(chunk._iter_sents("".join(sents))) == sents
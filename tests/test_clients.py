@@ -0,0 +1,139 @@
+"""core.clients: pooled clients are reused, SDK clients and drivers are cached per key within a bound, and the
+shared retry policy classifies errors and honours Retry-After."""
+import asyncio, sys, threading, types
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from types import SimpleNamespace
+import pytest
+from core import clients
+
+
+class Failure(Exception):
+    def __init__(self, status=None, retry_after=None):
+        super().__init__(f"status {status}")
+        if status is not None: self.status_code = status
+        self.response = SimpleNamespace(headers={"retry-after": retry_after} if retry_after else {})
+
+
+class APIConnectionError(Exception):
+    pass
+
+
+@pytest.fixture(autouse=True)
+def fresh(monkeypatch):
+    for name in ("_sdk", "_async_sdk", "_drivers"):
+        monkeypatch.setattr(clients, name, type(getattr(clients, name))())
+
+
+@pytest.fixture
+def server():
+    class Handler(BaseHTTPRequestHandler):
+        protocol_version = "HTTP/1.1"  # keep-alive
+        def do_GET(self):
+            self.send_response(200); self.send_header("Content-Length", "2"); self.end_headers(); self.wfile.write(b"ok")
+        def log_message(self, *a): pass
+    srv = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+    threading.Thread(target=srv.serve_forever, daemon=True).start()
+    yield f"http://127.0.0.1:{srv.server_address[1]}/"
+    srv.shutdown()
+
+
+def test_http_client_is_shared_and_reuses_connections(server):
+    c = clients.http_client("test-pool")
+    assert clients.http_client("test-pool") is c and clients.http_client("test-other") is not c
+    for _ in range(5): assert c.get(server).text == "ok"
+    st = clients.metrics()["http"]["test-pool"]
+    assert st["requests"] == 5 and st["connections"] == 1 and st["reused"] == 4
+
+
+def test_async_http_client_is_per_event_loop():
+    async def get(): return clients.async_http_client("test-async"), clients.async_http_client("test-async")
+    a1, a2 = asyncio.run(get())
+    b1, _ = asyncio.run(get())
+    assert a1 is a2 and b1 is not a1
+
+
+def test_sdk_client_is_built_once_per_key():
+    built = []
+    make = lambda: built.append(object()) or built[-1]
+    a = clients.sdk_client("test-sdk", "key-a", make)
+    assert clients.sdk_client("test-sdk", "key-a", make) is a
+    assert clients.sdk_client("test-sdk", "key-b", make) is not a
+    assert clients.sdk_client("test-other", "key-a", make) is not a
+    assert len(built) == 3 and all("key-a" not in str(k) for k in clients._sdk)  # keys kept only as hashes
+
+
+def test_sdk_cache_evicts_least_recently_used(monkeypatch):
+    monkeypatch.setattr(clients, "CLIENT_CACHE_SIZE", 2)
+    a = clients.sdk_client("test-sdk", "a", object)
+    clients.sdk_client("test-sdk", "b", object)
+    clients.sdk_client("test-sdk", "a", object)  # a is now the most recent
+    clients.sdk_client("test-sdk", "c", object)  # evicts b
+    assert len(clients._sdk) == 2 and clients.sdk_client("test-sdk", "a", object) is a
+
+
+def test_evicted_neo4j_drivers_are_closed(monkeypatch):
+    class Driver:
+        closed = 0
+        def close(self): Driver.closed += 1
+    neo4j = types.ModuleType("neo4j")
+    neo4j.GraphDatabase = SimpleNamespace(driver=lambda uri, auth: Driver())
+    monkeypatch.setitem(sys.modules, "neo4j", neo4j)
+    monkeypatch.setattr(clients, "CLIENT_CACHE_SIZE", 2)
+    d0 = clients.neo4j_driver("bolt://h", "u", "p0")
+    assert clients.neo4j_driver("bolt://h", "u", "p0") is d0
+    for i in range(1, 4): clients.neo4j_driver("bolt://h", "u", f"p{i}")
+    assert len(clients._drivers) == 2 and Driver.closed == 2
+
+
+@pytest.mark.parametrize("error,expected", [
+    (Failure(429), True), (Failure(500), True), (Failure(503), True),
+    (Failure(400), False), (Failure(401), False), (Failure(404), False),
+    (APIConnectionError(), True), (TimeoutError(), True), (ValueError(), False)])
+def test_retryable(error, expected):
+    assert clients.retryable(error) is expected
+
+
+def test_status_on_the_response_counts():
+    e = Exception("boom")
+    e.response = SimpleNamespace(status_code=502, headers={})
+    assert clients.retryable(e)
+
+
+def test_backoff_honours_retry_after():
+    assert clients._backoff(Failure(429, retry_after="7"), 0, base=0.5, cap=20) >= 7
+    assert clients._backoff(Failure(429, retry_after="soon"), 0, base=0.5, cap=20) <= 0.5  # unparsable: ignored
+    assert all(clients._backoff(Failure(500), 3, base=0.5, cap=2) <= 2 for _ in range(50))
+
+
+def flaky(errors):
+    calls = []
+    def fn():
+        calls.append(1)
+        if errors: raise errors.pop(0)
+        return "done"
+    return fn, calls
+
+
+def test_with_retries(monkeypatch):
+    slept = []
+    monkeypatch.setattr(clients.time, "sleep", slept.append)
+    fn, calls = flaky([Failure(429, retry_after="2"), Failure(503)])
+    assert clients.with_retries(fn, retries=3) == "done" and len(calls) == 3
+    assert slept[0] >= 2 and len(slept) == 2
+    fn, calls = flaky([Failure(400)])
+    with pytest.raises(Failure): clients.with_retries(fn, retries=3)
+    assert len(calls) == 1
+    fn, calls = flaky([Failure(500)] * 5)
+    with pytest.raises(Failure): clients.with_retries(fn, retries=2)
+    assert len(calls) == 3
+
+
+def test_awith_retries(monkeypatch):
+    slept = []
+    async def sleep(s): slept.append(s)
+    monkeypatch.setattr(clients.asyncio, "sleep", sleep)
+    errors = [Failure(429, retry_after="1")]
+    async def fn():
+        if errors: raise errors.pop(0)
+        return "done"
+    assert asyncio.run(clients.awith_retries(fn)) == "done" and slept[0] >= 1
@@ -0,0 +1,115 @@
+"""core.embed with stub embedding calls: batching, ordering and retries in embed_batched, and the query-vector
+cache of embed_one_openai."""
+import random, threading, time
+from concurrent.futures import ThreadPoolExecutor
+import numpy as np
+import pytest
+import tiktoken
+from core import clients, embed
+
+# one token per UTF-8 byte, so token counts are easy to reason about (and cl100k isn't downloaded)
+BYTES = tiktoken.Encoding("bytes", pat_str=r"\S+|\s+", mergeable_ranks={bytes([i]): i for i in range(256)},
+                          special_tokens={})
+
+
+class APIError(Exception):
+    def __init__(self, status_code):
+        super().__init__(f"HTTP {status_code}")
+        self.status_code = status_code
+
+
+@pytest.fixture
+def batched(monkeypatch):
+    """embed_batched with the byte tokenizer and no backoff sleeps; returns a stub embed_fn factory."""
+    monkeypatch.setattr(embed, "_enc", BYTES)
+    monkeypatch.setattr(clients, "_backoff", lambda e, attempt, base, cap: 0)
+    def stub(fail=()):
+        lock, fails = threading.Lock(), list(fail)
+        def embed_fn(batch):
+            with lock:
+                embed_fn.calls.append(list(batch))
+                status = fails.pop(0) if fails else None
+            time.sleep(random.uniform(0, 0.02))  # let concurrent batches finish out of order
+            if status: raise APIError(status)
+            return [[float(t.split()[0]), float(len(t))] for t in batch]
+        embed_fn.calls = []
+        return embed_fn
+    return stub
+
+
+def test_batches_respect_token_and_item_limits():
+    assert embed._batches([3, 3, 3, 3], max_tokens=7, max_items=10) == [[0, 1], [2, 3]]
+    assert embed._batches([1, 1, 1, 1], max_tokens=100, max_items=3) == [[0, 1, 2], [3]]
+    assert embed._batches([2, 50, 2], max_tokens=10, max_items=10) == [[0], [1], [2]]  # oversized input alone
+    assert embed._batches([], max_tokens=10, max_items=10) == []
+
+
+def test_rows_follow_input_order_across_concurrent_batches(batched):
+    fn = batched()
+    texts = [f"{i} " + "x" * (i % 7) for i in range(40)]
+    X = embed.embed_batched(texts, fn, max_tokens=20, max_items=3, concurrency=8)
+    assert X[:, 0].tolist() == list(range(40))
+    assert len(fn.calls) > 10
+    assert all(len(b) <= 3 and sum(len(t) for t in b) <= 20 for b in fn.calls)  # ASCII: one token per char
+
+
+def test_long_inputs_are_truncated(batched, monkeypatch):
+    monkeypatch.setattr(embed, "EMBED_MAX_INPUT_TOKENS", 8)
+    fn = batched()
+    X = embed.embed_batched(["1 " + "y" * 100, "2 z"], fn)
+    assert fn.calls == [["1 yyyyyy", "2 z"]] and X[:, 1].tolist() == [8.0, 3.0]
+
+
+@pytest.mark.parametrize("status", [429, 500, 503])
+def test_rate_limits_and_server_errors_are_retried(batched, status):
+    fn = batched(fail=[status])
+    X = embed.embed_batched(["1 a", "2 b"], fn, max_items=1, concurrency=1)
+    assert len(fn.calls) == 3 and fn.calls[0] == fn.calls[1] == ["1 a"]
+    assert X[:, 0].tolist() == [1.0, 2.0]
+
+
+def test_client_errors_are_not_retried(batched):
+    fn = batched(fail=[400])
+    with pytest.raises(APIError):
+        embed.embed_batched(["1 a", "2 b"], fn, max_items=1, concurrency=1)
+    assert fn.calls == [["1 a"]]
+
+
+def test_retries_give_up(batched, monkeypatch):
+    monkeypatch.setattr(embed, "EMBED_MAX_RETRIES", 2)
+    fn = batched(fail=[429] * 5)
+    with pytest.raises(APIError):
+        embed.embed_batched(["1 a"], fn)
+    assert len(fn.calls) == 3
+
+
+@pytest.fixture
+def calls(monkeypatch):
+    seen, lock = [], threading.Lock()
+    def stub(texts, api_key=None, model="text-embedding-3-small"):
+        with lock: seen.extend(texts)
+        time.sleep(0.1)
+        return np.ones((len(texts), 4), dtype=np.float32) / 2
+    monkeypatch.setattr(embed, "embed_texts_openai", stub)
+    embed._query_cache.clear(); embed._query_inflight.clear()
+    yield seen
+    embed._query_cache.clear(); embed._query_inflight.clear()
+
+
+def test_query_is_embedded_as_typed(calls):
+    embed.embed_one_openai("  What is  FAISS? ")
+    assert calls == ["  What is  FAISS? "]
+
+
+def test_spacing_shares_a_vector_case_does_not(calls):
+    embed.embed_one_openai("what is faiss")
+    embed.embed_one_openai("  what   is faiss ")
+    embed.embed_one_openai("What is FAISS")
+    assert calls == ["what is faiss", "What is FAISS"]
+
+
+def test_concurrent_identical_queries_embed_once(calls):
+    with ThreadPoolExecutor(max_workers=8) as pool:
+        vecs = list(pool.map(lambda _: embed.embed_one_openai("same query"), range(8)))
+    assert calls == ["same query"]
+    assert all(v is vecs[0] for v in vecs)
@@ -0,0 +1,144 @@
+"""core.faiss_store.VectorIndex on a temporary directory: write-ahead segment replay, torn tails, compaction
+(including a crash half-way through and concurrent writers) and _reconcile."""
+import os, threading
+import numpy as np
+import pytest
+from core import faiss_store
+from core.chunk_db import ChunkDB
+from core.faiss_store import VectorIndex, build_index, write_index_atomic, read_wal, _reconcile
+
+D = 8
+
+
+@pytest.fixture
+def path(tmp_path):
+    p = str(tmp_path / "faiss_index.bin")
+    write_index_atomic(build_index("flat", d=D), p)
+    return p
+
+
+def vecs(ids):
+    rng = np.random.default_rng(int(ids[0]) if len(ids) else 0)
+    return rng.standard_normal((len(ids), D)).astype(np.float32)
+
+
+def add(vi, start, n):
+    ids = np.arange(start, start + n, dtype=np.int64)
+    vi.add_with_ids(vecs(ids), ids)
+    return ids
+
+
+def open_(path):
+    return VectorIndex.open(path, target_kind="flat", mmap=False)
+
+
+def test_segment_is_replayed_on_open(path):
+    vi = open_(path)
+    add(vi, 0, 5); add(vi, 5, 3)
+    assert vi.index.ntotal == 0 and vi.wal_vectors == 8
+    again = open_(path)
+    assert sorted(again.ids()) == list(range(8))
+    _, I = again.search(vecs(np.arange(0, 5))[2:3], 1)
+    assert I[0][0] == 2
+
+
+def test_torn_tail_is_truncated(path):
+    vi = open_(path)
+    add(vi, 0, 4)
+    good = os.path.getsize(vi.wal_path)
+    add(vi, 4, 4)
+    with open(vi.wal_path, "r+b") as f: f.truncate(os.path.getsize(vi.wal_path) - 5)  # writer died mid-record
+    again = open_(path)
+    assert sorted(again.ids()) == [0, 1, 2, 3]
+    assert os.path.getsize(vi.wal_path) == good
+    add(again, 10, 2)  # appends after the truncation point are readable
+    assert sorted(open_(path).ids()) == [0, 1, 2, 3, 10, 11]
+
+
+def test_compact_folds_segment_into_base(path):
+    vi = open_(path)
+    add(vi, 0, 6)
+    assert vi.compact()
+    assert vi.index.ntotal == 6 and vi.wal_vectors == 0
+    assert read_wal(vi.wal_path) == ([], 0)
+    again = open_(path)
+    assert again.index.ntotal == 6 and again.wal_vectors == 0
+
+
+def test_crash_between_publish_and_trim_leaves_no_duplicates(path, monkeypatch):
+    vi = open_(path)
+    add(vi, 0, 6)
+    def crash(data, p): raise OSError("killed")
+    monkeypatch.setattr(faiss_store, "_write_bytes_atomic", crash)
+    with pytest.raises(OSError): vi.compact()
+    monkeypatch.undo()
+    again = open_(path)  # new base holds 0..5 and the untrimmed segment still lists them
+    assert again.index.ntotal == 6 and again.wal_vectors == 0
+    add(again, 6, 2)
+    again.compact()
+    ids = again.ids()
+    assert sorted(ids) == list(range(8)) and len(set(ids.tolist())) == 8
+
+
+def test_compaction_under_concurrent_writers(path):
+    writer, compactor = open_(path), open_(path)  # separate instances, as in two worker processes
+    done = threading.Event()
+    def write():
+        for i in range(60): add(writer, i * 3, 3)
+        done.set()
+    def compact():
+        while not done.is_set(): compactor.compact()
+    threads = [threading.Thread(target=write), threading.Thread(target=compact)]
+    for t in threads: t.start()
+    for t in threads: t.join()
+    compactor.compact()
+    for vi in (open_(path), writer, compactor):
+        ids = vi.ids()
+        assert sorted(ids) == list(range(180)) and len(set(ids.tolist())) == 180
+
+
+def _row(db, id_, created_at="2000-01-01 00:00:00"):
+    with db:
+        db.execute("INSERT INTO chunks(id,url,title,ord,text,domain,embedding_dim,created_at,text_hash) "
+                   "VALUES(?,?,?,?,?,?,?,?,?)", (id_, f"https://e.com/{id_}", "", 0, "t", "e.com", D, created_at, str(id_)))
+
+
+def _rows(db):
+    return [r[0] for r in db.execute("SELECT id FROM chunks ORDER BY id")]
+
+
+def test_reconcile_drops_old_rows_without_vectors(path, tmp_path):
+    vi, db = open_(path), ChunkDB(str(tmp_path / "chunks.sqlite"))
+    add(vi, 0, 2)
+    for i in (0, 1, 2): _row(db, i)
+    _row(db, 3, "2999-01-01 00:00:00")  # committed after the last index write: another writer's, keep it
+    _reconcile(vi, db)
+    assert _rows(db) == [0, 1, 3]
+
+
+def test_reconcile_keeps_rows_when_index_file_is_missing(path, tmp_path):
+    vi, db = open_(path), ChunkDB(str(tmp_path / "chunks.sqlite"))
+    for i in (0, 1): _row(db, i)
+    os.remove(path)
+    _reconcile(vi, db)
+    assert _rows(db) == [0, 1]
+
+
+def test_duplicate_rows_from_schema_migration_lose_their_vectors(path, tmp_path):
+    import sqlite3
+    db_path = str(tmp_path / "chunks.sqlite")
+    old = sqlite3.connect(db_path)  # schema from before text_hash and the unique index
+    old.execute("CREATE TABLE chunks(id INTEGER PRIMARY KEY, url TEXT, title TEXT, ord INT, text TEXT, domain TEXT, "
+                "embedding_dim INT, created_at TEXT)")
+    with old:
+        old.executemany("INSERT INTO chunks VALUES(?,?,?,?,?,?,?,datetime('now'))",
+                        [(i, "https://e.com/a", "", i % 3, f"text {i % 3}", "e.com", D) for i in range(6)])
+    old.close()
+    vi = open_(path)
+    add(vi, 0, 6)
+    vi.compact()
+    db = ChunkDB(db_path)
+    assert _rows(db) == [0, 1, 2]
+    faiss_store._drop_duplicate_vectors(vi, db)
+    assert sorted(vi.ids()) == [0, 1, 2] and sorted(open_(path).ids()) == [0, 1, 2]
+    assert db.execute("SELECT COUNT(*) FROM dropped_ids").fetchone()[0] == 0
@@ -0,0 +1,101 @@
+"""core.fetch._fetch_one against an httpx.MockTransport stand-in: conditional GETs, the byte cap and skipped
+content types. Caches live in a temporary directory and extraction runs in-process."""
+import asyncio
+import httpx
+import pytest
+from diskcache import Cache
+from core import fetch
+
+HTML = "<html><head><title>T</title></head><body><article><p>{}</p></article></body></html>"
+
+
+class Site:
+    """Serves `pages[url]` = (status, headers, body chunks); records request headers and chunks sent."""
+    def __init__(self):
+        self.pages, self.seen, self.sent = {}, [], 0
+
+    def __call__(self, request: httpx.Request):
+        self.seen.append(dict(request.headers))
+        status, headers, chunks = self.pages[str(request.url)]
+        async def body():
+            for c in chunks:
+                self.sent += 1
+                yield c
+        return httpx.Response(status, headers=headers, content=body())
+
+
+class Fetcher:
+    def __init__(self, site):
+        self.client = httpx.AsyncClient(transport=httpx.MockTransport(site))
+        self.slots = asyncio.Semaphore(4)
+
+    def host_slot(self, host):
+        return asyncio.Semaphore(4)
+
+
+@pytest.fixture
+def site(tmp_path, monkeypatch):
+    monkeypatch.setattr(fetch, "_http_cache", Cache(str(tmp_path / "http")))
+    monkeypatch.setattr(fetch, "_extract_cache", Cache(str(tmp_path / "extract")))
+    monkeypatch.setattr(fetch, "_extract_pool", lambda: None)  # default executor: threads
+    extracted = []
+    def extract(url, html):
+        extracted.append(len(html))
+        return {"url": url, "title": "T", "text": html, "domain": "example.com"}
+    monkeypatch.setattr(fetch, "_extract", extract)
+    s = Site()
+    s.extracted = extracted
+    return s
+
+
+def get(site, url):
+    async def run():
+        return await fetch._fetch_one(Fetcher(site), url)
+    return asyncio.run(run())
+
+
+def test_not_modified_returns_cached_page(site):
+    url = "https://example.com/a"
+    validators = {"content-type": "text/html; charset=utf-8", "etag": '"v1"',
+                  "last-modified": "Wed, 01 Jan 2025 00:00:00 GMT"}
+    site.pages[url] = (200, validators, [HTML.format("first").encode()])
+    first = get(site, url)
+    assert "first" in first["text"] and "if-none-match" not in site.seen[0]
+
+    site.pages[url] = (304, {}, [])
+    second = get(site, url)
+    assert site.seen[1]["if-none-match"] == '"v1"'
+    assert site.seen[1]["if-modified-since"] == "Wed, 01 Jan 2025 00:00:00 GMT"
+    assert second == first and site.extracted == [len(HTML.format("first"))]
+
+
+def test_no_store_is_not_kept(site):
+    url = "https://example.com/private"
+    site.pages[url] = (200, {"content-type": "text/html", "etag": '"v1"', "cache-control": "no-store"},
+                       [HTML.format("x").encode()])
+    get(site, url); get(site, url)
+    assert all("if-none-match" not in h for h in site.seen)
+
+
+def test_body_stops_at_byte_cap(site, monkeypatch):
+    monkeypatch.setattr(fetch, "FETCH_MAX_BYTES", 1000)
+    url = "https://example.com/huge"
+    site.pages[url] = (200, {"content-type": "text/html"}, [b"x" * 300] * 100)
+    page = get(site, url)
+    assert site.extracted == [1000] and len(page["text"]) == 1000
+    assert site.sent < 10  # the rest of the body was never read
+
+
+def test_pdf_is_skipped(site):
+    url = "https://example.com/paper.pdf"
+    site.pages[url] = (200, {"content-type": "application/pdf"}, [b"%PDF-1.7"] * 50)
+    page = get(site, url)
+    assert page["text"] == "" and page["error"] == "skipped content-type application/pdf"
+    assert site.extracted == []
+
+
+def test_http_error_becomes_empty_page(site):
+    url = "https://example.com/missing"
+    site.pages[url] = (404, {"content-type": "text/html"}, [b"nope"])
+    page = get(site, url)
+    assert page["text"] == "" and "404" in page["error"]
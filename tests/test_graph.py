@@ -0,0 +1,7 @@
+"""core.graph.State: the fields the UI and server read back from a graph run."""
+from core.graph import State, synthesizer
+
+
+def test_state_keeps_synthesizer():
+    assert "synthesizer" in State.model_fields
+    assert State.synthesizer is synthesizer
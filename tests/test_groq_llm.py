@@ -0,0 +1,119 @@
+"""core.llm.groq_llm.GroqLLM against a local stand-in for the SSE endpoint (httpx.MockTransport): deltas,
+keep-alives, [DONE], usage, error events, the stream-open retry and the no-key fallback."""
+import asyncio, json
+import httpx
+import pytest
+from core import clients, trace
+from core.llm import groq_llm
+from core.llm.groq_llm import GroqLLM
+
+MESSAGES = [{"role": "system", "content": "be brief"}, {"role": "user", "content": "hi"}]
+
+
+def data(obj) -> str:
+    return "data: " + (obj if isinstance(obj, str) else json.dumps(obj))
+
+
+def delta(text):
+    return data({"choices": [{"delta": {"content": text}}]})
+
+
+USAGE = data({"choices": [{"delta": {}}], "x_groq": {"usage": {"prompt_tokens": 40,
+                                                                "prompt_tokens_details": {"cached_tokens": 32}}}})
+STREAM = [": keep-alive", "", delta("Hel"), "", delta("lo"), data({"choices": [{"delta": {"role": "assistant"}}]}),
+          delta(" [#1]."), USAGE, "", data("[DONE]"), ""]
+
+
+class Endpoint:
+    """Answers each POST with the next (status, SSE lines) in `replies`, recording the request bodies."""
+    def __init__(self, *replies):
+        self.replies, self.requests = list(replies), []
+
+    def __call__(self, request: httpx.Request):
+        self.requests.append(json.loads(request.content))
+        status, lines = self.replies.pop(0)
+        return httpx.Response(status, headers={"content-type": "text/event-stream"},
+                              content="\n".join(lines).encode())
+
+
+@pytest.fixture
+def endpoint(monkeypatch):
+    def install(*replies):
+        ep = Endpoint(*replies)
+        monkeypatch.setattr(groq_llm, "http_client", lambda name: httpx.Client(transport=httpx.MockTransport(ep)))
+        monkeypatch.setattr(groq_llm, "async_http_client",
+                            lambda name: httpx.AsyncClient(transport=httpx.MockTransport(ep)))
+        return ep
+    monkeypatch.setattr(clients, "_backoff", lambda e, attempt, base, cap: 0)
+    return install
+
+
+def usage_counted(fn):
+    before = dict(trace._counters)
+    out = fn()
+    return out, {k: trace._counters.get(k, 0) - before.get(k, 0) for k in ("llm.prompt_tokens", "llm.cached_tokens")}
+
+
+def test_event_parsing():
+    assert GroqLLM._event(": keep-alive") == ""
+    assert GroqLLM._event("") == ""
+    assert GroqLLM._event("data: [DONE]") == ""
+    assert GroqLLM._event("event: message") == ""
+    assert GroqLLM._event(delta("x")) == "x"
+    assert GroqLLM._event(data({"choices": []})) == ""
+    with pytest.raises(RuntimeError, match="rate limited"):
+        GroqLLM._event(data({"error": {"message": "rate limited", "type": "tokens"}}))
+
+
+def test_stream_yields_deltas_and_counts_usage(endpoint):
+    ep = endpoint((200, STREAM))
+    llm = GroqLLM("gsk-test", "llama-3.1-8b-instant")
+    out, usage = usage_counted(lambda: list(llm.chat(MESSAGES, stream=True, temperature=0.1, max_tokens=64)))
+    assert out == ["Hel", "lo", " [#1]."]
+    assert usage == {"llm.prompt_tokens": 40, "llm.cached_tokens": 32}
+    body = ep.requests[0]
+    assert body["stream"] is True and body["max_tokens"] == 64 and body["model"] == "llama-3.1-8b-instant"
+
+
+def test_error_event_mid_stream_raises(endpoint):
+    endpoint((200, [delta("partial"), data({"error": {"message": "upstream overloaded"}})]))
+    it = GroqLLM("gsk-test").chat(MESSAGES, stream=True)
+    assert next(it) == "partial"
+    with pytest.raises(RuntimeError, match="upstream overloaded"):
+        next(it)
+
+
+def test_stream_open_is_retried_on_429(endpoint):
+    ep = endpoint((429, ['{"error": {"message": "slow down"}}']), (200, STREAM))
+    assert "".join(GroqLLM("gsk-test").chat(MESSAGES, stream=True)) == "Hello [#1]."
+    assert len(ep.requests) == 2
+
+
+def test_client_error_is_not_retried(endpoint):
+    ep = endpoint((400, ['{"error": {"message": "bad model"}}']), (200, STREAM))
+    with pytest.raises(httpx.HTTPStatusError):
+        GroqLLM("gsk-test").chat(MESSAGES, stream=True)
+    assert len(ep.requests) == 1
+
+
+def test_async_stream(endpoint):
+    endpoint((429, []), (200, STREAM))
+    async def run():
+        out = await GroqLLM("gsk-test").achat(MESSAGES, stream=True)
+        return [d async for d in out]
+    assert asyncio.run(run()) == ["Hel", "lo", " [#1]."]
+
+
+def test_non_stream_reads_message_and_usage(endpoint):
+    reply = json.dumps({"choices": [{"message": {"content": "Hi [#1]."}}], "usage": {"prompt_tokens": 7}})
+    endpoint((200, [reply]))
+    out, usage = usage_counted(lambda: GroqLLM("gsk-test").chat(MESSAGES))
+    assert out == "Hi [#1]." and usage == {"llm.prompt_tokens": 7, "llm.cached_tokens": 0}
+
+
+def test_missing_key_falls_back_without_a_request(endpoint):
+    ep = endpoint()
+    out = GroqLLM("").chat(MESSAGES, stream=True)
+    assert isinstance(out, str) and "No GROQ_API_KEY" in out and "USER: hi" in out
+    assert asyncio.run(GroqLLM("").achat(MESSAGES)) == out
+    assert ep.requests == []
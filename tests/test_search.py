@@ -0,0 +1,72 @@
+"""core.search.cached_search with a stub provider: coalescing, TTL cache, and failures not being cached."""
+import threading, time
+from concurrent.futures import ThreadPoolExecutor
+import pytest
+from core import search
+
+
+@pytest.fixture(autouse=True)
+def empty_cache():
+    search._results.clear(); search._inflight.clear()
+    yield
+    search._results.clear(); search._inflight.clear()
+
+
+class StubProvider:
+    def __init__(self, delay: float = 0.2, fail: bool = False):
+        self.calls, self.delay, self.fail = 0, delay, fail
+        self._lock = threading.Lock()
+
+    def __call__(self, query: str, k: int):
+        with self._lock: self.calls += 1
+        time.sleep(self.delay)
+        if self.fail: raise RuntimeError("provider down")
+        return [{"url": f"https://example.com/{query}/{i}", "title": query} for i in range(k)]
+
+
+def _concurrently(n, fn):
+    barrier = threading.Barrier(n)
+    def run(i):
+        barrier.wait()
+        return fn(i)
+    with ThreadPoolExecutor(max_workers=n) as pool:
+        return [pool.submit(run, i) for i in range(n)]
+
+
+def test_concurrent_identical_queries_reach_backend_once():
+    provider = StubProvider()
+    # spacing and case differ, the normalized query is the same
+    queries = ["what is faiss", "What is FAISS", "  what  is faiss ", "WHAT IS FAISS"]
+    futures = _concurrently(16, lambda i: search.cached_search("stub", queries[i % 4], 3,
+                                                            lambda: provider("what is faiss", 3)))
+    results = [f.result() for f in futures]
+    assert provider.calls == 1
+    assert all(r == results[0] for r in results) and len(results[0]) == 3
+
+
+def test_repeat_within_ttl_is_cached_and_copies_are_independent():
+    provider = StubProvider(delay=0)
+    first = search.cached_search("stub", "q", 2, lambda: provider("q", 2))
+    first[0]["title"] = "changed by caller"
+    again = search.cached_search("stub", "q", 2, lambda: provider("q", 2))
+    assert provider.calls == 1
+    assert again[0]["title"] == "q"
+
+
+def test_different_provider_or_k_is_a_separate_request():
+    provider = StubProvider(delay=0)
+    search.cached_search("stub", "q", 2, lambda: provider("q", 2))
+    search.cached_search("stub", "q", 5, lambda: provider("q", 5))
+    search.cached_search("other", "q", 2, lambda: provider("q", 2))
+    assert provider.calls == 3
+
+
+def test_failures_reach_every_waiter_and_are_not_cached():
+    provider = StubProvider(fail=True)
+    futures = _concurrently(8, lambda i: search.cached_search("stub", "q", 2, lambda: provider("q", 2)))
+    for f in futures:
+        with pytest.raises(RuntimeError, match="provider down"): f.result()
+    assert provider.calls == 1 and not search._inflight
+    provider.fail = False
+    assert len(search.cached_search("stub", "q", 2, lambda: provider("q", 2))) == 2
+    assert provider.calls == 2
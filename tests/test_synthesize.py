@@ -0,0 +1,37 @@
+"""core.synthesize.pack_context with a byte-level tokenizer, where a token prefix usually ends inside a
+multibyte character."""
+import pytest
+import tiktoken
+from core.synthesize import pack_context
+
+BYTES = tiktoken.Encoding("bytes", pat_str=r"\S+|\s+", mergeable_ranks={bytes([i]): i for i in range(256)},
+                          special_tokens={})
+CJK = "向量索引把每个段落映射到高维空间中的一个点然后按内积检索最相近的段落" * 6  # one long sentence
+
+
+def hit(i, text, score=1.0):
+    return {"title": f"T{i}", "url": f"https://e.com/{i}", "text": text, "score": score}
+
+
+def tokens(s):
+    return len(BYTES.encode_ordinary(s))
+
+
+@pytest.mark.parametrize("budget", [60, 77, 100, 151, 240])
+def test_long_first_sentence_is_cut_on_a_character(budget):
+    ctx, used = pack_context([hit(1, CJK), hit(2, "Émigré café naïve résumé. " * 20, 0.5)], budget, BYTES)
+    assert "�" not in ctx and "…" in ctx
+    assert used <= budget and tokens(ctx) <= budget + 4  # the "\n\n" between hits isn't budgeted
+
+
+def test_numbering_survives_dropped_hits():
+    hits = [hit(1, "First source. It says a lot."), hit(2, "", 0.9), hit(3, CJK, 0.8), hit(4, "Fourth one.", 0.1)]
+    ctx, used = pack_context(hits, 400, BYTES)
+    assert "[#1] T1" in ctx and "[#3] T3" in ctx and "[#4] T4" in ctx and "[#2]" not in ctx
+    assert "�" not in ctx and used <= 400
+
+
+def test_repeated_sentences_are_packed_once():
+    shared = "Both pages carry this overlapping sentence."
+    ctx, _ = pack_context([hit(1, f"Intro. {shared}"), hit(2, f"{shared} Outro.", 0.5)], 400, BYTES)
+    assert ctx.count(shared) == 1 and "Outro." in ctx